@@ -0,0 +1,109 @@
+# alert_engine.py
+from utils import chunked, placeholders
+
+LOW_ALERT = "库存过低"
+HIGH_ALERT = "库存过高"
+
+# 根据库存与上下限计算物料应处的预警状态（NULL 表示正常）
+ALERT_STATE_SQL = f"""
+    CASE WHEN I.current_quantity < M.min_quantity THEN '{LOW_ALERT}'
+         WHEN I.current_quantity > M.max_quantity THEN '{HIGH_ALERT}'
+    END
+"""
+
+
+def _transition_query(n):
+    marks = placeholders(n)
+    return f"""
+        SELECT I.material_id, I.current_quantity,
+               {ALERT_STATE_SQL} AS new_state,
+               O.min_type, O.max_type
+        FROM Inventory I
+        JOIN Material M ON I.material_id = M.material_id
+        LEFT JOIN (
+            SELECT material_id, MIN(alert_type) AS min_type, MAX(alert_type) AS max_type
+            FROM Alert
+            WHERE is_resolved = 0 AND material_id IN ({marks})
+            GROUP BY material_id
+        ) O ON O.material_id = I.material_id
+        WHERE I.material_id IN ({marks})
+    """
+
+
+def evaluate_alerts(cursor, material_ids):
+    """在调用方事务中对一组物料做预警状态迁移（不提交）
+
+    一条集合查询同时取出新状态与未处理预警的旧状态，只有状态真正变化时才写 Alert：
+    新出现过低/过高时关闭旧预警并插入新预警，恢复正常时关闭旧预警，状态不变则不写。
+    返回各类迁移的数量。
+    """
+    result = {"newly_low": 0, "newly_high": 0, "back_to_normal": 0, "unchanged": 0}
+    ids = sorted(set(material_ids))
+    if not ids:
+        return result
+
+    to_resolve = []
+    to_insert = []
+    for chunk in chunked(ids):
+        cursor.execute(_transition_query(len(chunk)), chunk + chunk)
+        for material_id, quantity, new_state, min_type, max_type in cursor.fetchall():
+            # 同时存在两种未处理预警时视为旧状态不确定，需要重建
+            old_state = min_type if min_type == max_type else "mixed"
+            if new_state == old_state:
+                result["unchanged"] += 1
+                continue
+            if old_state is not None:
+                to_resolve.append((material_id,))
+            if new_state is None:
+                result["back_to_normal"] += 1
+            else:
+                to_insert.append((material_id, new_state, quantity))
+                result["newly_low" if new_state == LOW_ALERT else "newly_high"] += 1
+
+    if to_resolve:
+        cursor.executemany(
+            "UPDATE Alert SET is_resolved = 1 WHERE material_id = ? AND is_resolved = 0",
+            to_resolve
+        )
+    if to_insert:
+        cursor.executemany(
+            "INSERT INTO Alert (material_id, alert_type, current_quantity) VALUES (?, ?, ?)",
+            to_insert
+        )
+    return result
+
+
+def sweep_alerts(cursor):
+    """在调用方事务中对全部物料重算预警（不提交），全部为集合语句，没有逐物料循环
+
+    先关闭与当前状态不符的未处理预警，再为处于过低/过高且没有未处理预警的物料补建预警。
+    返回 (关闭数量, 新建数量)。
+    """
+    # 用非相关子查询（反半连接）而不是逐行 EXISTS，数据库可一次性构建哈希/临时索引
+    cursor.execute(f"""
+        UPDATE Alert
+        SET is_resolved = 1
+        WHERE is_resolved = 0
+          AND alert_id NOT IN (
+              SELECT A.alert_id
+              FROM Alert A
+              JOIN Inventory I ON I.material_id = A.material_id
+              JOIN Material M ON I.material_id = M.material_id
+              WHERE A.is_resolved = 0
+                AND {ALERT_STATE_SQL} = A.alert_type
+          )
+    """)
+    resolved = cursor.rowcount
+
+    cursor.execute(f"""
+        INSERT INTO Alert (material_id, alert_type, current_quantity)
+        SELECT I.material_id, {ALERT_STATE_SQL}, I.current_quantity
+        FROM Inventory I
+        JOIN Material M ON I.material_id = M.material_id
+        WHERE (I.current_quantity < M.min_quantity OR I.current_quantity > M.max_quantity)
+          AND I.material_id NOT IN (
+              SELECT material_id FROM Alert WHERE is_resolved = 0
+          )
+    """)
+    raised = cursor.rowcount
+    return resolved, raised
@@ -0,0 +1,53 @@
+# alert_sweep.py
+# 全量库存预警巡检：可由计划任务 / cron 调用，也可用 --interval 常驻定时运行
+#   python alert_sweep.py
+#   python alert_sweep.py --interval 300
+import argparse
+import json
+import time
+from datetime import datetime
+
+from db_config import db_connection
+from alert_engine import sweep_alerts
+
+
+def run_sweep():
+    """执行一次全量预警巡检，返回耗时与变更数量"""
+    start = time.perf_counter()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Inventory")
+        materials = cursor.fetchone()[0]
+        sweep_start = time.perf_counter()
+        resolved, raised = sweep_alerts(cursor)
+        commit_start = time.perf_counter()
+    end = time.perf_counter()
+    return {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "materials": materials,
+        "resolved": resolved,
+        "raised": raised,
+        "sweep_seconds": round(commit_start - sweep_start, 4),
+        "commit_seconds": round(end - commit_start, 4),
+        "total_seconds": round(end - start, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全量库存预警巡检")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="循环执行的间隔秒数，0 表示只执行一次")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            print(json.dumps(run_sweep(), ensure_ascii=False), flush=True)
+        except Exception as e:
+            print("预警巡检失败：", e, flush=True)
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
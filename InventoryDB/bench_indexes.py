@@ -0,0 +1,126 @@
+# bench_indexes.py
+# 索引迁移前后的查询耗时对比（SQLite 本地模拟，合成数百万行出入库流水）
+#   python bench_indexes.py --rows 2000000 --output bench_indexes.json
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import datagen
+import migrate
+
+START = datetime(2023, 1, 1)
+MONTHS = 36
+
+
+def build_database(path, rows, materials, seed=42):
+    """用 datagen 建库并写入合成数据（不含索引迁移和月结）"""
+    datagen.generate(path, users=20, materials=materials, movements=rows, months=MONTHS,
+                     start=START, seed=seed, migrate_schema=False, close_months=False)
+    return sqlite3.connect(path)
+
+
+def benchmark_queries(materials):
+    month = "2024-06"
+    start, end = datetime(2024, 6, 1), datetime(2024, 7, 1)
+    day_start, day_end = datetime(2024, 6, 10), datetime(2024, 6, 17)
+    hot, cold = 1, materials // 2
+    return {
+        # 原实现：按格式化字符串过滤，无法使用索引
+        "monthly_format_filter": ("""
+            SELECT material_id, SUM(quantity) FROM InOutRecord
+            WHERE type = '入库' AND strftime('%Y-%m', timestamp) = ?
+            GROUP BY material_id
+        """, (month,)),
+        "monthly_range_filter": ("""
+            SELECT material_id, SUM(quantity) FROM InOutRecord
+            WHERE type = '入库' AND timestamp >= ? AND timestamp < ?
+            GROUP BY material_id
+        """, (start, end)),
+        "material_history_hot": ("""
+            SELECT timestamp, type, quantity FROM InOutRecord
+            WHERE material_id = ? AND timestamp >= ? AND timestamp < ?
+        """, (hot, start, end)),
+        "material_opening_cold": ("""
+            SELECT SUM(CASE WHEN type = '入库' THEN quantity ELSE -quantity END)
+            FROM InOutRecord WHERE material_id = ? AND timestamp < ?
+        """, (cold, start)),
+        "record_filter_page": ("""
+            SELECT record_id, type, quantity, timestamp FROM InOutRecord
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp DESC LIMIT 200
+        """, (day_start, day_end)),
+        "open_alerts_for_materials": ("""
+            SELECT material_id, alert_type FROM Alert
+            WHERE is_resolved = 0 AND material_id IN (?, ?, ?)
+        """, (hot, cold, materials)),
+        "inventory_by_material": ("""
+            SELECT current_quantity FROM Inventory WHERE material_id = ?
+        """, (cold,)),
+        "checks_by_material": ("""
+            SELECT real_quantity, recorded_quantity, check_time FROM InventoryCheck
+            WHERE material_id = ?
+        """, (cold,)),
+    }
+
+
+def time_queries(conn, queries, repeat):
+    results = {}
+    for name, (sql, params) in queries.items():
+        params = tuple(p.strftime("%Y-%m-%d %H:%M:%S") if isinstance(p, datetime) else p for p in params)
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = round(statistics.median(samples), 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="索引迁移前后查询耗时对比")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="出入库流水行数")
+    parser.add_argument("--materials", type=int, default=5000, help="物料数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每条查询重复次数（取中位数）")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+    t0 = time.perf_counter()
+    conn = build_database(path, args.rows, args.materials)
+    build_seconds = time.perf_counter() - t0
+    queries = benchmark_queries(args.materials)
+
+    before = time_queries(conn, queries, args.repeat)
+    t0 = time.perf_counter()
+    migrate.apply_migrations(conn, "sqlite")
+    conn.execute("ANALYZE")
+    migrate_seconds = time.perf_counter() - t0
+    after = time_queries(conn, queries, args.repeat)
+    conn.close()
+    os.remove(path)
+
+    result = {
+        "rows": args.rows,
+        "materials": args.materials,
+        "build_seconds": round(build_seconds, 2),
+        "migrate_seconds": round(migrate_seconds, 2),
+        "queries_ms": {
+            name: {"before": before[name], "after": after[name],
+                   "speedup": round(before[name] / after[name], 1) if after[name] else None}
+            for name in queries
+        },
+    }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# bench_startup.py
+# 启动耗时基准：解释器启动、各模块导入、首次数据库连接、登录框和主界面首次渲染，分冷/热启动多次测量
+#   python bench_startup.py --runs 5 --output startup.json
+#   python bench_startup.py --budget startup_budget.json      超出预算时退出码为 1（仓库中的默认预算）
+# 冷启动：每次运行前删除 __pycache__，包含字节码编译（操作系统文件缓存无法在普通权限下清除）；
+# 热启动：字节码已缓存。没有显示器时自动使用 Xvfb（如已安装），否则跳过渲染阶段。
+# 预算文件为 JSON，键为 "<cold|warm>.<阶段>"，值为毫秒上限，如 {"warm.import_ms": 800, "cold.total_ms": 3000}
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PHASES = ("interpreter_ms", "import_ms", "db_connect_ms", "login_render_ms", "main_render_ms",
+          "first_window_ms", "total_ms")
+# 登录前不应加载的重量级依赖
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "xlsxwriter", "pyarrow", "tkcalendar")
+TOP_IMPORTS = 20
+# 子进程开始测量前写到 stderr 的标记，之前的导入属于基准脚本自身，不计入
+IMPORT_MARKER = "bench-startup: measuring"
+
+
+# ---------- 子进程：在全新解释器中依次测量各阶段 ----------
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _wait_mapped(widget, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not widget.winfo_ismapped() and time.perf_counter() < deadline:
+        widget.update()
+    widget.update_idletasks()
+
+
+def run_child(render):
+    result, errors = {}, {}
+    sys.stderr.write(IMPORT_MARKER + "\n")
+    sys.stderr.flush()
+
+    start = time.perf_counter()
+    try:
+        import login_window
+        result["import_ms"] = _ms(start)
+    except Exception as e:
+        errors["import_ms"] = repr(e)
+        login_window = None
+
+    start = time.perf_counter()
+    try:
+        import db_config
+        conn = db_config.get_connection()
+        if conn is None:
+            raise RuntimeError("数据库连接失败")
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        conn.close()
+        result["db_connect_ms"] = _ms(start)
+    except Exception as e:
+        errors["db_connect_ms"] = repr(e)
+
+    if render and login_window is not None:
+        try:
+            start = time.perf_counter()
+            app = login_window.LoginApp()
+            _wait_mapped(app)
+            result["login_render_ms"] = _ms(start)
+
+            start = time.perf_counter()
+            app._create_main_interface(1, "bench", 2)
+            app.update()
+            result["main_render_ms"] = _ms(start)
+
+            start = time.perf_counter()
+            window = login_window.open_window("inventory_query", app)
+            _wait_mapped(window)
+            result["first_window_ms"] = _ms(start)
+            app.destroy()
+        except Exception as e:
+            errors["render"] = repr(e)
+
+    modules = set(sys.modules)
+    result["heavy_modules_loaded"] = [m for m in HEAVY_MODULES if m in modules]
+    print(json.dumps({"phases": result, "errors": errors}))
+
+
+# ---------- 父进程 ----------
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出（标记行之后的部分），返回 [(模块, 自身微秒, 累计微秒)]"""
+    modules = []
+    lines = stderr.splitlines()
+    if IMPORT_MARKER in lines:
+        lines = lines[lines.index(IMPORT_MARKER) + 1:]
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return modules
+
+
+def clear_bytecode():
+    for root, dirs, _ in os.walk(HERE):
+        if "__pycache__" in dirs:
+            shutil.rmtree(os.path.join(root, "__pycache__"), ignore_errors=True)
+
+
+def prepare_database(path):
+    """建一个本地 SQLite 库并写入一个测试用户，首次连接阶段不含建表时间"""
+    sys.path.insert(0, HERE)
+    import db_config
+    db_config.configure(backend="sqlite", sqlite_path=path)
+    with db_config.db_connection() as conn:
+        conn.cursor().execute(
+            "INSERT INTO Users (username, password, role, permission_level) VALUES (?, ?, ?, ?)",
+            ("bench", "bench", "管理员", 2)
+        )
+    db_config.get_pool().close()
+
+
+class VirtualDisplay:
+    """没有 DISPLAY 时启动 Xvfb，结束时关闭"""
+
+    def __init__(self):
+        self.process = None
+        self.display = os.environ.get("DISPLAY")
+        self.reason = None
+
+    def __enter__(self):
+        if sys.platform.startswith("win") or sys.platform == "darwin" or self.display:
+            return self
+        xvfb = shutil.which("Xvfb")
+        if xvfb is None:
+            self.reason = "没有显示器且未安装 Xvfb，跳过渲染阶段"
+            return self
+        self.display = f":{90 + os.getpid() % 100}"
+        self.process = subprocess.Popen([xvfb, self.display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(0.5)
+        return self
+
+    @property
+    def available(self):
+        return self.display is not None and self.reason is None
+
+    def __exit__(self, *exc):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def run_once(env, render, cold):
+    if cold:
+        clear_bytecode()
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    interpreter_ms = _ms(start)
+
+    command = [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child"]
+    if render:
+        command.append("--render")
+    start = time.perf_counter()
+    proc = subprocess.run(command, env=env, cwd=HERE, capture_output=True, text=True)
+    total_ms = _ms(start)
+    if proc.returncode != 0:
+        raise RuntimeError(f"子进程失败：{proc.stderr.strip().splitlines()[-1:]}")
+
+    child = json.loads(proc.stdout.strip().splitlines()[-1])
+    phases = dict(child["phases"])
+    phases["interpreter_ms"] = interpreter_ms
+    phases["total_ms"] = total_ms
+    return phases, child["errors"], parse_importtime(proc.stderr)
+
+
+def summarize(runs):
+    summary = {}
+    for phase in PHASES:
+        values = [run[phase] for run in runs if phase in run]
+        if values:
+            summary[phase] = {"median": round(statistics.median(values), 2),
+                              "min": min(values), "max": max(values)}
+    return summary
+
+
+def check_budget(summary, budget):
+    """返回超出预算的项目；预算中有但未测到的阶段单独列出"""
+    violations, missing = [], []
+    for key, limit in budget.items():
+        mode, _, phase = key.partition(".")
+        measured = summary.get(mode, {}).get(phase)
+        if measured is None:
+            missing.append(key)
+        elif measured["median"] > limit:
+            violations.append({"key": key, "budget_ms": limit, "median_ms": measured["median"]})
+    return violations, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="冷、热启动各运行次数")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--budget", help="预算 JSON 文件，超出时退出码为 1")
+    parser.add_argument("--configured-db", action="store_true",
+                        help="使用 db_config 当前配置的数据库，默认使用临时 SQLite 库")
+    parser.add_argument("--no-render", action="store_true", help="跳过窗口渲染阶段")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--render", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, HERE)
+        run_child(args.render)
+        return
+
+    env = dict(os.environ, INVENTORY_PREWARM="0")
+    temp_dir = None
+    if not args.configured_db:
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, "bench_startup.db")
+        prepare_database(path)
+        env.update(INVENTORY_DB_BACKEND="sqlite", INVENTORY_SQLITE_PATH=path)
+
+    runs = {"cold": [], "warm": []}
+    errors = {}
+    imports = []
+    with VirtualDisplay() as display:
+        render = not args.no_render and display.available
+        if display.display:
+            env["DISPLAY"] = display.display
+        if display.reason:
+            errors["render"] = display.reason
+        for mode in ("cold", "warm"):
+            for _ in range(args.runs):
+                phases, run_errors, run_imports = run_once(env, render, cold=(mode == "cold"))
+                runs[mode].append(phases)
+                errors.update(run_errors)
+                if mode == "warm":
+                    imports = run_imports
+
+    if temp_dir is not None:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    summary = {mode: summarize(mode_runs) for mode, mode_runs in runs.items()}
+    top = sorted(imports, key=lambda m: m[2], reverse=True)[:TOP_IMPORTS]
+    result = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs_per_mode": args.runs,
+        "summary": summary,
+        "heavy_modules_loaded": sorted({m for mode_runs in runs.values() for run in mode_runs
+                                        for m in run.get("heavy_modules_loaded", [])}),
+        "top_imports_us": [{"module": name, "self": self_us, "cumulative": cumulative_us}
+                           for name, self_us, cumulative_us in top],
+        "errors": errors,
+        "runs": runs,
+    }
+
+    exit_code = 0
+    if args.budget:
+        with open(args.budget, encoding="utf-8") as f:
+            budget = json.load(f)
+        violations, missing = check_budget(summary, budget)
+        result["budget"] = {"violations": violations, "missing": missing}
+        if violations:
+            exit_code = 1
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
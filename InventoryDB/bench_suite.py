@@ -0,0 +1,343 @@
+# bench_suite.py
+# 热点路径基准：在 datagen 生成的本地 SQLite 库上计时库存搜索、流水筛选、月报、预警检查、出入库过账，
+# 结果写成 JSON；给出基线文件时逐项比较中位数，变慢超过容差即为回归，退出码为 1。
+#   python bench_suite.py --scale small --output bench_results.json
+#   python bench_suite.py --database big.db --baseline bench_baseline.json --tolerance 0.2
+# 写操作（过账）放在最后执行并会真实提交；使用 --database 指定的库时数据会被修改。
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import datagen
+import db_config
+from db_config import db_connection, limit_query
+from utils import chunked, placeholders
+
+REPEAT = 20
+TOLERANCE = 0.2       # 中位数比基线慢 20% 以上视为回归
+MIN_DELTA_MS = 0.5    # 绝对差值低于该毫秒数的变化视为噪声
+SEARCH_KEYWORDS = ("轴承", "6204", "华东", "dn50")
+BATCH_LINES = 500
+
+# 与 InOutRecordViewer 的查询一致
+RECORD_QUERY = """
+    SELECT r.record_id, r.type, r.quantity, r.timestamp,
+           m.material_name, u.username, r.note
+    FROM InOutRecord r
+    JOIN Material m ON r.material_id = m.material_id
+    JOIN Users u ON r.user_id = u.user_id
+"""
+RECORD_COUNT_QUERY = """
+    SELECT COUNT(*)
+    FROM InOutRecord r
+    JOIN Material m ON r.material_id = m.material_id
+    JOIN Users u ON r.user_id = u.user_id
+"""
+RECORD_ORDER = " ORDER BY r.timestamp DESC, r.record_id DESC"
+PAGE_SIZE = 200
+
+
+def _ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(fn, repeat, setup=None):
+    """运行 repeat 次，setup 不计入耗时，返回毫秒统计"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(_ms(start))
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_ms": round(samples[0], 3),
+        "runs": len(samples),
+    }
+
+
+def _scalar(query, params=()):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return cursor.fetchone()[0]
+
+
+def _dataset():
+    """从库中取出基准需要的参数：最近一天、最近的已结账月份、当前月份、物料数"""
+    latest = _scalar("SELECT MAX(timestamp) FROM InOutRecord")
+    if not isinstance(latest, datetime):
+        latest = datetime.fromisoformat(str(latest))
+    return {
+        "latest": latest,
+        "materials": _scalar("SELECT MAX(material_id) FROM Material"),
+        "users": _scalar("SELECT MIN(user_id) FROM Users"),
+        "closed_month": _scalar("SELECT MAX(month) FROM ReportClose"),
+        "open_month": latest.strftime("%Y-%m"),
+    }
+
+
+# ---------- 各热点路径 ----------
+
+def inventory_benchmarks(data):
+    from material_cache import get_catalog
+    from material_search import get_index, search_materials, search_sql
+
+    get_catalog().get()
+    get_index()
+
+    def search_index():
+        for keyword in SEARCH_KEYWORDS:
+            matches = search_materials(keyword, fields=("name", "supplier"))[:2000]
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                for ids in chunked([m.material_id for m in matches]):
+                    cursor.execute(
+                        "SELECT material_id, current_quantity, last_updated FROM Inventory "
+                        f"WHERE material_id IN ({placeholders(len(ids))})",
+                        ids
+                    )
+                    cursor.fetchall()
+
+    def search_like():
+        for keyword in SEARCH_KEYWORDS:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT M.material_name, M.supplier, M.unit, I.current_quantity, I.last_updated
+                    FROM Inventory I
+                    JOIN Material M ON I.material_id = M.material_id
+                    WHERE M.material_name LIKE ? OR M.supplier LIKE ?
+                """, (f"%{keyword}%", f"%{keyword}%"))
+                cursor.fetchall()
+
+    def search_cold_sql():
+        for keyword in SEARCH_KEYWORDS:
+            search_sql(keyword, fields=("name", "supplier"))
+
+    def catalog_refresh():
+        get_catalog().refresh()
+
+    return {
+        "inventory_search_index": (search_index, None),
+        "inventory_search_like": (search_like, None),
+        "material_search_cold_sql": (search_cold_sql, None),
+        "material_catalog_refresh": (catalog_refresh, None),
+    }
+
+
+def record_benchmarks(data):
+    end = data["latest"].replace(hour=0, minute=0, second=0) + timedelta(days=1)
+    week = (" AND r.timestamp >= ? AND r.timestamp < ?", [end - timedelta(days=7), end])
+    month = (" AND r.timestamp >= ? AND r.timestamp < ?", [end - timedelta(days=30), end])
+
+    def page(filter_sql, params, pages=1):
+        def run():
+            after_key = None
+            for _ in range(pages):
+                query = RECORD_QUERY + " WHERE 1 = 1" + filter_sql
+                query_params = list(params)
+                if after_key is not None:
+                    query += " AND (r.timestamp < ? OR (r.timestamp = ? AND r.record_id < ?))"
+                    query_params += [after_key[0], after_key[0], after_key[1]]
+                with db_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(limit_query(query + RECORD_ORDER, PAGE_SIZE + 1), query_params)
+                    rows = cursor.fetchall()[:PAGE_SIZE]
+                if not rows:
+                    break
+                after_key = (rows[-1][3], rows[-1][0])
+        return run
+
+    def count(filter_sql, params):
+        def run():
+            _scalar(RECORD_COUNT_QUERY + " WHERE 1 = 1" + filter_sql, params)
+        return run
+
+    out_week = (week[0] + " AND r.type = ?", week[1] + ["出库"])
+    by_material = (month[0] + " AND m.material_name LIKE ?", month[1] + ["%轴承%"])
+    by_user = (month[0] + " AND u.username LIKE ?", month[1] + ["%user01%"])
+    return {
+        "record_filter_first_page": (page(*out_week), None),
+        "record_filter_ten_pages": (page(*week, pages=10), None),
+        "record_filter_material": (page(*by_material), None),
+        "record_filter_user": (page(*by_user), None),
+        "record_count_month": (count(*month), None),
+    }
+
+
+def report_benchmarks(data):
+    from period_close import get_monthly_report
+
+    closed, current = data["closed_month"], data["open_month"]
+
+    def reopen():
+        with db_connection() as conn:
+            conn.cursor().execute("DELETE FROM ReportClose WHERE month = ?", (current,))
+
+    benchmarks = {
+        # 每次先撤销当月结账，计时包含一次月结
+        "monthly_report_close": (lambda: get_monthly_report(current), reopen),
+    }
+    if closed:
+        benchmarks["monthly_report_closed"] = (lambda: get_monthly_report(closed), None)
+    return benchmarks
+
+
+def alert_benchmarks(data):
+    from alert_engine import evaluate_alerts, sweep_alerts
+
+    hot = list(range(1, min(BATCH_LINES, data["materials"]) + 1))
+
+    def in_rollback(fn):
+        def run():
+            with db_connection() as conn:
+                try:
+                    fn(conn.cursor())
+                finally:
+                    conn.rollback()
+        return run
+
+    return {
+        "alert_evaluate_one": (in_rollback(lambda cursor: evaluate_alerts(cursor, [1])), None),
+        "alert_evaluate_batch": (in_rollback(lambda cursor: evaluate_alerts(cursor, hot)), None),
+        "alert_sweep": (in_rollback(sweep_alerts), None),
+    }
+
+
+def movement_benchmarks(data):
+    from stock_movement import IN_TYPE, OUT_TYPE, post_movement, post_movements
+
+    user_id = data["users"]
+    materials = data["materials"]
+    state = {"n": 0}
+
+    def single():
+        # 入库、出库交替，库存保持不变
+        io_type = IN_TYPE if state["n"] % 2 == 0 else OUT_TYPE
+        state["n"] += 1
+        post_movement(1 + state["n"] // 2 % min(materials, 100), user_id, io_type, 1, "bench")
+
+    def batch():
+        lines = []
+        for i in range(BATCH_LINES // 2):
+            material_id = 1 + i % materials
+            lines.append((material_id, IN_TYPE, 1, "bench"))
+            lines.append((material_id, OUT_TYPE, 1, "bench"))
+        post_movements(user_id, lines)
+
+    return {
+        "movement_post_single": (single, None),
+        "movement_post_batch": (batch, None),
+    }
+
+
+# 只读的在前，写操作在最后
+SUITES = (inventory_benchmarks, record_benchmarks, report_benchmarks, alert_benchmarks, movement_benchmarks)
+
+
+def run_suite(repeat, only=None, progress=None):
+    data = _dataset()
+    results = {}
+    for suite in SUITES:
+        for name, (fn, setup) in suite(data).items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            fn()  # 预热：填充页缓存与语句缓存
+            results[name] = measure(fn, repeat, setup)
+            if progress is not None:
+                progress(name, results[name])
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE, min_delta_ms=MIN_DELTA_MS):
+    """与基线逐项比较，返回 (回归列表, 全部比较结果)"""
+    comparison, regressions = {}, []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else None
+        entry = {"baseline_ms": base["median_ms"], "median_ms": result["median_ms"],
+                 "ratio": round(ratio, 2) if ratio is not None else None}
+        if (ratio is not None and ratio > 1 + tolerance
+                and result["median_ms"] - base["median_ms"] > min_delta_ms):
+            entry["regression"] = True
+            regressions.append(name)
+        comparison[name] = entry
+    return regressions, comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点查询路径基准")
+    parser.add_argument("--database", help="已生成的 SQLite 库（会被过账基准修改），默认按 --scale 临时生成")
+    parser.add_argument("--scale", choices=list(datagen.SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="每项重复次数（取中位数）")
+    parser.add_argument("--only", nargs="+", help="只运行名称包含这些片段的基准")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--baseline", help="基线结果 JSON，回归时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="允许的相对变慢比例")
+    args = parser.parse_args()
+
+    temp_dir = None
+    dataset = None
+    path = args.database
+    if path is None:
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, "bench_suite.db")
+        dataset = datagen.generate(path, seed=args.seed, **datagen.SCALES[args.scale])
+    db_config.configure(backend="sqlite", sqlite_path=path)
+
+    def progress(name, result):
+        print(f"{name}: {result['median_ms']} ms", file=sys.stderr, flush=True)
+
+    try:
+        results = run_suite(args.repeat, args.only, progress)
+    finally:
+        db_config.get_pool().close()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    output = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "scale": None if args.database else args.scale,
+        "dataset": dataset,
+        "repeat": args.repeat,
+        "benchmarks": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions, comparison = compare(results, baseline.get("benchmarks", {}), args.tolerance)
+        output["comparison"] = comparison
+        output["regressions"] = regressions
+        if regressions:
+            exit_code = 1
+
+    text = json.dumps(output, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
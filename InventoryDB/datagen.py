@@ -0,0 +1,349 @@
+# datagen.py
+# 合成数据生成器：按 SQLite 建表脚本建一个完整的本地库，Users、Material、Inventory、InOutRecord、
+# InventoryCheck、Alert、Report 全部填充，规模可调（流水最多千万行），供性能测试和基准使用。
+#   python datagen.py --scale medium --output bench.db
+#   python datagen.py --movements 10000000 --materials 200000 --months 36 --output big.db
+# 数据按时间顺序模拟：物料 ID 越小流水越多（对数均匀分布，约 1% 的物料占一半流水），工作日白天集中；
+# 出库扣减模拟库存，低于下限时补货入库；每天下班后抽盘，盘点结果按盘点人的准确率产生差异并校正库存；
+# 预警随库存状态变化产生和关闭。因此 Inventory = 最近一次盘点数 + 之后的净出入库，未处理预警与当前库存一致。
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import db_config
+import migrate
+from alert_engine import LOW_ALERT, HIGH_ALERT
+from period_close import close_month, shift_month
+from stock_movement import IN_TYPE, OUT_TYPE
+
+SCALES = {
+    "small": {"users": 20, "materials": 2000, "movements": 100_000, "months": 12},
+    "medium": {"users": 50, "materials": 20_000, "movements": 1_000_000, "months": 24},
+    "large": {"users": 200, "materials": 200_000, "movements": 10_000_000, "months": 36},
+}
+
+CATEGORIES = {
+    "螺栓": ("个", ("M6×20", "M8×30", "M10×40", "M12×50")),
+    "螺母": ("个", ("M6", "M8", "M10", "M12")),
+    "垫片": ("个", ("Φ6", "Φ8", "Φ10", "Φ12")),
+    "轴承": ("套", ("6204-2RS", "6205-ZZ", "6305", "NU206")),
+    "电阻": ("个", ("10kΩ", "4.7kΩ", "100Ω", "1MΩ")),
+    "电容": ("个", ("100μF", "10nF", "470μF", "1μF")),
+    "继电器": ("个", ("24V", "12V", "220V")),
+    "传感器": ("个", ("PT100", "NPN", "PNP", "4-20mA")),
+    "电缆": ("米", ("RVV 3×1.5", "RVV 2×0.75", "YJV 4×16")),
+    "接头": ("个", ("DN15", "DN20", "DN25", "DN50")),
+    "阀门": ("个", ("DN15", "DN25", "DN50", "DN80")),
+    "滤芯": ("支", ("5μm", "10μm", "20μm")),
+    "密封圈": ("个", ("O型 20×2", "O型 30×3", "V型 40")),
+    "齿轮": ("个", ("m1 z20", "m2 z30", "m3 z40")),
+    "皮带": ("条", ("A-1000", "B-1250", "SPZ-900")),
+    "开关": ("个", ("单联", "双联", "急停")),
+    "保险丝": ("个", ("2A", "5A", "10A")),
+    "电机": ("台", ("0.75kW", "1.5kW", "3kW")),
+    "法兰": ("片", ("DN50", "DN80", "DN100")),
+    "润滑油": ("桶", ("46#", "68#", "100#")),
+}
+SUPPLIER_REGIONS = ("华东", "华南", "华北", "西南", "东北", "华中", "西北")
+SUPPLIER_KINDS = ("五金", "机电", "电子", "工业品", "轴承", "液压", "自动化")
+NOTES = (None, None, None, None, "易损件", "进口", "需质检", "替代料", "慢动", "危险品")
+MAX_LEVELS = (100, 200, 500, 1000, 2000, 5000)
+
+WORK_START, WORK_PEAK, WORK_END = 8 * 3600, 10 * 3600, 18 * 3600
+CHECK_HOUR = 18
+CHECK_RATIO = 0.02       # 每天抽盘数量约为当天流水数的 2%
+UNIFORM_SHARE = 0.1      # 10% 的流水随机分布在全部物料上，保证冷门物料也有历史
+RETURN_SHARE = 0.05      # 非补货的零星入库（退料）
+INSERT_BATCH = 100_000
+
+
+def _materials(rnd, n):
+    categories = list(CATEGORIES.items())
+    suppliers = [f"{rnd.choice(SUPPLIER_REGIONS)}{rnd.choice(SUPPLIER_KINDS)}{i:03d}"
+                 for i in range(max(1, n // 60))]
+    rows = []
+    for i in range(n):
+        category, (unit, specs) = categories[i % len(categories)]
+        max_quantity = rnd.choice(MAX_LEVELS)
+        min_quantity = int(max_quantity * rnd.uniform(0.1, 0.25))
+        rows.append((f"{category} {rnd.choice(specs)} #{i + 1:06d}", rnd.choice(suppliers), unit,
+                     max_quantity, min_quantity, rnd.choice(NOTES)))
+    return rows
+
+
+def _users(rnd, n):
+    """前两个为管理员，其余为操作员；每人有一个盘点差错率"""
+    rows, error_rates = [], []
+    for i in range(n):
+        admin = i < 2
+        rows.append((f"admin{i}" if admin else f"user{i:03d}", "pwd",
+                     "管理员" if admin else "操作员", 2 if admin else 1))
+        error_rates.append(rnd.uniform(0.02, 0.3))
+    return rows, error_rates
+
+
+def _daily_counts(rnd, start, days, total):
+    """把流水总数分到每天：周末约为工作日的三成，期间业务量线性增长约 30%"""
+    weights = []
+    for d in range(days):
+        weekend = (start + timedelta(days=d)).weekday() >= 5
+        weights.append((0.3 if weekend else 1.0) * (1 + 0.3 * d / days) * rnd.uniform(0.8, 1.2))
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    counts[-1] += total - sum(counts)
+    return counts
+
+
+def _clock(prefix, seconds):
+    return f"{prefix}{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class _Simulation:
+    """按时间顺序生成流水，同时维护模拟库存、盘点与预警"""
+
+    def __init__(self, rnd, materials, error_rates, start, days, movements):
+        self.rnd = rnd
+        self.n = len(materials)
+        self.min_q = [row[4] for row in materials]
+        self.max_q = [row[3] for row in materials]
+        self.stock = [rnd.randint(lo, hi) for lo, hi in zip(self.min_q, self.max_q)]
+        self.last_updated = [None] * self.n
+        self.error_rates = error_rates
+        self.start = start
+        self.days = days
+        self.movements = movements
+        self.checks = []
+        self.alerts = []              # [material_id, 类型, 数量, 时间]
+        self.resolved = bytearray()   # 与 alerts 一一对应
+        self.open_alert = {}          # 物料下标 -> alerts 下标
+        self.state = [None] * self.n
+
+    def _pick(self):
+        rnd = self.rnd
+        if rnd.random() < UNIFORM_SHARE:
+            return rnd.randrange(self.n)
+        return int(self.n ** rnd.random()) - 1
+
+    def _update_alert(self, m, ts):
+        quantity = self.stock[m]
+        new = LOW_ALERT if quantity < self.min_q[m] else (HIGH_ALERT if quantity > self.max_q[m] else None)
+        if new == self.state[m]:
+            return
+        old = self.open_alert.pop(m, None)
+        if old is not None:
+            self.resolved[old] = 1
+        if new is not None:
+            self.open_alert[m] = len(self.alerts)
+            self.alerts.append((m + 1, new, quantity, ts))
+            self.resolved.append(0)
+        self.state[m] = new
+
+    def _movement(self, m):
+        """返回 (类型, 数量)，并更新模拟库存"""
+        rnd = self.rnd
+        stock, lo, hi = self.stock[m], self.min_q[m], self.max_q[m]
+        if stock == 0 or (stock < lo and rnd.random() < 0.7):
+            # 补到上限附近，偶尔超出上限
+            quantity = max(1, hi - stock + int(hi * rnd.uniform(-0.15, 0.1)))
+            io_type = IN_TYPE
+        elif rnd.random() < RETURN_SHARE:
+            quantity = rnd.randint(1, max(1, hi // 20))
+            io_type = IN_TYPE
+        else:
+            quantity = min(stock, rnd.randint(1, max(1, hi // 10)))
+            io_type = OUT_TYPE
+        self.stock[m] = stock + quantity if io_type == IN_TYPE else stock - quantity
+        return io_type, quantity
+
+    def _check(self, m, user, ts):
+        rnd = self.rnd
+        recorded = self.stock[m]
+        real = recorded
+        if rnd.random() < self.error_rates[user - 1]:
+            # 差异以短少为主
+            if rnd.random() < 0.8:
+                real = max(0, recorded - rnd.randint(1, max(1, recorded // 20)))
+            else:
+                real = recorded + rnd.randint(1, max(1, recorded // 50))
+        self.checks.append((m + 1, real, recorded, user, ts))
+        self.stock[m] = real
+        self.last_updated[m] = ts
+        self._update_alert(m, ts)
+
+    def ledger(self, users):
+        """生成 InOutRecord 行；期初库存记为第一天零点的入库"""
+        rnd = self.rnd
+        prefix = self.start.strftime("%Y-%m-%d ")
+        opening = _clock(prefix, 0)
+        for m in range(self.n):
+            self.last_updated[m] = opening
+            if self.stock[m]:
+                yield (m + 1, 1, IN_TYPE, self.stock[m], opening, "期初库存")
+            self._update_alert(m, opening)
+
+        counts = _daily_counts(rnd, self.start, self.days, self.movements)
+        for d, count in enumerate(counts):
+            prefix = (self.start + timedelta(days=d)).strftime("%Y-%m-%d ")
+            for seconds in sorted(int(rnd.triangular(WORK_START, WORK_END, WORK_PEAK)) for _ in range(count)):
+                ts = _clock(prefix, seconds)
+                m = self._pick()
+                io_type, quantity = self._movement(m)
+                self.last_updated[m] = ts
+                self._update_alert(m, ts)
+                yield (m + 1, rnd.randint(1, users), io_type, quantity, ts, None)
+
+            for i in range(max(1, int(count * CHECK_RATIO))):
+                self._check(rnd.randrange(self.n), rnd.randint(1, users),
+                            _clock(prefix, CHECK_HOUR * 3600 + i % 3600))
+
+
+def _insert(conn, sql, rows, progress=None, label=None):
+    """分批 executemany，rows 可以是生成器"""
+    batch, total = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == INSERT_BATCH:
+            conn.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+            if progress is not None:
+                progress(label, total)
+    if batch:
+        conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+def generate(path, users=20, materials=2000, movements=100_000, months=12, start=None, seed=42,
+             migrate_schema=True, close_months=True, progress=None):
+    """在 path 新建 SQLite 库并写入合成数据，返回各表行数与耗时
+
+    start 为第一天（默认为 months 个月前的月初），模拟到 start + months 个月为止；
+    migrate_schema 为 False 时不执行迁移（用于对比迁移前后）；close_months 为 True 时
+    对已结束的月份依次月结写入 Report。progress(阶段, 行数) 在写入过程中调用。
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} 已存在")
+    rnd = random.Random(seed)
+    if start is None:
+        start = datetime.strptime(shift_month(datetime.now().strftime("%Y-%m"), -months), "%Y-%m")
+    end = datetime.strptime(shift_month(start.strftime("%Y-%m"), months), "%Y-%m")
+    days = (end - start).days
+    timings = {}
+
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(path)
+    with open(db_config.SQLITE_SCHEMA, encoding="utf-8") as f:
+        conn.executescript(f.read())
+    # 批量装载期间关闭日志与同步，建索引放在装载之后
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    user_rows, error_rates = _users(rnd, users)
+    conn.executemany("INSERT INTO Users (username, password, role, permission_level) VALUES (?, ?, ?, ?)",
+                     user_rows)
+    material_rows = _materials(rnd, materials)
+    conn.executemany(
+        "INSERT INTO Material (material_name, supplier, unit, max_quantity, min_quantity, note) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        material_rows
+    )
+
+    sim = _Simulation(rnd, material_rows, error_rates, start, days, movements)
+    ledger_rows = _insert(
+        conn,
+        "INSERT INTO InOutRecord (material_id, user_id, type, quantity, timestamp, note) VALUES (?, ?, ?, ?, ?, ?)",
+        sim.ledger(users), progress, "InOutRecord"
+    )
+    conn.executemany(
+        "INSERT INTO InventoryCheck (material_id, real_quantity, recorded_quantity, adjusted_by_user, check_time) "
+        "VALUES (?, ?, ?, ?, ?)",
+        sim.checks
+    )
+    conn.executemany(
+        "INSERT INTO Alert (material_id, alert_type, current_quantity, generated_time, is_resolved) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (alert + (resolved,) for alert, resolved in zip(sim.alerts, sim.resolved))
+    )
+    conn.executemany(
+        "INSERT INTO Inventory (material_id, current_quantity, last_updated) VALUES (?, ?, ?)",
+        [(m + 1, sim.stock[m], sim.last_updated[m]) for m in range(materials)]
+    )
+    conn.commit()
+    timings["load_seconds"] = round(time.perf_counter() - t0, 2)
+
+    if migrate_schema:
+        t0 = time.perf_counter()
+        migrate.apply_migrations(conn, "sqlite")
+        conn.execute("ANALYZE")
+        conn.commit()
+        timings["migrate_seconds"] = round(time.perf_counter() - t0, 2)
+
+    closed = []
+    if close_months:
+        t0 = time.perf_counter()
+        cursor = conn.cursor()
+        month, current = start.strftime("%Y-%m"), datetime.now().strftime("%Y-%m")
+        while month < end.strftime("%Y-%m") and month < current:
+            close_month(cursor, month)
+            closed.append(month)
+            if progress is not None:
+                progress("Report", len(closed))
+            month = shift_month(month, 1)
+        conn.commit()
+        timings["close_seconds"] = round(time.perf_counter() - t0, 2)
+
+    counts = {}
+    for table in ("Users", "Material", "Inventory", "InOutRecord", "InventoryCheck", "Alert", "Report"):
+        counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    open_alerts = conn.execute("SELECT COUNT(*) FROM Alert WHERE is_resolved = 0").fetchone()[0]
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+    return {
+        "path": path,
+        "seed": seed,
+        "start": start.strftime("%Y-%m-%d"),
+        "end": end.strftime("%Y-%m-%d"),
+        "ledger_rows": ledger_rows,
+        "rows": counts,
+        "open_alerts": open_alerts,
+        "closed_months": len(closed),
+        **timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成数据的 SQLite 库")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="预设规模")
+    parser.add_argument("--users", type=int, help="用户数量")
+    parser.add_argument("--materials", type=int, help="物料数量")
+    parser.add_argument("--movements", type=int, help="出入库流水行数（不含期初），最多约千万行")
+    parser.add_argument("--months", type=int, help="模拟的月数")
+    parser.add_argument("--start", type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+                        help="第一天，如 2023-01-01，默认为 months 个月前的月初")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-migrate", action="store_true", help="不执行索引迁移")
+    parser.add_argument("--no-close", action="store_true", help="不做月结（Report 为空）")
+    parser.add_argument("--output", default="inventory_bench.db", help="输出的 SQLite 文件")
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for key in ("users", "materials", "movements", "months"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    def progress(stage, count):
+        print(f"{stage}: {count}", flush=True)
+
+    summary = generate(args.output, start=args.start, seed=args.seed, migrate_schema=not args.no_migrate,
+                       close_months=not args.no_close, progress=progress, **params)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
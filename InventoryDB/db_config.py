@@ -1,14 +1,233 @@
 # db_config.py
 
-import pyodbc
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from db_pool import ConnectionPool
+import query_stats  # 设置了 INVENTORY_QUERY_STATS 时在导入时启用语句统计
+
+try:
+    import pyodbc
+except ImportError:  # 只使用 SQLite 后端时可以不安装 pyodbc
+    pyodbc = None
+
+# 数据库后端："mssql"（SQL Server，默认）或 "sqlite"（本地运行与性能测试）
+DB_BACKEND = os.environ.get("INVENTORY_DB_BACKEND", "mssql")
+
+MSSQL_CONN_STR = os.environ.get(
+    "INVENTORY_MSSQL_CONN_STR",
+    'DRIVER={SQL Server};SERVER=localhost;DATABASE=InventoryDB;UID=sa;PWD=Gaoqianya1102'
+)
+SQLITE_PATH = os.environ.get("INVENTORY_SQLITE_PATH", "inventory.db")
+SQLITE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "database", "create_database_sqlite.sql")
+
+# 连接池参数
+POOL_MAX_SIZE = int(os.environ.get("INVENTORY_POOL_SIZE", "8"))
+POOL_MAX_IDLE = 300          # 空闲超过该秒数的连接被回收
+POOL_ACQUIRE_TIMEOUT = 10    # 连接池耗尽时的最长等待秒数
+POOL_HEALTH_CHECK_AFTER = 30 # 空闲超过该秒数的连接在检出时先做健康检查
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ---------- SQLite 后端 ----------
+
+_row_classes = {}
+
+
+def _sqlite_row_factory(cursor, row):
+    """让 SQLite 行同时支持下标、解包和 row.column 访问，与 pyodbc.Row 用法一致"""
+    names = tuple(d[0] for d in cursor.description)
+    cls = _row_classes.get(names)
+    if cls is None:
+        cls = namedtuple("Row", names, rename=True)
+        _row_classes[names] = cls
+    return cls(*row)
+
+
+class _SqliteCursor(sqlite3.Cursor):
+    """兼容 pyodbc 的 execute(sql, a, b, c) 逐个传参写法"""
+
+    def execute(self, sql, *params):
+        return super().execute(sql, _normalize_params(params))
+
+
+class _SqliteConnection(sqlite3.Connection):
+    def cursor(self, factory=_SqliteCursor):
+        return super().cursor(factory)
+
+
+def _normalize_params(params):
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        return tuple(params[0])
+    return params
+
+
+def _adapt_datetime(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f") if value.microsecond else value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _convert_datetime(value):
+    try:
+        return datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+
+
+def _connect_sqlite():
+    is_new = SQLITE_PATH == ":memory:" or not os.path.exists(SQLITE_PATH)
+    conn = sqlite3.connect(
+        SQLITE_PATH,
+        timeout=30,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,  # 连接会在连接池中跨线程复用
+        factory=_SqliteConnection,
+    )
+    conn.row_factory = _sqlite_row_factory
+    # 让现有 T-SQL 语句中的 GETDATE() 在 SQLite 上也能执行
+    conn.create_function("GETDATE", 0, lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    conn.execute("PRAGMA foreign_keys = ON")
+    if SQLITE_PATH != ":memory:":
+        conn.execute("PRAGMA journal_mode = WAL")
+    if is_new:
+        with open(SQLITE_SCHEMA, encoding="utf-8") as f:
+            conn.executescript(f.read())
+        conn.commit()
+        import migrate  # 延迟导入，避免循环依赖
+        migrate.apply_migrations(conn, "sqlite")
+    return conn
+
+
+def _connect_mssql():
+    if pyodbc is None:
+        raise RuntimeError("未安装 pyodbc，无法连接 SQL Server")
+    return pyodbc.connect(MSSQL_CONN_STR, timeout=5)
+
+
+# ---------- 连接池 ----------
+
+def get_pool():
+    """返回进程内共享的连接池（首次调用时创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                connect = _connect_sqlite if DB_BACKEND == "sqlite" else _connect_mssql
+                _pool = ConnectionPool(
+                    connect,
+                    max_size=POOL_MAX_SIZE,
+                    max_idle=POOL_MAX_IDLE,
+                    acquire_timeout=POOL_ACQUIRE_TIMEOUT,
+                    health_check_after=POOL_HEALTH_CHECK_AFTER,
+                )
+    return _pool
+
+
+def configure(backend=None, sqlite_path=None, pool_size=None):
+    """切换后端或连接池参数（测试与基准脚本使用），会关闭现有连接池"""
+    global DB_BACKEND, SQLITE_PATH, POOL_MAX_SIZE, _pool
+    with _pool_lock:
+        if backend is not None:
+            DB_BACKEND = backend
+        if sqlite_path is not None:
+            SQLITE_PATH = sqlite_path
+        if pool_size is not None:
+            POOL_MAX_SIZE = pool_size
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
 
 def get_connection():
+    """从连接池检出连接；调用方 close() 时归还连接池。失败时返回 None"""
     try:
-        conn = pyodbc.connect(
-            'DRIVER={SQL Server};SERVER=localhost;DATABASE=InventoryDB;UID=sa;PWD=Gaoqianya1102',
-            timeout=5
-        )
-        return conn
+        return get_pool().acquire()
     except Exception as e:
         print("数据库连接失败：", e)
         return None
+
+
+@contextmanager
+def db_connection():
+    """连接池上下文管理器：正常退出提交，异常时回滚，最后归还连接"""
+    conn = get_pool().acquire()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def pool_stats():
+    """返回连接池统计信息"""
+    return get_pool().stats()
+
+
+def limit_query(query, n):
+    """给 SELECT 语句加行数限制：SQL Server 用 TOP，SQLite 用 LIMIT"""
+    n = int(n)
+    if DB_BACKEND == "sqlite":
+        return f"{query} LIMIT {n}"
+    query = query.lstrip()
+    return f"SELECT TOP ({n}){query[len('SELECT'):]}"
+
+
+def locked(table):
+    """FROM 子句中的表：SQL Server 上加 UPDLOCK, HOLDLOCK，读到的行和不存在的键范围一直锁到事务结束，
+    “先判断不存在再插入”不会被并发事务插队；SQLite 的写事务本身独占整个库，不需要提示"""
+    if DB_BACKEND == "sqlite":
+        return table
+    return f"{table} WITH (UPDLOCK, HOLDLOCK)"
+
+
+def table_locked(table):
+    """FROM 子句中的表（可带别名，如 "Inventory I"）：SQL Server 上加 TABLOCK, HOLDLOCK，
+    共享表锁一直持有到事务结束，期间其他事务不能修改该表（正在修改的先做完提交）；
+    SQLite 的写事务本身独占整个库，不需要提示"""
+    if DB_BACKEND == "sqlite":
+        return table
+    return f"{table} WITH (TABLOCK, HOLDLOCK)"
+
+
+def datetime_param():
+    """与 DATETIME 列比较的时间参数占位符
+
+    pyodbc 把 datetime 按 datetime2 绑定，兼容级别 130 起 DATETIME 列按精确值（.003/.007 实为 1/300 秒）
+    与之比较，从该列读出的时间再作参数也不相等；SQL Server 上先转回 DATETIME。
+    """
+    if DB_BACKEND == "sqlite":
+        return "?"
+    return "CAST(? AS DATETIME)"
+
+
+def day_offset(column):
+    """SQL 表达式：column 所在日期距参数 ? 所在日期的天数（按日历日，忽略时分秒），? 须在语句参数中给出"""
+    if DB_BACKEND == "sqlite":
+        return f"CAST(julianday(date({column})) - julianday(date(?)) AS INTEGER)"
+    return f"DATEDIFF(day, ?, {column})"
+
+
+def last_insert_id(cursor):
+    """取本连接上一条 INSERT 生成的自增ID
+
+    pyodbc 的每次 execute 是独立批次，SCOPE_IDENTITY() 取不到上一批次的值，SQL Server 上用 @@IDENTITY
+    （只用于没有触发器插入其他自增表的表）。
+    """
+    if DB_BACKEND == "sqlite":
+        cursor.execute("SELECT last_insert_rowid()")
+    else:
+        cursor.execute("SELECT CAST(@@IDENTITY AS INT)")
+    return cursor.fetchone()[0]
@@ -0,0 +1,252 @@
+# db_pool.py
+import threading
+import time
+
+
+# 游标包装钩子（语句统计、界面剖析等），没有钩子时 cursor() 直接返回原始游标
+_cursor_hooks = ()
+
+
+def add_cursor_hook(hook):
+    """hook(cursor) 返回包装后的游标，多个钩子按添加顺序层层包装"""
+    global _cursor_hooks
+    if hook not in _cursor_hooks:
+        _cursor_hooks = _cursor_hooks + (hook,)
+
+
+def remove_cursor_hook(hook):
+    global _cursor_hooks
+    _cursor_hooks = tuple(h for h in _cursor_hooks if h is not hook)
+
+
+def has_cursor_hook(hook):
+    return hook in _cursor_hooks
+
+
+class CursorWrapper:
+    """游标包装基类：未覆盖的属性和方法都转发给被包装的游标"""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # 如 cursor.fast_executemany = True，需要设到底层游标上
+        setattr(self._cursor, name, value)
+
+
+class PoolExhaustedError(Exception):
+    """连接池在等待超时后仍无可用连接"""
+
+
+class PooledConnection:
+    """对底层连接的包装：close() 时归还连接池而不是真正关闭"""
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw = raw_conn
+        self._closed = False
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def cursor(self):
+        cursor = self._raw.cursor()
+        for hook in _cursor_hooks:
+            cursor = hook(cursor)
+        return cursor
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        """归还连接池（可重复调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._pool._release(self._raw)
+        self._raw = None
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"连接已归还连接池，无法访问 {name}")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._raw is not None:
+            if exc_type is None:
+                self._raw.commit()
+            else:
+                self._raw.rollback()
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """有界连接池：检出时健康检查、空闲超时回收、统计信息"""
+
+    def __init__(self, connect, max_size=8, max_idle=300, acquire_timeout=10,
+                 health_check_after=30, ping_sql="SELECT 1"):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self.ping_sql = ping_sql
+
+        self._lock = threading.Condition()
+        self._idle = []  # [(raw_conn, 归还时间)]，末尾为最近归还
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "evicted_idle": 0,
+            "discarded": 0,
+            "wait_seconds": 0.0,
+        }
+
+    def acquire(self, timeout=None):
+        """检出一个连接，返回 PooledConnection"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        wait_start = time.monotonic()
+
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolExhaustedError("连接池已关闭")
+                self._evict_idle_locked()
+                if self._idle:
+                    raw, returned_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    raw = None
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolExhaustedError(f"等待 {timeout} 秒后仍无可用数据库连接")
+                waited = True
+                self._lock.wait(remaining)
+
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - wait_start
+            self._stats["checkouts"] += 1
+
+        # 建连和健康检查都在锁外进行，避免阻塞其他线程
+        try:
+            if raw is not None and time.monotonic() - returned_at >= self.health_check_after:
+                if not self._ping(raw):
+                    with self._lock:
+                        self._stats["health_check_failures"] += 1
+                    self._close_quietly(raw)
+                    raw = None
+            if raw is None:
+                raw = self._connect()
+                with self._lock:
+                    self._stats["created"] += 1
+            else:
+                with self._lock:
+                    self._stats["reused"] += 1
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        return PooledConnection(self, raw)
+
+    def _release(self, raw):
+        # 回滚未提交的事务，保证下一个使用者拿到干净的连接
+        healthy = True
+        try:
+            raw.rollback()
+        except Exception:
+            healthy = False
+
+        with self._lock:
+            self._in_use -= 1
+            if healthy and not self._closed:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            else:
+                self._stats["discarded"] += 1
+            self._lock.notify()
+
+        if raw is not None:
+            self._close_quietly(raw)
+
+    def _ping(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute(self.ping_sql)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle_locked(self):
+        if not self._idle:
+            return
+        cutoff = time.monotonic() - self.max_idle
+        # 列表头部是最早归还的连接
+        while self._idle and self._idle[0][1] < cutoff:
+            raw, _ = self._idle.pop(0)
+            self._stats["evicted_idle"] += 1
+            self._close_quietly(raw)
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """返回连接池统计信息"""
+        with self._lock:
+            self._evict_idle_locked()
+            result = dict(self._stats)
+            result.update(
+                max_size=self.max_size,
+                in_use=self._in_use,
+                idle=len(self._idle),
+            )
+        return result
+
+    def close(self):
+        """关闭所有空闲连接，已检出的连接归还时直接关闭"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._lock.notify_all()
+        for raw, _ in idle:
+            self._close_quietly(raw)
@@ -0,0 +1,126 @@
+# excel_export.py
+# 流式 Excel 导出：直接从数据库游标分批 fetchmany，写入 openpyxl 只写模式工作簿，
+# 内存占用与导出行数无关，一年的出入库流水也能导出
+import unicodedata
+from datetime import date, datetime
+
+from db_config import db_connection
+
+FETCH_SIZE = 2000          # 每批从游标取的行数
+WIDTH_SAMPLE_ROWS = 500    # 用前多少行估算列宽
+MAX_COLUMN_WIDTH = 60
+EXCEL_MAX_ROWS = 1048576   # 含标题行
+
+
+class ExportError(Exception):
+    """导出无法完成（如超出 Excel 行数上限）"""
+
+
+def display_width(value):
+    """单元格内容的显示宽度，中日韩全角字符按 2 计"""
+    if value is None:
+        return 0
+    if isinstance(value, datetime):
+        return 19
+    if isinstance(value, date):
+        return 10
+    text = str(value)
+    return sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in text)
+
+
+def estimate_widths(headers, sample):
+    """按标题和样本行估算列宽，避免导出后再全表扫描"""
+    widths = [display_width(h) for h in headers]
+    for row in sample:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], display_width(value))
+    return [min(w + 2, MAX_COLUMN_WIDTH) * 1.2 for w in widths]
+
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def write_rows(path, headers, batches, sheet_title="Sheet1", token=None, total=None, row_format=None):
+    """把 batches（逐批产出的行列表）写入只写模式工作簿，返回写入的数据行数
+
+    第一批用于估算列宽；row_format 可对每行做显示格式转换；
+    token 为后台任务的取消令牌，用于汇报进度和响应取消。
+    """
+    import openpyxl  # 只在真正导出时才加载
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+
+    batches = iter(batches)
+    first = next(batches, [])
+    if row_format is not None:
+        first = [row_format(row) for row in first]
+
+    # 只写模式下列宽必须在写入任何行之前设置
+    for i, width in enumerate(estimate_widths(headers, first[:WIDTH_SAMPLE_ROWS])):
+        ws.column_dimensions[_column_letter(i)].width = width
+    ws.append(list(headers))
+
+    written = 0
+    batch = first
+    while True:
+        if written + len(batch) >= EXCEL_MAX_ROWS:
+            raise ExportError(f"超过 Excel 最大行数（{EXCEL_MAX_ROWS - 1} 行），请缩小筛选范围")
+        for row in batch:
+            ws.append(list(row))
+        written += len(batch)
+
+        if token is not None:
+            token.check()
+            value = min(written / total, 1.0) if total else None
+            token.report(value, f"已导出 {written} 行")
+
+        batch = next(batches, None)
+        if batch is None:
+            break
+        if row_format is not None:
+            batch = [row_format(row) for row in batch]
+
+    if token is not None:
+        token.report(None, "正在保存文件...")
+    wb.save(path)
+    return written
+
+
+def iter_batches(cursor, size=FETCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def export_query(path, query, params=(), headers=None, sheet_title="Sheet1",
+                 token=None, count_query=None, count_params=None, row_format=None):
+    """执行查询并把结果流式写入 Excel，返回导出的行数
+
+    count_query 给出时先统计总行数，用于显示确定进度；否则进度条为不确定模式。
+    headers 缺省时使用游标的列名。
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if token is not None:
+            token.bind_cursor(cursor, conn)
+
+        total = None
+        if count_query is not None:
+            cursor.execute(count_query, params if count_params is None else count_params)
+            total = cursor.fetchone()[0]
+            if total >= EXCEL_MAX_ROWS:
+                raise ExportError(f"共 {total} 行，超过 Excel 最大行数（{EXCEL_MAX_ROWS - 1} 行），请缩小筛选范围")
+
+        cursor.execute(query, params)
+        if headers is None:
+            headers = [column[0] for column in cursor.description]
+        return write_rows(path, headers, iter_batches(cursor), sheet_title, token, total, row_format)
@@ -0,0 +1,332 @@
+# forecast.py
+# 补货参数建议：按出库流水计算每种物料的日消耗序列，用移动平均 / 指数平滑预测日需求，
+# 按提前期与服务水平给出再订货点（库存下限）和最高库存（库存上限），可批量写回 Material。
+#   再订货点 = 日需求 × 提前期 + z × 日需求标准差 × √提前期（z 由服务水平按正态分布求得）
+#   最高库存 = 再订货点 + 日需求 × 补货周期
+# 日消耗序列在数据库中按 (物料, 天) 汇总，之后全部物料一起用 np.bincount 向量化计算，
+# 没有出库的日子记为 0，不展开成 物料 × 天 的稠密矩阵。
+#   python forecast.py --lead-time 7 --service-level 0.95 --output suggestions.csv
+#   python forecast.py --apply                   把建议写入 Material 并重新巡检预警
+import argparse
+import json
+import math
+import time
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+from db_config import db_connection, day_offset
+from alert_engine import sweep_alerts
+from material_cache import invalidate as invalidate_catalog
+from utils import chunked, placeholders
+
+HISTORY_DAYS = 182        # 取最近多少天的出库流水（不含今天）
+MA_WINDOW = 28            # 移动平均窗口（天）
+ALPHA = 0.2               # 指数平滑系数
+LEAD_TIME_DAYS = 7        # 补货提前期（天）
+SERVICE_LEVEL = 0.95      # 提前期内不缺货的概率
+COVER_DAYS = 30           # 补货周期：一次补货覆盖的天数
+FETCH_SIZE = 50000
+
+METHODS = {"ma": "移动平均", "ses": "指数平滑"}
+
+COLUMN_LABELS = {
+    "material_id": "物料ID",
+    "material_name": "物料名称",
+    "supplier": "供应商",
+    "current_quantity": "当前库存",
+    "active_days": "出库天数",
+    "total_out": "出库总量",
+    "mean_daily": "日均出库",
+    "ma_daily": "移动平均",
+    "ses_daily": "指数平滑",
+    "forecast_daily": "预测日需求",
+    "std_daily": "日需求标准差",
+    "days_of_cover": "可用天数",
+    "min_quantity": "当前下限",
+    "suggested_min": "建议下限",
+    "max_quantity": "当前上限",
+    "suggested_max": "建议上限",
+}
+
+
+class ForecastError(Exception):
+    """参数无效、缺少依赖或没有可用的出库流水"""
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ForecastError("补货建议需要 numpy 和 pandas：pip install numpy pandas")
+    return np
+
+
+def _pandas():
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ForecastError("补货建议需要 numpy 和 pandas：pip install numpy pandas")
+    return pd
+
+
+def load_daily_demand(history_days=HISTORY_DAYS, end=None, token=None):
+    """读取 [end − history_days, end) 内每种物料每天的出库量
+
+    end 取其所在日期的零点，默认为今天零点。返回 (start, material_ids, days, quantities)，后三者为等长的 numpy 数组，
+    days 为距 start 的天数；没有出库的 (物料, 天) 不出现。
+    """
+    np = _numpy()
+    end = datetime.combine((end or datetime.now()).date(), datetime.min.time())
+    start = end - timedelta(days=history_days)
+    # 先在子查询里算出天数再分组：SQL Server 不允许 GROUP BY 中出现与 SELECT 不同的参数占位
+    query = f"""
+        SELECT material_id, day, SUM(quantity)
+        FROM (
+            SELECT material_id, {day_offset("timestamp")} AS day, quantity
+            FROM InOutRecord
+            WHERE type = '出库' AND timestamp >= ? AND timestamp < ?
+        ) R
+        GROUP BY material_id, day
+    """
+    columns = ([], [], [])
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if token is not None:
+            token.bind_cursor(cursor, conn)
+        cursor.execute(query, (start, start, end))
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+            if token is not None:
+                token.check()
+                token.report(None, f"已读取 {len(columns[0])} 条日出库汇总")
+    return (start,
+            np.asarray(columns[0], dtype=np.int64),
+            np.asarray(columns[1], dtype=np.int64),
+            np.asarray(columns[2], dtype=np.float64))
+
+
+def demand_statistics(material_ids, days, quantities, history_days=HISTORY_DAYS,
+                      window=MA_WINDOW, alpha=ALPHA):
+    """对全部物料同时计算日需求统计，返回 dict（各值为按 ids 排列的数组）
+
+    ids 为有出库的物料；均值、标准差按 history_days 天计（无出库的日子为 0）；
+    移动平均取最后 window 天；指数平滑以全期均值为初值，逐日平滑到最后一天，
+    展开后每天的权重为 α(1−α)^(距最后一天的天数)，可直接按物料加权求和。
+    """
+    np = _numpy()
+    ids, index = np.unique(material_ids, return_inverse=True)
+    n = len(ids)
+    total = np.bincount(index, weights=quantities, minlength=n)
+    squares = np.bincount(index, weights=quantities * quantities, minlength=n)
+    active_days = np.bincount(index, minlength=n)
+
+    mean = total / history_days
+    variance = (squares - history_days * mean * mean) / max(history_days - 1, 1)
+    std = np.sqrt(np.maximum(variance, 0))
+
+    recent = days >= history_days - window
+    ma = np.bincount(index[recent], weights=quantities[recent], minlength=n) / min(window, history_days)
+
+    decay = 1 - alpha
+    weights = alpha * np.power(decay, history_days - 1 - days)
+    ses = np.bincount(index, weights=quantities * weights, minlength=n) + decay ** history_days * mean
+
+    return {"ids": ids, "active_days": active_days, "total": total, "mean": mean, "std": std,
+            "ma": ma, "ses": ses}
+
+
+def reorder_levels(demand, std, lead_time=LEAD_TIME_DAYS, service_level=SERVICE_LEVEL, cover_days=COVER_DAYS):
+    """再订货点与最高库存（向上取整），返回 (下限数组, 上限数组)"""
+    np = _numpy()
+    z = NormalDist().inv_cdf(service_level)
+    reorder_point = np.ceil(demand * lead_time + z * std * math.sqrt(lead_time))
+    max_level = np.maximum(np.ceil(reorder_point + demand * cover_days), reorder_point)
+    return reorder_point.astype(np.int64), max_level.astype(np.int64)
+
+
+def _check_parameters(history_days, window, alpha, lead_time, service_level, cover_days, method):
+    if method not in METHODS:
+        raise ForecastError(f"未知的预测方法：{method}")
+    if history_days < 2 or not 1 <= window <= history_days:
+        raise ForecastError("历史天数至少为 2，移动平均窗口须在 1 与历史天数之间")
+    if not 0 < alpha <= 1:
+        raise ForecastError("平滑系数须在 (0, 1] 之间")
+    if lead_time <= 0 or cover_days < 0:
+        raise ForecastError("提前期须大于 0，补货周期不能为负")
+    if not 0.5 <= service_level < 1:
+        raise ForecastError("服务水平须在 [0.5, 1) 之间")
+
+
+def suggest(method="ses", history_days=HISTORY_DAYS, window=MA_WINDOW, alpha=ALPHA, lead_time=LEAD_TIME_DAYS,
+            service_level=SERVICE_LEVEL, cover_days=COVER_DAYS, end=None, token=None):
+    """计算全部有出库物料的补货参数建议
+
+    返回 (suggestions, summary)：suggestions 为 DataFrame，列见 COLUMN_LABELS，另有 changed 列
+    表示建议与当前上下限不同；按当前库存可用天数升序（最先缺货的在前）。
+    """
+    _check_parameters(history_days, window, alpha, lead_time, service_level, cover_days, method)
+    np = _numpy()
+    pd = _pandas()
+    load_start = time.perf_counter()
+    start, material_ids, days, quantities = load_daily_demand(history_days, end, token)
+    if not len(material_ids):
+        raise ForecastError("所选历史范围内没有出库记录")
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT M.material_id, M.material_name, M.supplier, M.min_quantity, M.max_quantity,
+                   COALESCE(I.current_quantity, 0)
+            FROM Material M
+            LEFT JOIN Inventory I ON I.material_id = M.material_id
+        """)
+        materials = pd.DataFrame.from_records(
+            [tuple(r) for r in cursor.fetchall()],
+            columns=["material_id", "material_name", "supplier", "min_quantity", "max_quantity", "current_quantity"]
+        )
+    compute_start = time.perf_counter()
+    if token is not None:
+        token.check()
+        token.report(None, "正在计算补货建议...")
+
+    stats = demand_statistics(material_ids, days, quantities, history_days, window, alpha)
+    forecast = stats[method]
+    suggested_min, suggested_max = reorder_levels(forecast, stats["std"], lead_time, service_level, cover_days)
+    result = pd.DataFrame({
+        "material_id": stats["ids"],
+        "active_days": stats["active_days"],
+        "total_out": stats["total"].astype(np.int64),
+        "mean_daily": stats["mean"],
+        "ma_daily": stats["ma"],
+        "ses_daily": stats["ses"],
+        "forecast_daily": forecast,
+        "std_daily": stats["std"],
+        "suggested_min": suggested_min,
+        "suggested_max": suggested_max,
+    })
+    # 内连接：统计期内有出库、之后被删除的物料不再给出建议
+    result = materials.merge(result, on="material_id", how="inner")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["days_of_cover"] = np.where(result["forecast_daily"] > 0,
+                                           result["current_quantity"] / result["forecast_daily"], np.inf)
+    result["changed"] = ((result["min_quantity"] != result["suggested_min"])
+                         | (result["max_quantity"] != result["suggested_max"]))
+    result = result.sort_values(["days_of_cover", "material_id"], ignore_index=True)
+
+    summary = {
+        "start": start,
+        "end": start + timedelta(days=history_days),
+        "method": method,
+        "lead_time": lead_time,
+        "service_level": service_level,
+        "z": round(NormalDist().inv_cdf(service_level), 4),
+        "materials": len(result),
+        "no_demand": len(materials) - len(result),
+        "changed": int(result["changed"].sum()),
+        "below_suggested_min": int((result["current_quantity"] < result["suggested_min"]).sum()),
+        "daily_rows": len(material_ids),
+        "load_seconds": round(compute_start - load_start, 3),
+        "compute_seconds": round(time.perf_counter() - compute_start, 3),
+    }
+    return result, summary
+
+
+def apply_suggestions(rows):
+    """把 [(material_id, 原下限, 原上限, 新下限, 新上限)] 批量写入 Material，并在同一事务中全量巡检预警
+
+    更新时以计算建议时读到的上下限为条件，期间在物料管理中被手工改过的物料跳过，不覆盖手工修改
+    （修改时间由触发器维护，物料目录缓存据此增量刷新）。
+    返回 {"updated": 实际修改的物料数, "skipped": 跳过的物料数, "resolved": 关闭的预警数, "raised": 新建的预警数}。
+    """
+    params = []
+    for material_id, old_low, old_high, low, high in rows:
+        low, high = int(low), int(high)
+        if low < 0 or high < low:
+            raise ForecastError(f"物料 {material_id} 的上下限无效：{low} ~ {high}")
+        params.append((low, high, int(material_id), int(old_low), int(old_high)))
+    if not params:
+        return {"updated": 0, "skipped": 0, "resolved": 0, "raised": 0}
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+        cursor.executemany("""
+            UPDATE Material SET min_quantity = ?, max_quantity = ?
+            WHERE material_id = ? AND min_quantity = ? AND max_quantity = ?
+        """, params)
+        updated = cursor.rowcount
+        if updated < 0:
+            # pyodbc 的 executemany 不返回影响行数，回读上下限，未变成建议值的即为跳过
+            updated = _count_applied(cursor, params)
+        # 改动的物料可能成千上万，用集合语句的全量巡检代替逐批 evaluate_alerts
+        resolved, raised = sweep_alerts(cursor)
+    invalidate_catalog()
+    return {"updated": updated, "skipped": len(params) - updated, "resolved": resolved, "raised": raised}
+
+
+def _count_applied(cursor, params):
+    wanted = {material_id: (low, high) for low, high, material_id, _, _ in params}
+    applied = 0
+    for ids in chunked(list(wanted)):
+        cursor.execute(f"SELECT material_id, min_quantity, max_quantity FROM Material "
+                       f"WHERE material_id IN ({placeholders(len(ids))})", ids)
+        applied += sum(1 for material_id, low, high in cursor.fetchall() if wanted[material_id] == (low, high))
+    return applied
+
+
+def write_suggestions(suggestions, path):
+    """以 .xlsx 结尾时写 Excel，否则写 CSV（utf-8-sig，Excel 可直接打开）"""
+    columns = [c for c in COLUMN_LABELS if c in suggestions.columns]
+    frame = suggestions[columns].rename(columns=COLUMN_LABELS)
+    if path.endswith(".xlsx"):
+        frame.to_excel(path, sheet_name="补货建议", index=False)
+    else:
+        frame.to_csv(path, index=False, encoding="utf-8-sig", float_format="%.3f")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按出库流水预测需求并建议库存上下限")
+    parser.add_argument("--method", choices=sorted(METHODS), default="ses", help="ma 移动平均 / ses 指数平滑")
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS, help="使用最近多少天的出库流水")
+    parser.add_argument("--window", type=int, default=MA_WINDOW, help="移动平均窗口（天）")
+    parser.add_argument("--alpha", type=float, default=ALPHA, help="指数平滑系数")
+    parser.add_argument("--lead-time", type=float, default=LEAD_TIME_DAYS, help="补货提前期（天）")
+    parser.add_argument("--service-level", type=float, default=SERVICE_LEVEL, help="服务水平，如 0.95")
+    parser.add_argument("--cover-days", type=float, default=COVER_DAYS, help="补货周期（天）")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="统计截止日期（不含），默认今天")
+    parser.add_argument("--output", help="建议明细路径（.csv 或 .xlsx）")
+    parser.add_argument("--apply", action="store_true", help="把建议写入 Material 并重新巡检预警")
+    parser.add_argument("--limit", type=int, default=10, help="在终端列出的建议条数")
+    args = parser.parse_args()
+
+    suggestions, summary = suggest(args.method, args.history_days, args.window, args.alpha, args.lead_time,
+                                   args.service_level, args.cover_days, args.end)
+    if args.output:
+        write_suggestions(suggestions, args.output)
+    if args.apply:
+        apply_start = time.perf_counter()
+        changed = suggestions[suggestions["changed"]]
+        summary["apply"] = apply_suggestions(zip(changed["material_id"], changed["min_quantity"],
+                                                 changed["max_quantity"], changed["suggested_min"],
+                                                 changed["suggested_max"]))
+        summary["apply"]["seconds"] = round(time.perf_counter() - apply_start, 3)
+    print(json.dumps(summary, ensure_ascii=False, default=_json_default), flush=True)
+    for row in suggestions.head(args.limit).itertuples(index=False):
+        print(f"  物料 {row.material_id:>8} {row.material_name}：库存 {row.current_quantity}，"
+              f"日需求 {row.forecast_daily:.2f}，下限 {row.min_quantity} → {row.suggested_min}，"
+              f"上限 {row.max_quantity} → {row.suggested_max}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# forecast_window.py
+# 补货建议：按出库流水预测日需求，预览建议的库存上下限，确认后批量写回物料
+
+import math
+
+import customtkinter as ctk
+from tkinter import messagebox, filedialog
+
+import forecast
+from forecast import COLUMN_LABELS, ForecastError
+from task_runner import run_in_background, BusyBar
+from virtual_table import VirtualTable
+
+DISPLAY_COLUMNS = ("material_id", "material_name", "supplier", "current_quantity", "forecast_daily", "std_daily",
+                   "days_of_cover", "min_quantity", "suggested_min", "max_quantity", "suggested_max")
+
+
+def _format(value):
+    if isinstance(value, float):
+        return "∞" if math.isinf(value) else f"{value:.2f}"
+    return value
+
+
+class ForecastWindow(ctk.CTkToplevel):
+    def __init__(self, master=None, on_applied=None):
+        super().__init__(master)
+        self.title("📈 补货建议")
+        self.geometry("1200x720")
+        self.on_applied = on_applied
+        self.suggestions = None
+        self.all_rows = []
+        self.changed_rows = []
+
+        # 参数
+        param_frame = ctk.CTkFrame(self, corner_radius=8)
+        param_frame.pack(fill="x", padx=15, pady=(15, 5))
+
+        ctk.CTkLabel(param_frame, text="预测方法").pack(side="left", padx=(10, 0))
+        self.method_var = ctk.StringVar(value=forecast.METHODS["ses"])
+        ctk.CTkOptionMenu(param_frame, values=list(forecast.METHODS.values()), variable=self.method_var,
+                          width=110).pack(side="left", padx=5, pady=8)
+        self.entries = {}
+        for key, label, default in (
+            ("history_days", "历史天数", forecast.HISTORY_DAYS),
+            ("lead_time", "提前期(天)", forecast.LEAD_TIME_DAYS),
+            ("service_level", "服务水平", forecast.SERVICE_LEVEL),
+            ("cover_days", "补货周期(天)", forecast.COVER_DAYS),
+        ):
+            ctk.CTkLabel(param_frame, text=label).pack(side="left", padx=(10, 0))
+            entry = ctk.CTkEntry(param_frame, width=60)
+            entry.insert(0, str(default))
+            entry.pack(side="left", padx=5)
+            self.entries[key] = entry
+        ctk.CTkButton(param_frame, text="📊 计算建议", width=110, command=self.run_forecast).pack(side="left", padx=10)
+
+        # 操作
+        action_frame = ctk.CTkFrame(self, corner_radius=8)
+        action_frame.pack(fill="x", padx=15, pady=5)
+
+        self.changed_only = ctk.BooleanVar(value=True)
+        ctk.CTkCheckBox(action_frame, text="只看有变化的物料", variable=self.changed_only,
+                        command=self.show_rows).pack(side="left", padx=10, pady=8)
+        ctk.CTkButton(action_frame, text="✅ 应用全部建议", width=130, fg_color="#28a745",
+                      command=self.apply_all).pack(side="right", padx=5)
+        ctk.CTkButton(action_frame, text="📁 导出", width=90, command=self.export).pack(side="right", padx=5)
+
+        self.busy = BusyBar(self)
+        self.busy.pack(fill="x", padx=15)
+
+        self.summary_label = ctk.CTkLabel(self, text="设置参数后点击“计算建议”", anchor="w", justify="left")
+        self.summary_label.pack(fill="x", padx=20, pady=5)
+
+        labels = [COLUMN_LABELS[c] for c in DISPLAY_COLUMNS]
+        settings = {COLUMN_LABELS[c]: {"width": 240 if c == "material_name" else 100,
+                                       "anchor": "w" if c in ("material_name", "supplier") else "e"}
+                    for c in DISPLAY_COLUMNS}
+        self.table = VirtualTable(self, columns=labels, column_settings=settings)
+        self.table.pack(fill="both", expand=True, padx=15, pady=(0, 15))
+
+    def _parameters(self):
+        try:
+            params = {
+                "history_days": int(self.entries["history_days"].get()),
+                "lead_time": float(self.entries["lead_time"].get()),
+                "service_level": float(self.entries["service_level"].get()),
+                "cover_days": float(self.entries["cover_days"].get()),
+            }
+        except ValueError:
+            raise ForecastError("参数须为数字")
+        method = {label: key for key, label in forecast.METHODS.items()}[self.method_var.get()]
+        params["method"] = method
+        params["window"] = min(forecast.MA_WINDOW, params["history_days"])
+        return params
+
+    def run_forecast(self):
+        try:
+            params = self._parameters()
+        except ForecastError as e:
+            messagebox.showwarning("提示", str(e), parent=self)
+            return
+
+        def work(token):
+            suggestions, summary = forecast.suggest(token=token, **params)
+            token.check()
+            columns = list(DISPLAY_COLUMNS)
+            rows = [[_format(v) for v in record]
+                    for record in suggestions[columns].itertuples(index=False, name=None)]
+            changed = suggestions["changed"].to_numpy()
+            return suggestions, summary, rows, [row for row, flag in zip(rows, changed) if flag]
+
+        def show(result):
+            self.suggestions, summary, self.all_rows, self.changed_rows = result
+            self.summary_label.configure(text=(
+                f"{summary['start']:%Y-%m-%d} 至 {summary['end']:%Y-%m-%d} 的出库，"
+                f"{forecast.METHODS[summary['method']]}，z = {summary['z']}："
+                f"{summary['materials']} 个物料有建议（{summary['no_demand']} 个无出库未列出），"
+                f"{summary['changed']} 个与当前上下限不同，{summary['below_suggested_min']} 个当前库存低于建议下限"
+                f"（读取 {summary['load_seconds']}s，计算 {summary['compute_seconds']}s）"
+            ))
+            self.show_rows()
+
+        def failed(error):
+            if isinstance(error, ForecastError):
+                messagebox.showwarning("提示", str(error), parent=self)
+            else:
+                messagebox.showerror("计算失败", str(error), parent=self)
+
+        run_in_background(self, "forecast", work, show, busy=self.busy, on_error=failed)
+
+    def show_rows(self):
+        self.table.set_rows(self.changed_rows if self.changed_only.get() else self.all_rows)
+
+    def apply_all(self):
+        if self.suggestions is None:
+            messagebox.showwarning("提示", "请先计算建议", parent=self)
+            return
+        changed = self.suggestions[self.suggestions["changed"]]
+        if changed.empty:
+            messagebox.showinfo("提示", "建议与当前上下限一致，无需更新", parent=self)
+            return
+        if not messagebox.askyesno("确认", f"将更新 {len(changed)} 个物料的库存上下限并重新检查预警，是否继续？",
+                                   parent=self):
+            return
+        rows = list(zip(changed["material_id"], changed["min_quantity"], changed["max_quantity"],
+                        changed["suggested_min"], changed["suggested_max"]))
+
+        def done(result):
+            text = f"已更新 {result['updated']} 个物料；预警关闭 {result['resolved']} 条，新增 {result['raised']} 条"
+            if result["skipped"]:
+                text += f"\n{result['skipped']} 个物料的上下限在计算后已被修改，已跳过，未覆盖"
+            messagebox.showinfo("应用成功", text, parent=self)
+            if self.on_applied:
+                self.on_applied()
+            self.run_forecast()
+
+        run_in_background(self, "apply", lambda token: forecast.apply_suggestions(rows), done,
+                          busy=self.busy, error_title="应用失败")
+
+    def export(self):
+        if self.suggestions is None:
+            messagebox.showwarning("提示", "请先计算建议", parent=self)
+            return
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".xlsx",
+                                            filetypes=[("Excel 文件", "*.xlsx"), ("CSV 文件", "*.csv")])
+        if not path:
+            return
+        suggestions = self.suggestions
+        run_in_background(
+            self, "export", lambda token: forecast.write_suggestions(suggestions, path),
+            busy=self.busy, error_title="导出失败",
+            on_success=lambda _: messagebox.showinfo("导出成功", f"已保存到：{path}", parent=self)
+        )
@@ -0,0 +1,535 @@
+# http_api.py
+# 无界面的本地 HTTP 接口（asyncio，仅标准库），供扫码枪、MES 等系统出入库和查询库存：
+#   POST /movements          {"material_id": 1, "user_id": 2, "type": "出库", "quantity": 5, "note": "..."}
+#                            或 {"user_id": 2, "lines": [{"material_id": 1, "type": "in", "quantity": 5}, ...]}（整批成败）
+#   GET  /stock?material_id=1,2,3  或  /stock?keyword=轴承&limit=50
+#   GET  /alerts?resolved=0&material_id=1&limit=100
+#   GET  /records?start=2025-05-01&end=2025-06-01&material_id=1&type=出库&limit=200&cursor=...
+#   GET  /health             连接池与出入库吞吐统计
+#   python http_api.py --host 127.0.0.1 --port 8080 --token secret
+# 数据库操作在有界线程池中执行；短时间内到达的单条出入库请求按用户、按到达顺序分成物料互不相同的批次，
+# 每批调用一次 post_movements，整批失败（如其中一条库存不足）时退回逐条执行，每个请求仍得到自己的结果。
+# 设置了 --token（或 INVENTORY_API_TOKEN）时要求请求头 Authorization: Bearer <token>。
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+import db_config
+from db_config import db_connection, limit_query, datetime_param
+from material_search import search_materials
+from stock_movement import (
+    IN_TYPE, OUT_TYPE, MovementError, InsufficientStockError, BatchValidationError,
+    validate_movement, post_movement, post_movements, movement_stats,
+)
+from utils import chunked, placeholders
+
+HOST = "127.0.0.1"
+PORT = 8080
+API_TOKEN = os.environ.get("INVENTORY_API_TOKEN")
+WORKERS = db_config.POOL_MAX_SIZE      # 线程数不超过连接池大小，避免线程等待连接
+MAX_PENDING = 1000                     # 排队中的数据库任务上限，超过时返回 503
+BATCH_WINDOW_MS = 5                    # 出入库请求的合并等待时间
+BATCH_MAX = 200
+MAX_BODY = 1024 * 1024
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 5000
+
+TYPE_ALIASES = {"in": IN_TYPE, "out": OUT_TYPE, IN_TYPE: IN_TYPE, OUT_TYPE: OUT_TYPE}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+# ---------- 参数解析 ----------
+
+def _int_param(query, name, default=None):
+    values = query.get(name)
+    if not values or values[0] == "":
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise ApiError(400, f"参数 {name} 应为整数")
+
+
+def _id_list(query, name):
+    values = query.get(name)
+    if not values:
+        return None
+    try:
+        return [int(x) for value in values for x in value.split(",") if x.strip()]
+    except ValueError:
+        raise ApiError(400, f"参数 {name} 应为逗号分隔的整数")
+
+
+def _date_param(query, name):
+    values = query.get(name)
+    if not values or values[0] == "":
+        return None
+    try:
+        return datetime.fromisoformat(values[0])
+    except ValueError:
+        raise ApiError(400, f"参数 {name} 应为日期，如 2025-05-01 或 2025-05-01T08:00:00")
+
+
+def _limit(query):
+    return max(1, min(_int_param(query, "limit", DEFAULT_LIMIT), MAX_LIMIT))
+
+
+def _movement_line(item):
+    """把请求中的一条出入库转成 (material_id, 类型, 数量, 备注)，不合法时抛出 MovementError"""
+    if not isinstance(item, dict):
+        raise MovementError("每条出入库应为 JSON 对象")
+    io_type = TYPE_ALIASES.get(str(item.get("type", "")).strip().lower(), item.get("type"))
+    material_id = item.get("material_id")
+    if type(material_id) is not int:  # 排除 true/false 和 1.0
+        raise MovementError("material_id 应为整数")
+    quantity = item.get("quantity")
+    if type(quantity) is not int:  # 不接受 2.9、"5"、true 之类，避免被 int() 悄悄改成别的数量
+        raise MovementError("quantity 应为整数")
+    quantity = validate_movement(material_id, io_type, quantity)
+    return material_id, io_type, quantity, item.get("note")
+
+
+# ---------- 查询（在线程池中执行） ----------
+
+def query_stock(material_ids=None, keyword=None, limit=DEFAULT_LIMIT):
+    """按物料 ID 或关键词（名称/供应商）查询库存，关键词结果按相关度排序"""
+    if keyword:
+        matches = search_materials(keyword, limit=limit, fields=("name", "supplier"))
+        order = [m.material_id for m in matches]
+    else:
+        order = list(dict.fromkeys(material_ids or []))[:limit]
+
+    rows = {}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for ids in chunked(order):
+            cursor.execute(f"""
+                SELECT M.material_id, M.material_name, M.supplier, M.unit, M.min_quantity, M.max_quantity,
+                       I.current_quantity, I.last_updated
+                FROM Material M
+                LEFT JOIN Inventory I ON I.material_id = M.material_id
+                WHERE M.material_id IN ({placeholders(len(ids))})
+            """, ids)
+            for row in cursor.fetchall():
+                rows[row[0]] = {
+                    "material_id": row[0], "material_name": row[1], "supplier": row[2], "unit": row[3],
+                    "min_quantity": row[4], "max_quantity": row[5],
+                    "current_quantity": row[6] if row[6] is not None else 0, "last_updated": row[7],
+                }
+    return [rows[mid] for mid in order if mid in rows]
+
+
+def query_alerts(resolved=0, material_ids=None, limit=DEFAULT_LIMIT):
+    query = """
+        SELECT A.alert_id, A.material_id, M.material_name, A.alert_type, A.current_quantity,
+               A.generated_time, A.is_resolved
+        FROM Alert A
+        JOIN Material M ON A.material_id = M.material_id
+        WHERE 1 = 1
+    """
+    params = []
+    if resolved is not None:
+        query += " AND A.is_resolved = ?"
+        params.append(resolved)
+    if material_ids:
+        if len(material_ids) > 500:
+            raise ApiError(400, "一次最多查询 500 个物料")
+        query += f" AND A.material_id IN ({placeholders(len(material_ids))})"
+        params += material_ids
+    query = limit_query(query + " ORDER BY A.generated_time DESC, A.alert_id DESC", limit)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def query_records(start=None, end=None, material_ids=None, io_type=None, after=None, limit=DEFAULT_LIMIT):
+    """按 (timestamp, record_id) 倒序键集分页，返回 (记录, 下一页游标)"""
+    query = """
+        SELECT r.record_id, r.material_id, m.material_name, r.user_id, u.username, r.type,
+               r.quantity, r.timestamp, r.note
+        FROM InOutRecord r
+        JOIN Material m ON r.material_id = m.material_id
+        JOIN Users u ON r.user_id = u.user_id
+        WHERE 1 = 1
+    """
+    params = []
+    if start is not None:
+        query += " AND r.timestamp >= ?"
+        params.append(start)
+    if end is not None:
+        query += " AND r.timestamp < ?"
+        params.append(end)
+    if io_type is not None:
+        query += " AND r.type = ?"
+        params.append(io_type)
+    if material_ids:
+        if len(material_ids) > 500:
+            raise ApiError(400, "一次最多查询 500 个物料")
+        query += f" AND r.material_id IN ({placeholders(len(material_ids))})"
+        params += material_ids
+    if after is not None:
+        query += f" AND (r.timestamp < {datetime_param()} OR (r.timestamp = {datetime_param()} AND r.record_id < ?))"
+        params += [after[0], after[0], after[1]]
+    query = limit_query(query + " ORDER BY r.timestamp DESC, r.record_id DESC", limit + 1)
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        columns = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        timestamp = last[7] if isinstance(last[7], datetime) else datetime.fromisoformat(str(last[7]))
+        next_cursor = f"{timestamp.isoformat()}|{last[0]}"
+    return [dict(zip(columns, row)) for row in rows], next_cursor
+
+
+def _parse_cursor(text):
+    if not text:
+        return None
+    try:
+        timestamp, record_id = text.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(record_id)
+    except ValueError:
+        raise ApiError(400, "无效的分页游标")
+
+
+# ---------- 出入库合并 ----------
+
+class MovementBatcher:
+    """把短时间内到达的单条出入库合并成批
+
+    同一用户的请求按到达顺序切成若干批，每批内物料互不相同，依次各调用一次 post_movements；
+    这样每条的库存检查和返回的库存数量都只涉及它自己，与单独提交时一致。
+    整批失败时退回逐条 post_movement，每个请求得到与单独提交相同的结果或错误。
+    """
+
+    def __init__(self, server, window_ms=BATCH_WINDOW_MS, max_size=BATCH_MAX):
+        self.server = server
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self._pending = []
+        self._flush_handle = None
+        self.stats = {"requests": 0, "batches": 0, "fallbacks": 0}
+
+    def submit(self, user_id, line):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_id, line, future))
+        self.stats["requests"] += 1
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        by_user = {}
+        for item in pending:
+            by_user.setdefault(item[0], []).append(item)
+        for user_id, items in by_user.items():
+            asyncio.ensure_future(self._post_all(user_id, items))
+
+    @staticmethod
+    def _split(items):
+        """按到达顺序切分，遇到本批已有的物料就另起一批"""
+        groups, seen = [[]], set()
+        for item in items:
+            material_id = item[1][0]
+            if material_id in seen:
+                groups.append([])
+                seen = set()
+            groups[-1].append(item)
+            seen.add(material_id)
+        return groups
+
+    async def _post_all(self, user_id, items):
+        # 同一物料的后一批要看到前一批的结果，所以各批依次执行
+        for group in self._split(items):
+            await self._post(user_id, group)
+
+    async def _post(self, user_id, items):
+        self.stats["batches"] += 1
+        if len(items) > 1:
+            try:
+                quantities = await self.server.run_db(post_movements, user_id, [line for _, line, _ in items])
+            except Exception:
+                self.stats["fallbacks"] += 1
+            else:
+                for _, line, future in items:
+                    if not future.done():
+                        future.set_result(quantities.get(line[0]))
+                return
+
+        # 单条请求或整批失败：按到达顺序逐条执行
+        for _, line, future in items:
+            try:
+                quantity = await self.server.run_db(post_movement, line[0], user_id, line[1], line[2], line[3])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(quantity)
+
+
+# ---------- HTTP 服务 ----------
+
+class ApiServer:
+    def __init__(self, token=API_TOKEN, workers=WORKERS, max_pending=MAX_PENDING, batch_window_ms=BATCH_WINDOW_MS):
+        self.token = token
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-db")
+        self.max_pending = max_pending
+        self.pending = 0
+        self.batcher = MovementBatcher(self, batch_window_ms)
+        self.started = time.monotonic()
+        self.requests = 0
+        self.routes = {
+            ("POST", "/movements"): self.post_movements,
+            ("GET", "/stock"): self.get_stock,
+            ("GET", "/alerts"): self.get_alerts,
+            ("GET", "/records"): self.get_records,
+            ("GET", "/health"): self.get_health,
+        }
+
+    async def run_db(self, fn, *args):
+        """在有界线程池中执行数据库操作，排队过多时拒绝"""
+        if self.pending >= self.max_pending:
+            raise ApiError(503, "服务繁忙，请稍后重试")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    # ----- 路由 -----
+
+    async def post_movements(self, query, body):
+        if not isinstance(body, dict):
+            raise ApiError(400, "请求体应为 JSON 对象")
+        user_id = body.get("user_id")
+        if type(user_id) is not int:
+            raise ApiError(400, "user_id 应为整数")
+
+        if "lines" in body:
+            # 显式批量：整批成功或整批失败
+            if not isinstance(body["lines"], list) or not body["lines"]:
+                raise ApiError(400, "lines 应为非空数组")
+            lines, errors = [], []
+            for index, item in enumerate(body["lines"]):
+                try:
+                    lines.append(_movement_line(item))
+                except MovementError as e:
+                    errors.append((index, str(e)))
+            if errors:
+                raise BatchValidationError(errors)
+            quantities = await self.run_db(post_movements, user_id, lines)
+            return {"quantities": {str(k): v for k, v in quantities.items()}}
+
+        line = _movement_line(body)
+        quantity = await self.batcher.submit(user_id, line)
+        return {"material_id": line[0], "current_quantity": quantity}
+
+    async def get_stock(self, query, body):
+        keyword = (query.get("keyword") or [""])[0].strip()
+        material_ids = _id_list(query, "material_id")
+        if not keyword and not material_ids:
+            raise ApiError(400, "需要 material_id 或 keyword 参数")
+        items = await self.run_db(query_stock, material_ids, keyword, _limit(query))
+        return {"items": items}
+
+    async def get_alerts(self, query, body):
+        resolved = (query.get("resolved") or ["0"])[0]
+        resolved = None if resolved in ("", "all") else _int_param(query, "resolved", 0)
+        items = await self.run_db(query_alerts, resolved, _id_list(query, "material_id"), _limit(query))
+        return {"items": items}
+
+    async def get_records(self, query, body):
+        io_type = (query.get("type") or [None])[0]
+        if io_type is not None:
+            io_type = TYPE_ALIASES.get(io_type.lower(), io_type)
+            if io_type not in (IN_TYPE, OUT_TYPE):
+                raise ApiError(400, "type 应为 入库/出库（或 in/out）")
+        items, next_cursor = await self.run_db(
+            query_records, _date_param(query, "start"), _date_param(query, "end"),
+            _id_list(query, "material_id"), io_type, _parse_cursor((query.get("cursor") or [None])[0]),
+            _limit(query)
+        )
+        return {"items": items, "next_cursor": next_cursor}
+
+    async def get_health(self, query, body):
+        stats = await self.run_db(db_config.pool_stats)
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.monotonic() - self.started, 1),
+            "requests": self.requests,
+            "pending_db_tasks": self.pending,
+            "batching": self.batcher.stats,
+            "pool": stats,
+            "movements": movement_stats(),
+        }
+
+    # ----- 协议 -----
+
+    def _authorized(self, headers):
+        if not self.token:
+            return True
+        supplied = headers.get("authorization", "")
+        return hmac.compare_digest(supplied.encode(), f"Bearer {self.token}".encode())
+
+    async def dispatch(self, method, target, headers, raw_body):
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                raise ApiError(405, f"{url.path} 不支持 {method}")
+            raise ApiError(404, f"未知路径：{url.path}")
+        if not self._authorized(headers):
+            raise ApiError(401, "缺少或错误的访问令牌")
+        body = None
+        if raw_body:
+            try:
+                body = json.loads(raw_body)
+            except ValueError:
+                raise ApiError(400, "请求体不是有效的 JSON")
+        return await handler(parse_qs(url.query), body)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "无效的请求行"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "无效的 Content-Length"}, keep_alive=False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {"error": "请求体过大"}, keep_alive=False)
+                    break
+                raw_body = await reader.readexactly(length) if length else b""
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version.upper() == "HTTP/1.1")
+
+                self.requests += 1
+                status, payload = 200, None
+                try:
+                    payload = await self.dispatch(method.upper(), target, headers, raw_body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": str(e), **e.extra}
+                except BatchValidationError as e:
+                    status, payload = 400, {"error": str(e), "lines": [
+                        {"index": index, "error": message} for index, message in e.errors
+                    ]}
+                except InsufficientStockError as e:
+                    status, payload = 409, {"error": str(e)}
+                except MovementError as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    if type(e).__name__ == "IntegrityError":  # sqlite3 / pyodbc 的约束错误
+                        status, payload = 400, {"error": f"数据约束错误（用户或物料不存在？）：{e}"}
+                    else:
+                        status, payload = 500, {"error": f"服务器错误：{e}"}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        try:
+            body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            status = 500
+            body = json.dumps({"error": f"服务器错误：无法生成响应：{e}"}, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"出入库接口已启动：{addresses}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="出入库与库存查询 HTTP 接口")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--token", default=API_TOKEN, help="访问令牌，默认读取 INVENTORY_API_TOKEN")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="数据库线程数（不超过连接池大小）")
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_MS,
+                        help="单条出入库的合并等待毫秒数，0 表示不等待")
+    args = parser.parse_args()
+
+    server = ApiServer(token=args.token, workers=min(args.workers, db_config.POOL_MAX_SIZE),
+                       batch_window_ms=args.batch_window_ms)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,40 @@ import customtkinter as ctk
 from tkinter import ttk, messagebox, filedialog
 from tkcalendar import DateEntry
 import datetime
-import pandas as pd
-from db_config import get_connection
+from db_config import db_connection, limit_query, datetime_param
+from virtual_table import VirtualTable
+from task_runner import run_in_background, cancel_background, BusyBar
+from excel_export import export_query
+import ui_profiler
 
 class InOutRecordViewer(ctk.CTkToplevel):
+    PAGE_SIZE = 200
+
+    _BASE_QUERY = """
+        SELECT r.record_id, r.type, r.quantity, r.timestamp,
+               m.material_name, u.username, r.note
+        FROM InOutRecord r
+        JOIN Material m ON r.material_id = m.material_id
+        JOIN Users u ON r.user_id = u.user_id
+    """
+    _COUNT_QUERY = """
+        SELECT COUNT(*)
+        FROM InOutRecord r
+        JOIN Material m ON r.material_id = m.material_id
+        JOIN Users u ON r.user_id = u.user_id
+    """
+
     def __init__(self, master=None):
         super().__init__(master)
         self.title("出入库记录查询")
         self.geometry("1200x700")
         ctk.set_appearance_mode("light")
+        self.records = []
+        self._page_starts = [None]
+        self._last_key = None
+        self._has_more = False
+        self._loading_more = False
+        self._total = None
         self._create_widgets()
         self.load_all_records()
 
@@ -107,14 +132,6 @@ class InOutRecordViewer(ctk.CTkToplevel):
         )
         style.map("Treeview", background=[('selected', '#e6e6e6')])
 
-        # 创建表格
-        self.tree = ttk.Treeview(
-            table_container,
-            columns=("ID", "类型", "数量", "时间", "物料名称", "操作用户", "备注"),
-            show="headings",
-            selectmode="browse"
-        )
-
         # 配置列
         columns = {
             "ID": {"width": 80, "anchor": "center"},
@@ -126,21 +143,26 @@ class InOutRecordViewer(ctk.CTkToplevel):
             "备注": {"width": 300, "anchor": "w"}
         }
 
-        for col, settings in columns.items():
-            self.tree.heading(col, text=col)
-            self.tree.column(col, **settings)
-
-        # 滚动条
-        vsb = ttk.Scrollbar(table_container, orient="vertical", command=self.tree.yview)
-        hsb = ttk.Scrollbar(table_container, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
-        # 布局
-        self.tree.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
-        hsb.grid(row=1, column=0, sticky="ew")
-        table_container.grid_rowconfigure(0, weight=1)
-        table_container.grid_columnconfigure(0, weight=1)
+        # 创建虚拟化表格，滚动到底部时自动追加下一批记录（无限滚动）
+        self.tree = VirtualTable(
+            table_container,
+            columns=columns.keys(),
+            column_settings=columns,
+            on_scroll_end=self._on_scroll_end
+        )
+        self.tree.pack(fill="both", expand=True)
+
+        # 分页栏
+        page_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        page_frame.pack(fill="x", padx=10)
+        ctk.CTkButton(page_frame, text="◀ 上一页", width=90, command=self.prev_page).pack(side="left", padx=5)
+        ctk.CTkButton(page_frame, text="下一页 ▶", width=90, command=self.next_page).pack(side="left", padx=5)
+        ctk.CTkButton(page_frame, text="统计总数", width=90, fg_color="#666666",
+                      command=self.count_records).pack(side="left", padx=5)
+        self.page_label = ctk.CTkLabel(page_frame, text="")
+        self.page_label.pack(side="left", padx=10)
+        self.busy = BusyBar(page_frame)
+        self.busy.pack(side="left", padx=5, fill="x", expand=True)
 
         # 导出按钮
         ctk.CTkButton(
@@ -158,95 +180,165 @@ class InOutRecordViewer(ctk.CTkToplevel):
         return str(timestamp)
 
     def load_all_records(self):
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            query = """
-                SELECT r.record_id, r.type, r.quantity, r.timestamp, 
-                       m.material_name, u.username, r.note
-                FROM InOutRecord r
-                JOIN Material m ON r.material_id = m.material_id
-                JOIN Users u ON r.user_id = u.user_id
-                ORDER BY r.timestamp DESC
-            """
-            cursor.execute(query)
-            raw_records = cursor.fetchall()
-            
+        """清空筛选条件，从最新记录开始分页加载"""
+        self._filter_sql = ""
+        self._filter_params = []
+        self._load_first_page()
+
+    def _load_first_page(self):
+        self._page_starts = [None]  # 每一页起点之前那一行的键，第一页为 None
+        self._total = None
+        cancel_background(self, "count")  # 筛选条件已变，丢弃尚未返回的旧统计
+        self._show_page(None)
+
+    def _fetch_rows(self, after_key):
+        """按 (timestamp, record_id) 键集分页取下一批，after_key 为上一批最后一行的键
+
+        在主线程中拼好查询，返回在后台执行的任务函数，结果为 (rows, last_key, has_more)
+        """
+        query = self._BASE_QUERY + " WHERE 1 = 1" + self._filter_sql
+        params = list(self._filter_params)
+        if after_key is not None:
+            # 键取自上一页读出的 DATETIME，同一时间的记录要能与之相等，否则翻页时会被跳过
+            query += f" AND (r.timestamp < {datetime_param()} OR (r.timestamp = {datetime_param()} AND r.record_id < ?))"
+            params += [after_key[0], after_key[0], after_key[1]]
+        query = limit_query(query + " ORDER BY r.timestamp DESC, r.record_id DESC", self.PAGE_SIZE + 1)
+
+        def work(token):
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                token.bind_cursor(cursor, conn)
+                cursor.execute(query, params)
+                raw_records = cursor.fetchall()
+
+            has_more = len(raw_records) > self.PAGE_SIZE
+            raw_records = raw_records[:self.PAGE_SIZE]
+            last_key = (raw_records[-1][3], raw_records[-1][0]) if raw_records else after_key
+
             # 格式化时间字段
-            self.records = []
-            for row in raw_records:
-                formatted_row = list(row)
-                formatted_row[3] = self._format_time(formatted_row[3])
-                self.records.append(formatted_row)
-            
+            rows = []
+            with ui_profiler.phase(ui_profiler.TRANSFORM, rows=len(raw_records)):
+                for row in raw_records:
+                    formatted_row = list(row)
+                    formatted_row[3] = self._format_time(formatted_row[3])
+                    rows.append(formatted_row)
+            return rows, last_key, has_more
+
+        return work
+
+    def _show_page(self, after_key):
+        def show(result):
+            rows, self._last_key, self._has_more = result
+            self.records = rows
             self.refresh_table()
-        except Exception as e:
+            self._update_page_label()
+
+        # 翻页与追加共用同一任务名，新的翻页请求会取代尚未返回的追加
+        self._loading_more = False
+        run_in_background(
+            self, "page", self._fetch_rows(after_key), show, busy=self.busy,
+            on_error=lambda e: messagebox.showerror("数据库错误", f"加载失败：{str(e)}")
+        )
+
+    def next_page(self):
+        if not self._has_more:
+            return
+        self._page_starts.append(self._last_key)
+        self._show_page(self._last_key)
+
+    def prev_page(self):
+        if len(self._page_starts) <= 1:
+            return
+        self._page_starts.pop()
+        self._show_page(self._page_starts[-1])
+
+    def _on_scroll_end(self):
+        if self._has_more and not self._loading_more:
+            self._loading_more = True
+            self._append_more()
+
+    def _append_more(self):
+        def append(result):
+            rows, self._last_key, self._has_more = result
+            self._loading_more = False
+            # 表格直接使用 self.records 作为后台存储，追加一次即可
+            self.tree.append_rows(rows)
+            self._update_page_label()
+
+        def failed(e):
+            self._loading_more = False
             messagebox.showerror("数据库错误", f"加载失败：{str(e)}")
-        finally:
-            if conn:
-                conn.close()
+
+        run_in_background(self, "page", self._fetch_rows(self._last_key), append,
+                          busy=self.busy, on_error=failed)
+
+    def count_records(self):
+        """按需统计当前筛选条件下的总条数（结果缓存到筛选条件变化为止）"""
+        if self._total is not None:
+            self._update_page_label()
+            return
+
+        query = self._COUNT_QUERY + " WHERE 1 = 1" + self._filter_sql
+        params = list(self._filter_params)
+
+        def work(token):
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                token.bind_cursor(cursor, conn)
+                cursor.execute(query, params)
+                return cursor.fetchone()[0]
+
+        def show(total):
+            self._total = total
+            self._update_page_label()
+
+        run_in_background(
+            self, "count", work, show, busy=self.busy,
+            on_error=lambda e: messagebox.showerror("数据库错误", f"统计失败：{str(e)}")
+        )
+
+    def _update_page_label(self):
+        total = "点击统计" if self._total is None else f"{self._total} 条"
+        more = "，滚动到底部继续加载" if self._has_more else ""
+        self.page_label.configure(
+            text=f"第 {len(self._page_starts)} 页，已加载 {len(self.records)} 条{more}（共 {total}）"
+        )
 
     def refresh_table(self):
-        self.tree.delete(*self.tree.get_children())
-        for row in self.records:
-            self.tree.insert("", "end", values=row)
+        self.tree.set_rows(self.records)
 
     def filter_records(self): 
-        conn = None  # 初始化以确保 finally 块能关闭连接
         try:
-            # 确保是 datetime.datetime 类型
+            # 左闭右开区间 [起始日 00:00, 结束日次日 00:00)，可以走 timestamp 索引
             start = datetime.datetime.combine(self.start_date.get_date(), datetime.time.min)
-            end = datetime.datetime.combine(self.end_date.get_date(), datetime.time.max)
+            end = datetime.datetime.combine(self.end_date.get_date() + datetime.timedelta(days=1), datetime.time.min)
         
             type_val = self.type_filter.get().strip()
             mat = self.material_entry.get().strip()
             usr = self.user_entry.get().strip()
 
-            query = """
-                SELECT r.record_id, r.type, r.quantity, r.timestamp, 
-                       m.material_name, u.username, r.note
-                FROM InOutRecord r
-                JOIN Material m ON r.material_id = m.material_id
-                JOIN Users u ON r.user_id = u.user_id
-                WHERE r.timestamp BETWEEN ? AND ?
-            """
+            filter_sql = " AND r.timestamp >= ? AND r.timestamp < ?"
             params = [start, end]
 
             if type_val and type_val != "全部":
-                query += " AND r.type = ?"
+                filter_sql += " AND r.type = ?"
                 params.append(type_val)
 
             if mat:
-                query += " AND m.material_name LIKE ?"
+                filter_sql += " AND m.material_name LIKE ?"
                 params.append(f"%{mat}%")
 
             if usr:
-                query += " AND u.username LIKE ?"
+                filter_sql += " AND u.username LIKE ?"
                 params.append(f"%{usr}%")
 
-            conn = get_connection()
-            if not conn:
-                raise Exception("数据库连接失败，请检查配置。")
-
-            cursor = conn.cursor()
-            cursor.execute(query + " ORDER BY r.timestamp DESC", params)
-            raw_records = cursor.fetchall()
-        
-            # 格式化时间字段
-            self.records = []
-            for row in raw_records:
-                formatted_row = list(row)
-                formatted_row[3] = self._format_time(formatted_row[3])  # 格式化 timestamp
-                self.records.append(formatted_row)
-
-            self.refresh_table()
-
         except Exception as e:
             messagebox.showerror("筛选失败", f"错误原因：{str(e)}")
+            return
 
-        finally:
-            if conn:
-                conn.close()
+        self._filter_sql = filter_sql
+        self._filter_params = params
+        self._load_first_page()
 
     def export_excel(self):
         if not self.records:
@@ -262,27 +354,21 @@ class InOutRecordViewer(ctk.CTkToplevel):
         if not filepath:
             return
 
-        try:
-            df = pd.DataFrame(
-                self.records,
-                columns=["ID", "类型", "数量", "时间", "物料名称", "操作用户", "备注"]
+        # 导出当前筛选条件下的全部记录（不只是已加载的几页），从游标流式写入
+        where = " WHERE 1 = 1" + self._filter_sql
+        query = self._BASE_QUERY + where + " ORDER BY r.timestamp DESC, r.record_id DESC"
+        count_query = self._COUNT_QUERY + where
+        params = list(self._filter_params)
+
+        def work(token):
+            return export_query(
+                filepath, query, params,
+                ["ID", "类型", "数量", "时间", "物料名称", "操作用户", "备注"], "出入库记录",
+                token=token, count_query=count_query
             )
-            
-            # 调整Excel列宽
-            writer = pd.ExcelWriter(filepath, engine='xlsxwriter')
-            df.to_excel(writer, index=False, sheet_name='出入库记录')
-            
-            worksheet = writer.sheets['出入库记录']
-            worksheet.set_column('A:A', 8)   # ID
-            worksheet.set_column('B:B', 10)  # 类型
-            worksheet.set_column('C:C', 10)  # 数量
-            worksheet.set_column('D:D', 20)  # 时间
-            worksheet.set_column('E:E', 25)  # 物料名称
-            worksheet.set_column('F:F', 15)  # 操作用户
-            worksheet.set_column('G:G', 40)  # 备注
-            
-            writer.close()
-            messagebox.showinfo("导出成功", f"文件已保存至：\n{filepath}")
-            
-        except Exception as e:
-            messagebox.showerror("导出失败", f"发生错误：{str(e)}")
\ No newline at end of file
+
+        run_in_background(
+            self, "export", work, busy=self.busy,
+            on_success=lambda n: messagebox.showinfo("导出成功", f"共 {n} 条记录，文件已保存至：\n{filepath}"),
+            on_error=lambda e: messagebox.showerror("导出失败", f"发生错误：{str(e)}")
+        )
@@ -1,8 +1,10 @@
 # inventory_alert.py
 
 import customtkinter as ctk
-from tkinter import ttk, messagebox
-from db_config import get_connection
+from tkinter import messagebox
+from db_config import db_connection
+from virtual_table import VirtualTable
+from task_runner import run_in_background, BusyBar
 
 class InventoryAlertWindow(ctk.CTkToplevel):
     def __init__(self, master=None):  # 添加 master 参数
@@ -11,11 +13,9 @@ class InventoryAlertWindow(ctk.CTkToplevel):
         self.geometry("800x500")
 
         # 表格区域
-        self.table = ttk.Treeview(
-            self, columns=("物料名称", "预警类型", "当前库存", "生成时间", "是否已处理"), show="headings"
+        self.table = VirtualTable(
+            self, columns=("物料名称", "预警类型", "当前库存", "生成时间", "是否已处理")
         )
-        for col in self.table["columns"]:
-            self.table.heading(col, text=col)
         self.table.pack(padx=10, pady=10, fill="both", expand=True)
 
         # 操作按钮区域
@@ -25,58 +25,62 @@ class InventoryAlertWindow(ctk.CTkToplevel):
         ctk.CTkButton(btn_frame, text="🔄 刷新", command=self.load_alerts).pack(side="left", padx=10)
         ctk.CTkButton(btn_frame, text="✅ 标记为已处理", command=self.mark_as_resolved).pack(side="left", padx=10)
 
+        self.busy = BusyBar(btn_frame)
+        self.busy.pack(side="left", padx=10)
+
         self.load_alerts()
 
     def load_alerts(self):
-        for row in self.table.get_children():
-            self.table.delete(row)
-
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            query = """
-                SELECT A.alert_id, M.material_name, A.alert_type, A.current_quantity,
-                       A.generated_time, A.is_resolved
-                FROM Alert A
-                JOIN Material M ON A.material_id = M.material_id
-                ORDER BY A.generated_time DESC
-            """
-            cursor.execute(query)
-
-            self.alerts = []  # 用于存储 alert_id 对应行
-            for row in cursor.fetchall():
-                alert_id, name, alert_type, quantity, time, resolved = row
-                self.alerts.append(alert_id)
-                resolved_text = "是" if resolved else "否"
-                self.table.insert("", "end", values=(name, alert_type, quantity, time, resolved_text))
-
-        except Exception as e:
-            messagebox.showerror("加载失败", f"数据库错误：{e}")
-        finally:
-            if conn:
-                conn.close()
+        def work(token):
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                token.bind_cursor(cursor, conn)
+
+                query = """
+                    SELECT A.alert_id, M.material_name, A.alert_type, A.current_quantity,
+                           A.generated_time, A.is_resolved
+                    FROM Alert A
+                    JOIN Material M ON A.material_id = M.material_id
+                    ORDER BY A.generated_time DESC
+                """
+                cursor.execute(query)
+
+                alerts = []  # 用于存储 alert_id 对应行
+                rows = []
+                for row in cursor.fetchall():
+                    alert_id, name, alert_type, quantity, time, resolved = row
+                    alerts.append(alert_id)
+                    resolved_text = "是" if resolved else "否"
+                    rows.append((name, alert_type, quantity, time, resolved_text))
+            return alerts, rows
+
+        def show(result):
+            self.alerts, rows = result
+            self.table.set_rows(rows)
+
+        run_in_background(
+            self, "load", work, show, busy=self.busy,
+            on_error=lambda e: messagebox.showerror("加载失败", f"数据库错误：{e}")
+        )
 
     def mark_as_resolved(self):
-        selected = self.table.selection()
-        if not selected:
+        index = self.table.selected_index()
+        if index is None:
             messagebox.showwarning("提示", "请先选择一条预警记录")
             return
 
-        try:
-            index = self.table.index(selected[0])
-            alert_id = self.alerts[index]
+        alert_id = self.alerts[index]
 
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE Alert SET is_resolved = 1 WHERE alert_id = ?", (alert_id,))
-            conn.commit()
+        def work(token):
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE Alert SET is_resolved = 1 WHERE alert_id = ?", (alert_id,))
 
+        def done(_):
             messagebox.showinfo("已处理", "预警已标记为处理")
             self.load_alerts()
 
-        except Exception as e:
-            messagebox.showerror("处理失败", f"数据库错误：{e}")
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
+        run_in_background(
+            self, "resolve", work, done,
+            on_error=lambda e: messagebox.showerror("处理失败", f"数据库错误：{e}")
+        )
@@ -2,10 +2,15 @@
 
 import customtkinter as ctk
 from tkinter import ttk, messagebox, filedialog
-from db_config import get_connection
+from db_config import db_connection
 from datetime import datetime
-import openpyxl
-from utils import check_alert
+from alert_engine import evaluate_alerts
+from virtual_table import VirtualTable
+from task_runner import run_in_background, BusyBar
+from excel_export import export_query
+from material_cache import get_catalog
+from live_search import LiveSearch
+import ui_profiler
 
 class InventoryCheckWindow(ctk.CTkToplevel):
     def __init__(self, user_id, master=None):
@@ -49,6 +54,22 @@ class InventoryCheckWindow(ctk.CTkToplevel):
             command=self.add_check_window
         ).pack(side="left", padx=5)
 
+        ctk.CTkButton(
+            button_frame,
+            text="📋 批量盘点",
+            width=120,
+            height=35,
+            command=self.open_stocktake
+        ).pack(side="left", padx=5)
+
+        ctk.CTkButton(
+            button_frame,
+            text="📈 差异分析",
+            width=120,
+            height=35,
+            command=self.open_variance_report
+        ).pack(side="left", padx=5)
+
         ctk.CTkButton(
             button_frame,
             text="导出Excel",
@@ -57,24 +78,14 @@ class InventoryCheckWindow(ctk.CTkToplevel):
             command=self.export_to_excel
         ).pack(side="right", padx=5)
 
+        # 后台任务进度与取消
+        self.busy = BusyBar(button_frame)
+        self.busy.pack(side="left", padx=5, fill="x", expand=True)
+
         # 表格容器
         table_container = ctk.CTkFrame(self, corner_radius=8)
         table_container.pack(padx=15, pady=(0, 15), fill="both", expand=True)
 
-        # 表格配置
-        columns = ("物料名称", "实际数量", "系统数量", "调整人", "盘点时间")
-        self.table = ttk.Treeview(
-            table_container,
-            columns=columns,
-            show="headings",
-            selectmode="browse"
-        )
-
-        # 滚动条
-        vsb = ttk.Scrollbar(table_container, orient="vertical", command=self.table.yview)
-        hsb = ttk.Scrollbar(table_container, orient="horizontal", command=self.table.xview)
-        self.table.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
         # 表格样式
         style = ttk.Style()
         style.theme_use("default")
@@ -93,6 +104,7 @@ class InventoryCheckWindow(ctk.CTkToplevel):
         style.map("Treeview", background=[('selected', '#e6e6e6')])
 
         # 列配置
+        columns = ("物料名称", "实际数量", "系统数量", "调整人", "盘点时间")
         column_settings = {
             "物料名称": {"width": 280, "anchor": "w"},
             "实际数量": {"width": 120, "anchor": "e"},
@@ -101,59 +113,56 @@ class InventoryCheckWindow(ctk.CTkToplevel):
             "盘点时间": {"width": 200, "anchor": "w"}
         }
 
-        for col in columns:
-            self.table.heading(col, text=col)
-            self.table.column(col, **column_settings.get(col, {}))
+        # 虚拟化表格（自带滚动条，只渲染可见行）
+        self.table = VirtualTable(table_container, columns=columns, column_settings=column_settings)
+        self.table.pack(fill="both", expand=True)
 
-        # 布局
-        self.table.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
-        hsb.grid(row=1, column=0, sticky="ew")
-        table_container.grid_rowconfigure(0, weight=1)
-        table_container.grid_columnconfigure(0, weight=1)
-
-        self.load_records()
+        # 边输入边搜索，按物料名称本地细化缓存结果
+        self.live_search = LiveSearch(
+            self, search_entry, self._fetch_records, self.table.set_rows,
+            match=lambda row, kw: kw in row[0].casefold(),
+            busy=self.busy, on_error=lambda e: messagebox.showerror("错误", f"查询失败：{e}")
+        )
+        self.live_search.search_now()
+
+    def _build_query(self, keyword):
+        """按搜索条件拼出查询，加载与导出共用"""
+        query = """
+            SELECT M.material_name, C.real_quantity, C.recorded_quantity,
+                   U.username, C.check_time
+            FROM InventoryCheck C
+            JOIN Material M ON C.material_id = M.material_id
+            JOIN Users U ON C.adjusted_by_user = U.user_id
+        """
+        params = ()
+
+        if keyword:
+            query += " WHERE M.material_name LIKE ?"
+            params = (f"%{keyword}%",)
+        return query, params
 
     def load_records(self):
-        keyword = self.search_var.get()
-        for row in self.table.get_children():
-            self.table.delete(row)
+        """搜索按钮：重新查库，不使用缓存的结果"""
+        self.live_search.search_now(refresh=True)
 
-        try:
-            conn = get_connection()
+    def _fetch_records(self, keyword, token):
+        query, params = self._build_query(keyword)
+        with db_connection() as conn:
             cursor = conn.cursor()
-
-            query = """
-                SELECT M.material_name, C.real_quantity, C.recorded_quantity,
-                       U.username, C.check_time
-                FROM InventoryCheck C
-                JOIN Material M ON C.material_id = M.material_id
-                JOIN Users U ON C.adjusted_by_user = U.user_id
-                WHERE M.material_name LIKE ?
-            """ if keyword else """
-                SELECT M.material_name, C.real_quantity, C.recorded_quantity,
-                       U.username, C.check_time
-                FROM InventoryCheck C
-                JOIN Material M ON C.material_id = M.material_id
-                JOIN Users U ON C.adjusted_by_user = U.user_id
-            """
-
-            params = (f"%{keyword}%",) if keyword else ()
-
+            token.bind_cursor(cursor, conn)
             cursor.execute(query, params)
+            results = cursor.fetchall()
 
-            for row in cursor.fetchall():
+        rows = []
+        with ui_profiler.phase(ui_profiler.TRANSFORM, rows=len(results)):
+            for row in results:
+                token.check()
                 formatted_row = list(row)
                 # 格式化时间
                 if isinstance(formatted_row[4], datetime):
                     formatted_row[4] = formatted_row[4].strftime("%Y-%m-%d %H:%M:%S")
-                self.table.insert("", "end", values=formatted_row)
-
-        except Exception as e:
-            messagebox.showerror("错误", f"查询失败：{e}")
-        finally:
-            if conn:
-                conn.close()
+                rows.append(tuple(formatted_row))
+        return rows
 
     def export_to_excel(self):
         file_path = filedialog.asksaveasfilename(
@@ -165,37 +174,28 @@ class InventoryCheckWindow(ctk.CTkToplevel):
         if not file_path:
             return
 
-        try:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "盘点记录"
-
-            # 写入标题
-            headers = [self.table.heading(col)["text"] for col in self.table["columns"]]
-            ws.append(headers)
-
-            # 写入数据
-            for item in self.table.get_children():
-                row_data = self.table.item(item)["values"]
-                ws.append(row_data)
-
-            # 自动调整列宽
-            for col in ws.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2) * 1.2
-                ws.column_dimensions[column].width = adjusted_width
-
-            wb.save(file_path)
-            messagebox.showinfo("导出成功", f"文件已保存至：\n{file_path}")
-
-        except Exception as e:
-            messagebox.showerror("导出失败", f"错误原因：{e}")
+        # 直接从数据库流式导出，不经过表格数据
+        query, params = self._build_query(self.search_var.get().strip())
+        headers = list(self.table.columns)
+
+        def work(token):
+            export_query(file_path, query, params, headers, "盘点记录", token=token)
+            return file_path
+
+        run_in_background(
+            self, "export", work, busy=self.busy,
+            on_success=lambda path: messagebox.showinfo("导出成功", f"文件已保存至：\n{path}"),
+            on_error=lambda e: messagebox.showerror("导出失败", f"错误原因：{e}")
+        )
+
+    def open_stocktake(self):
+        from stocktake_window import StocktakeWindow  # 只在打开批量盘点时才加载
+        StocktakeWindow(self.user_id, master=self,
+                        on_applied=lambda: self.live_search.search_now(refresh=True))
+
+    def open_variance_report(self):
+        from variance_report_window import VarianceReportWindow  # 只在打开差异分析时才加载
+        VarianceReportWindow(master=self)
 
     def add_check_window(self):
         top = ctk.CTkToplevel(self)
@@ -213,74 +213,79 @@ class InventoryCheckWindow(ctk.CTkToplevel):
 
         def save_check():
             name = material_var.get()
-            real = real_entry.get()
-
             try:
-                real = int(real)
-                conn = get_connection()
-                cursor = conn.cursor()
-
-                # 获取物料ID
-                cursor.execute("SELECT material_id FROM Material WHERE material_name=?", (name,))
-                row = cursor.fetchone()
-                if not row:
-                    messagebox.showerror("错误", "未找到该物料")
-                    return
-                material_id = row[0]
-
-                # 获取当前库存（新增事务开始）
-                cursor.execute("SELECT current_quantity FROM Inventory WHERE material_id=?", (material_id,))
-                row = cursor.fetchone()
-                if not row:
-                    messagebox.showerror("错误", "库存中无该物料")
-                    return
-                recorded = row[0]
-
-                # 更新库存表（新增逻辑）
-                cursor.execute("""
-                    UPDATE Inventory 
-                    SET current_quantity = ?, 
-                        last_updated = GETDATE() 
-                    WHERE material_id = ?
-                """, (real, material_id))
-
-                # 插入盘点记录
-                cursor.execute(
-                    "INSERT INTO InventoryCheck (material_id, real_quantity, recorded_quantity, adjusted_by_user) VALUES (?, ?, ?, ?)",
-                    (material_id, real, recorded, self.user_id)
-                )
-
-                conn.commit()
-            
-                # 触发预警检查
-                try:
-                    check_alert(material_id)
-                except Exception as alert_error:
-                    print(f"预警检查时发生错误: {alert_error}")
-
-                messagebox.showinfo("成功", "盘点记录已添加并更新库存")
-                top.destroy()
-                self.load_records()
-
+                real = int(real_entry.get())
             except ValueError:
                 messagebox.showerror("错误", "请输入有效的实际数量")
-            except Exception as e:
-                conn.rollback()  # 新增回滚操作
-                messagebox.showerror("错误", f"保存失败：{e}")
-            finally:
-                if conn:
-                    conn.close()
-
-        # 获取物料名称
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT material_name FROM Material")
-            material_box.configure(values=[row[0] for row in cursor.fetchall()])
-        except:
-            pass
-        finally:
-            if conn:
-                conn.close()
-
-        ctk.CTkButton(top, text="保存", command=save_check).pack(pady=10)
\ No newline at end of file
+                return
+
+            # 物料ID优先从目录缓存取，缓存中没有（如刚由其他客户端新增）时再查库
+            cached_id = catalog.id_for_name(name)
+
+            def work(token):
+                with db_connection() as conn:
+                    cursor = conn.cursor()
+
+                    material_id = cached_id
+                    if material_id is None:
+                        cursor.execute("SELECT material_id FROM Material WHERE material_name=?", (name,))
+                        row = cursor.fetchone()
+                        if not row:
+                            raise LookupError("未找到该物料")
+                        material_id = row[0]
+
+                    # 获取当前库存（新增事务开始）
+                    cursor.execute("SELECT current_quantity FROM Inventory WHERE material_id=?", (material_id,))
+                    row = cursor.fetchone()
+                    if not row:
+                        raise LookupError("库存中无该物料")
+                    recorded = row[0]
+
+                    # 更新库存表（新增逻辑）
+                    cursor.execute("""
+                        UPDATE Inventory 
+                        SET current_quantity = ?, 
+                            last_updated = GETDATE() 
+                        WHERE material_id = ?
+                    """, (real, material_id))
+
+                    # 流水水位线：库存行已锁定，该物料此前的流水都已提交，之后的流水 ID 都更大
+                    cursor.execute("SELECT MAX(record_id) FROM InOutRecord")
+                    watermark = cursor.fetchone()[0] or 0
+
+                    # 插入盘点记录
+                    cursor.execute(
+                        "INSERT INTO InventoryCheck (material_id, real_quantity, recorded_quantity, adjusted_by_user, last_record_id) VALUES (?, ?, ?, ?, ?)",
+                        (material_id, real, recorded, self.user_id, watermark)
+                    )
+
+                    # 在同一事务内做预警检查，退出 with 时提交，出错自动回滚
+                    evaluate_alerts(cursor, [material_id])
+
+            def on_saved(_):
+                messagebox.showinfo("成功", "盘点记录已添加并更新库存")
+                top.destroy()
+                self.live_search.search_now(refresh=True)
+
+            def on_error(e):
+                if isinstance(e, LookupError):
+                    messagebox.showerror("错误", str(e))
+                else:
+                    messagebox.showerror("错误", f"保存失败：{e}")
+
+            run_in_background(top, "save", work, on_saved, on_error=on_error)
+
+        # 物料名称取自目录缓存，过期时在后台增量刷新
+        catalog = get_catalog()
+        if catalog.loaded:
+            material_box.configure(values=catalog.names())
+        if not catalog.is_fresh():
+            def load_names(token):
+                catalog.get()
+                return catalog.names()
+
+            run_in_background(top, "materials", load_names,
+                              lambda names: material_box.configure(values=names),
+                              on_error=lambda e: None)
+
+        ctk.CTkButton(top, text="保存", command=save_check).pack(pady=10)
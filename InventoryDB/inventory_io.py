@@ -2,9 +2,9 @@
 
 import customtkinter as ctk
 import tkinter.messagebox as msgbox
-import pyodbc
-from db_config import get_connection
-from utils import check_alert
+from stock_movement import post_movement, MovementError, InsufficientStockError
+from task_runner import run_in_background
+from material_cache import get_catalog
 
 class InventoryIOWindow(ctk.CTkToplevel):
     def __init__(self, master=None, user_id=None):
@@ -13,20 +13,29 @@ class InventoryIOWindow(ctk.CTkToplevel):
         self.title("出入库管理")
         self.geometry("500x350")
 
-        self.conn = get_connection()
-        self.materials = self.fetch_materials()
-        
+        self.materials = {}
+
         self.create_widgets()
+        self.fetch_materials()
 
     def fetch_materials(self):
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT material_id, material_name FROM Material")
-            materials = cursor.fetchall()
-            return {row.material_name: row.material_id for row in materials}
-        except Exception as e:
-            msgbox.showerror("数据库错误", f"无法加载物料列表: {e}")
-            return {}
+        def show(materials):
+            self.materials = materials
+            self.material_menu.configure(values=list(materials.keys()))
+
+        # 物料目录已缓存时直接使用，不访问数据库；过期时在后台增量刷新后再更新下拉框
+        catalog = get_catalog()
+        if catalog.loaded:
+            show(catalog.name_to_id())
+        if not catalog.is_fresh():
+            def work(token):
+                catalog.get()
+                return catalog.name_to_id()
+
+            run_in_background(
+                self, "materials", work, show,
+                on_error=lambda e: msgbox.showerror("数据库错误", f"无法加载物料列表: {e}")
+            )
 
     def create_widgets(self):
         ctk.CTkLabel(self, text="选择物料:").pack(pady=5)
@@ -65,49 +74,23 @@ class InventoryIOWindow(ctk.CTkToplevel):
             msgbox.showwarning("输入错误", "请输入有效的数量")
             return
 
-        try:
-            cursor = self.conn.cursor()
-            # 查询当前库存
-            cursor.execute("SELECT inventory_id, current_quantity FROM Inventory WHERE material_id = ?", material_id)
-            result = cursor.fetchone()
-            if not result:
-                # 如果库存记录不存在，初始化
-                if io_type == "入库":
-                    cursor.execute("INSERT INTO Inventory (material_id, current_quantity) VALUES (?, ?)", material_id, quantity)
-                    self.conn.commit()
-                else:
-                    msgbox.showerror("错误", "该物料尚无库存，无法出库")
-                    return
+        def done(new_quantity):
+            self.submit_button.configure(state="normal")
+            msgbox.showinfo("成功", f"{io_type}成功，当前库存：{new_quantity}")
+
+        def failed(e):
+            self.submit_button.configure(state="normal")
+            if isinstance(e, InsufficientStockError):
+                msgbox.showwarning("库存不足", str(e))
+            elif isinstance(e, MovementError):
+                msgbox.showerror("错误", str(e))
             else:
-                inventory_id, current_quantity = result
-                if io_type == "入库":
-                    new_quantity = current_quantity + quantity
-                    cursor.execute("UPDATE Inventory SET current_quantity = ?, last_updated = GETDATE() WHERE inventory_id = ?", new_quantity, inventory_id)
-                elif io_type == "出库":
-                    if quantity > current_quantity:
-                        msgbox.showwarning("库存不足", "库存不足，无法出库")
-                        return
-                    new_quantity = current_quantity - quantity
-                    cursor.execute("UPDATE Inventory SET current_quantity = ?, last_updated = GETDATE() WHERE inventory_id = ?", new_quantity, inventory_id)
-
-            # 插入出入库记录
-            if self.user_id is None:
-                msgbox.showerror("错误", "未检测到用户登录信息")
-                return
-            
-            cursor.execute(
-                "INSERT INTO InOutRecord (material_id, user_id, type, quantity, note) VALUES (?, ?, ?, ?, ?)",
-                material_id, self.user_id, io_type, quantity, note
-            )
+                msgbox.showerror("数据库错误", f"执行失败: {e}")
 
-            self.conn.commit()
-
-            try:
-                check_alert(material_id)  # 执行库存预警检查
-                print(f"已执行物料{material_id}的库存预警检查")
-            except Exception as alert_error:
-                print(f"预警检查时发生错误: {alert_error}")
-                
-            msgbox.showinfo("成功", f"{io_type}成功，已更新库存")
-        except Exception as e:
-            msgbox.showerror("数据库错误", f"执行失败: {e}")
+        # 提交期间禁用按钮，防止重复提交
+        self.submit_button.configure(state="disabled")
+        run_in_background(
+            self, "post",
+            lambda token: post_movement(material_id, self.user_id, io_type, quantity, note),
+            done, on_error=failed
+        )
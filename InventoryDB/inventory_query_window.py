@@ -2,9 +2,18 @@
 
 import customtkinter as ctk
 from tkinter import ttk, filedialog, messagebox
-from db_config import get_connection
+from db_config import db_connection
 from datetime import datetime
-import openpyxl
+from virtual_table import VirtualTable
+from task_runner import run_in_background, BusyBar
+from excel_export import export_query
+from material_search import search_materials
+from live_search import LiveSearch
+from utils import chunked, placeholders
+import ui_profiler
+
+# 搜索命中超过该数量时直接用数据库查询，避免拆成过多的 IN 查询
+INDEX_LOOKUP_LIMIT = 2000
 
 class InventoryQueryWindow(ctk.CTkToplevel):
     def __init__(self, master=None):
@@ -24,7 +33,6 @@ class InventoryQueryWindow(ctk.CTkToplevel):
             height=35
         )
         self.search_entry.pack(side="left", padx=10, fill="x", expand=True)
-        self.search_entry.bind("<Return>", lambda e: self.load_inventory())
 
         ctk.CTkButton(
             search_frame,
@@ -45,22 +53,14 @@ class InventoryQueryWindow(ctk.CTkToplevel):
             command=self.export_to_excel
         ).pack(side="right", padx=5)
 
+        # 后台任务进度与取消
+        self.busy = BusyBar(export_frame)
+        self.busy.pack(side="left", padx=5, fill="x", expand=True)
+
         # 表格容器
         table_container = ctk.CTkFrame(self, corner_radius=8)
         table_container.pack(padx=15, pady=(0, 15), fill="both", expand=True)
 
-        # 表格和滚动条
-        self.table = ttk.Treeview(
-            table_container,
-            columns=("名称", "供应商", "单位", "库存数量", "更新时间"),
-            show="headings",
-            selectmode="browse"
-        )
-
-        vsb = ttk.Scrollbar(table_container, orient="vertical", command=self.table.yview)
-        hsb = ttk.Scrollbar(table_container, orient="horizontal", command=self.table.xview)
-        self.table.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
         # 配置表格样式（保持原优化样式）
         style = ttk.Style()
         style.theme_use("default")
@@ -87,55 +87,85 @@ class InventoryQueryWindow(ctk.CTkToplevel):
             "更新时间": {"width": 200, "anchor": "w"}
         }
 
-        for col, settings in columns.items():
-            self.table.heading(col, text=col)
-            self.table.column(col, **settings)
-
-        # 布局组件
-        self.table.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
-        hsb.grid(row=1, column=0, sticky="ew")
-        table_container.grid_rowconfigure(0, weight=1)
-        table_container.grid_columnconfigure(0, weight=1)
+        # 虚拟化表格（自带滚动条，只渲染可见行）
+        self.table = VirtualTable(table_container, columns=columns.keys(), column_settings=columns)
+        self.table.pack(fill="both", expand=True)
 
-        self.load_inventory()
+        # 边输入边搜索，名称/供应商命中的结果缓存后供更长的关键词本地细化
+        self.live_search = LiveSearch(
+            self, self.search_entry, self._fetch_inventory, self.table.set_rows,
+            match=lambda row, kw: kw in row[0].casefold() or kw in (row[1] or "").casefold(),
+            busy=self.busy, on_error=lambda e: messagebox.showerror("加载失败", f"数据库错误：{e}")
+        )
+        self.live_search.search_now()
+
+    def _build_query(self, keyword):
+        """按搜索条件拼出查询，加载与导出共用"""
+        query = """
+            SELECT M.material_name, M.supplier, M.unit, 
+                   I.current_quantity, I.last_updated
+            FROM Inventory I
+            JOIN Material M ON I.material_id = M.material_id
+        """
+        params = ()
+
+        if keyword:
+            query += " WHERE M.material_name LIKE ? OR M.supplier LIKE ?"
+            params = (f'%{keyword}%', f'%{keyword}%')
+        return query, params
 
     def load_inventory(self):
-        # （保持原优化逻辑）
-        keyword = self.search_entry.get()
-        for row in self.table.get_children():
-            self.table.delete(row)
-
-        try:
-            conn = get_connection()
+        """搜索按钮：显示当前库存，不使用最多 CACHE_TTL 秒前缓存的结果（与导出一致）"""
+        self.live_search.search_now(refresh=True)
+
+    def _fetch_inventory(self, keyword, token):
+        if keyword:
+            # 关键词先在内存索引中匹配名称/供应商（冷启动时查库），再按物料 ID 取库存
+            matches = search_materials(keyword, fields=("name", "supplier"))
+            if len(matches) <= INDEX_LOOKUP_LIMIT:
+                return self._inventory_rows(matches, token)
+
+        query, params = self._build_query(keyword)
+        with db_connection() as conn:
             cursor = conn.cursor()
-
-            query = """
-                SELECT M.material_name, M.supplier, M.unit, 
-                       I.current_quantity, I.last_updated
-                FROM Inventory I
-                JOIN Material M ON I.material_id = M.material_id
-            """
-            params = ()
-            
-            if keyword:
-                query += " WHERE M.material_name LIKE ? OR M.supplier LIKE ?"
-                params = (f'%{keyword}%', f'%{keyword}%')
-
+            token.bind_cursor(cursor, conn)
             cursor.execute(query, params)
-
-            for row in cursor.fetchall():
-                formatted_row = list(row)
-                if isinstance(formatted_row[4], datetime):
-                    formatted_row[4] = formatted_row[4].strftime("%Y-%m-%d %H:%M:%S")
-                formatted_row[3] = f"{formatted_row[3]:.2f}"
-                self.table.insert("", "end", values=formatted_row)
-
-        except Exception as e:
-            messagebox.showerror("加载失败", f"数据库错误：{e}")  # 改用messagebox
-        finally:
-            if conn:
-                conn.close()
+            results = cursor.fetchall()
+
+        rows = []
+        with ui_profiler.phase(ui_profiler.TRANSFORM, rows=len(results)):
+            for row in results:
+                token.check()
+                rows.append(self._format_row(row))
+        return rows
+
+    def _inventory_rows(self, matches, token):
+        """按搜索结果的相关度顺序取库存，没有库存记录的物料不显示（与原 JOIN 一致）"""
+        stock = {}
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            token.bind_cursor(cursor, conn)
+            for ids in chunked([m.material_id for m in matches]):
+                cursor.execute(
+                    "SELECT material_id, current_quantity, last_updated FROM Inventory "
+                    f"WHERE material_id IN ({placeholders(len(ids))})",
+                    ids
+                )
+                for row in cursor.fetchall():
+                    stock[row[0]] = (row[1], row[2])
+        with ui_profiler.phase(ui_profiler.TRANSFORM, rows=len(matches)):
+            return [
+                self._format_row((m.material_name, m.supplier, m.unit) + stock[m.material_id])
+                for m in matches if m.material_id in stock
+            ]
+
+    @staticmethod
+    def _format_row(row):
+        formatted_row = list(row)
+        if isinstance(formatted_row[4], datetime):
+            formatted_row[4] = formatted_row[4].strftime("%Y-%m-%d %H:%M:%S")
+        formatted_row[3] = f"{formatted_row[3]:.2f}"
+        return tuple(formatted_row)
 
     def export_to_excel(self):
         file_path = filedialog.asksaveasfilename(
@@ -147,35 +177,16 @@ class InventoryQueryWindow(ctk.CTkToplevel):
         if not file_path:
             return
 
-        try:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "库存查询"
-
-            # 写入标题（与表格列名对应）
-            headers = [self.table.heading(col)["text"] for col in self.table["columns"]]
-            ws.append(headers)
-
-            # 写入数据（保持格式化后的数据）
-            for item in self.table.get_children():
-                row_data = self.table.item(item)["values"]
-                ws.append(row_data)
-
-            # 自动调整列宽
-            for col in ws.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2) * 1.2
-                ws.column_dimensions[column].width = adjusted_width
-
-            wb.save(file_path)
-            messagebox.showinfo("导出成功", f"数据已保存到：\n{file_path}")
-
-        except Exception as e:
-            messagebox.showerror("导出失败", f"发生错误：{e}")
\ No newline at end of file
+        # 直接从数据库流式导出，不经过表格数据
+        query, params = self._build_query(self.search_entry.get().strip())
+        headers = list(self.table.columns)
+
+        def work(token):
+            export_query(file_path, query, params, headers, "库存查询", token=token)
+            return file_path
+
+        run_in_background(
+            self, "export", work, busy=self.busy,
+            on_success=lambda path: messagebox.showinfo("导出成功", f"数据已保存到：\n{path}"),
+            on_error=lambda e: messagebox.showerror("导出失败", f"发生错误：{e}")
+        )
@@ -0,0 +1,280 @@
+# ledger_export.py
+# 流水批量导出/归档：InOutRecord、InventoryCheck、Alert 按固定批次从游标读出，写成 CSV 或 Parquet，
+# 可按日期范围、物料筛选，按月分区（month=YYYY-MM 目录），供 BI 和审计使用。不受 Excel 行数限制。
+#   python ledger_export.py --format csv --compression gzip --start 2024-01-01 --end 2025-01-01
+#   python ledger_export.py --tables InOutRecord --format parquet --materials 1,2,3 --output-dir archive
+# Parquet 需要 pyarrow，只在导出 Parquet 时才导入。
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from db_config import db_connection
+from utils import chunked, placeholders
+
+BATCH_SIZE = 50000
+
+# 每张表的导出查询；列类型用于 Parquet 的 schema
+LEDGERS = {
+    "InOutRecord": {
+        "query": """
+            SELECT r.record_id, r.material_id, m.material_name, r.user_id, r.type,
+                   r.quantity, r.timestamp, r.note
+            FROM InOutRecord r
+            JOIN Material m ON r.material_id = m.material_id
+        """,
+        "alias": "r",
+        "time": "timestamp",
+        "key": "record_id",
+        "columns": [("record_id", "int"), ("material_id", "int"), ("material_name", "string"),
+                    ("user_id", "int"), ("type", "string"), ("quantity", "int"),
+                    ("timestamp", "timestamp"), ("note", "string")],
+    },
+    "InventoryCheck": {
+        "query": """
+            SELECT c.check_id, c.material_id, m.material_name, c.real_quantity,
+                   c.recorded_quantity, c.adjusted_by_user, c.check_time
+            FROM InventoryCheck c
+            JOIN Material m ON c.material_id = m.material_id
+        """,
+        "alias": "c",
+        "time": "check_time",
+        "key": "check_id",
+        "columns": [("check_id", "int"), ("material_id", "int"), ("material_name", "string"),
+                    ("real_quantity", "int"), ("recorded_quantity", "int"),
+                    ("adjusted_by_user", "int"), ("check_time", "timestamp")],
+    },
+    "Alert": {
+        "query": """
+            SELECT a.alert_id, a.material_id, m.material_name, a.alert_type,
+                   a.current_quantity, a.generated_time, a.is_resolved
+            FROM Alert a
+            JOIN Material m ON a.material_id = m.material_id
+        """,
+        "alias": "a",
+        "time": "generated_time",
+        "key": "alert_id",
+        "columns": [("alert_id", "int"), ("material_id", "int"), ("material_name", "string"),
+                    ("alert_type", "string"), ("current_quantity", "int"),
+                    ("generated_time", "timestamp"), ("is_resolved", "bool")],
+    },
+}
+
+FORMATS = ("csv", "parquet")
+CSV_COMPRESSIONS = (None, "gzip")
+PARQUET_COMPRESSIONS = (None, "snappy", "gzip", "zstd")
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 1024 / 1024, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def _month_of(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m")
+    return str(value)[:7]
+
+
+def _format_value(value):
+    # 与 Parquet 的 timestamp("ms") 一致：保留 SQL Server DATETIME 的毫秒，整秒时不带小数
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="milliseconds" if value.microsecond else "seconds")
+    return value
+
+
+class _CsvWriter:
+    def __init__(self, path, columns, compression):
+        if compression == "gzip":
+            self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        else:
+            self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self._writer.writerows([_format_value(v) for v in row] for row in rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, columns, compression):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {"int": pa.int64(), "string": pa.string(), "bool": pa.bool_(),
+                 "timestamp": pa.timestamp("ms")}
+        self._pa = pa
+        self._schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self._kinds = [kind for _, kind in columns]
+        self._writer = pq.ParquetWriter(path, self._schema, compression=compression or "none")
+
+    def write(self, rows):
+        # 按列转置成 Arrow 数组，一批写成一个 row group
+        columns = list(zip(*rows))
+        arrays = []
+        for values, kind, field in zip(columns, self._kinds, self._schema):
+            if kind == "timestamp":
+                values = [v if v is None or isinstance(v, datetime) else datetime.fromisoformat(str(v))
+                          for v in values]
+            elif kind == "bool":
+                values = [None if v is None else bool(v) for v in values]
+            arrays.append(self._pa.array(values, type=field.type))
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _output_path(out_dir, table, fmt, compression, month):
+    suffix = ".csv.gz" if fmt == "csv" and compression == "gzip" else "." + fmt
+    if month is None:
+        return os.path.join(out_dir, table + suffix)
+    # Hive 风格分区目录，Spark / DuckDB / pandas 可直接按 month 读取
+    directory = os.path.join(out_dir, table, f"month={month}")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, "part-0" + suffix)
+
+
+def export_ledger(table, out_dir, fmt="csv", start=None, end=None, material_ids=None,
+                  partition=True, compression=None, batch_size=BATCH_SIZE, progress=None):
+    """把一张流水表导出到 out_dir，返回行数、文件、耗时、吞吐量等指标
+
+    日期范围为左闭右开 [start, end)；material_ids 为空表示全部物料，
+    物料较多时按 IN 列表分批查询；progress(rows) 在每批写入后调用。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的格式：{fmt}")
+    allowed = CSV_COMPRESSIONS if fmt == "csv" else PARQUET_COMPRESSIONS
+    if compression not in allowed:
+        raise ValueError(f"{fmt} 不支持压缩方式：{compression}")
+
+    spec = LEDGERS[table]
+    alias, time_column = spec["alias"], spec["time"]
+    writer_class = _CsvWriter if fmt == "csv" else _ParquetWriter
+    time_index = [name for name, _ in spec["columns"]].index(time_column)
+    os.makedirs(out_dir, exist_ok=True)
+
+    where, params = " WHERE 1 = 1", []
+    if start is not None:
+        where += f" AND {alias}.{time_column} >= ?"
+        params.append(start)
+    if end is not None:
+        where += f" AND {alias}.{time_column} < ?"
+        params.append(end)
+    order = f" ORDER BY {alias}.{time_column}, {alias}.{spec['key']}"
+
+    id_chunks = list(chunked(material_ids)) if material_ids else [None]
+    writers = {}
+    files = []
+    rows_written = 0
+    started = time.perf_counter()
+
+    def writer_for(month):
+        writer = writers.get(month)
+        if writer is None:
+            path = _output_path(out_dir, table, fmt, compression, month)
+            writer = writers[month] = writer_class(path, spec["columns"], compression)
+            files.append(path)
+        return writer
+
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            for ids in id_chunks:
+                query, query_params = spec["query"] + where, list(params)
+                if ids is not None:
+                    query += f" AND {alias}.material_id IN ({placeholders(len(ids))})"
+                    query_params += ids
+                cursor.execute(query + order, query_params)
+
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    if not partition:
+                        writer_for(None).write(batch)
+                    else:
+                        # 结果按时间排序，同月的行是连续的一段
+                        segment_start = 0
+                        for i in range(1, len(batch) + 1):
+                            if i == len(batch) or _month_of(batch[i][time_index]) != _month_of(batch[segment_start][time_index]):
+                                month = _month_of(batch[segment_start][time_index])
+                                writer_for(month).write(batch[segment_start:i])
+                                # 只有一次查询时月份单调递增，写完的月份可以立即关闭
+                                if len(id_chunks) == 1 and i < len(batch):
+                                    writers.pop(month).close()
+                                segment_start = i
+                    rows_written += len(batch)
+                    if progress is not None:
+                        progress(rows_written)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if not files and not partition:
+        # 没有数据时也生成只含表头的文件
+        writer_for(None).close()
+
+    seconds = time.perf_counter() - started
+    total_bytes = sum(os.path.getsize(path) for path in files)
+    return {
+        "table": table,
+        "format": fmt,
+        "compression": compression,
+        "rows": rows_written,
+        "files": len(files),
+        "bytes": total_bytes,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows_written / seconds) if seconds else None,
+        "mb_per_sec": round(total_bytes / 1024 / 1024 / seconds, 2) if seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流水批量导出（CSV / Parquet）")
+    parser.add_argument("--tables", nargs="+", choices=list(LEDGERS), default=list(LEDGERS),
+                        help="要导出的表，默认全部")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--compression", help="csv: gzip；parquet: snappy / gzip / zstd")
+    parser.add_argument("--start", type=_parse_date, help="起始日期（含），如 2024-01-01")
+    parser.add_argument("--end", type=_parse_date, help="结束日期（不含），如 2025-01-01")
+    parser.add_argument("--materials", help="物料 ID，逗号分隔")
+    parser.add_argument("--no-partition", action="store_true", help="不按月分区，每张表一个文件")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批从游标读取的行数")
+    parser.add_argument("--output-dir", default="ledger_export")
+    args = parser.parse_args()
+
+    material_ids = [int(x) for x in args.materials.split(",") if x.strip()] if args.materials else None
+    for table in args.tables:
+        metrics = export_ledger(
+            table, args.output_dir, args.format, args.start, args.end, material_ids,
+            partition=not args.no_partition, compression=args.compression, batch_size=args.batch_size
+        )
+        print(json.dumps(metrics, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# live_search.py
+# 边输入边搜索：按键防抖后在后台查询，新请求取代旧请求；
+# 最近的 关键词→结果 保存在带过期时间的 LRU 缓存中，关键词变长时直接在缓存的超集结果上本地过滤，不再查库。
+import threading
+import time
+from collections import OrderedDict
+
+from task_runner import run_in_background, cancel_background
+
+DEBOUNCE_MS = 250
+CACHE_ENTRIES = 32
+CACHE_TTL = 30       # 秒；库存类结果变化较快，不宜缓存太久
+FILTER_CHECK_EVERY = 5000
+
+
+def normalize(keyword):
+    return (keyword or "").strip().casefold()
+
+
+class SearchCache:
+    """关键词 → 结果行 的 LRU 缓存，条目超过 ttl 秒后失效"""
+
+    def __init__(self, max_entries=CACHE_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _alive(self, stored_at):
+        return time.monotonic() - stored_at < self.ttl
+
+    def get(self, keyword):
+        with self._lock:
+            entry = self._entries.get(keyword)
+            if entry is None:
+                return None
+            if not self._alive(entry[0]):
+                del self._entries[keyword]
+                return None
+            self._entries.move_to_end(keyword)
+            return entry[1]
+
+    def put(self, keyword, rows):
+        with self._lock:
+            self._entries[keyword] = (time.monotonic(), rows)
+            self._entries.move_to_end(keyword)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def superset(self, keyword):
+        """找出被 keyword 包含的最长已缓存关键词，其结果必然是 keyword 结果的超集
+
+        空关键词（全部数据）不作为超集，全量列表本地过滤会丢失索引的相关度排序。
+        """
+        best = None
+        with self._lock:
+            for cached, (stored_at, rows) in list(self._entries.items()):
+                if cached and cached in keyword and self._alive(stored_at):
+                    if best is None or len(cached) > len(best[0]):
+                        best = (cached, rows)
+        return best
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(scope, max_entries=CACHE_ENTRIES, ttl=CACHE_TTL):
+    """按作用域共享的结果缓存，窗口关闭后重新打开仍可命中"""
+    with _caches_lock:
+        cache = _caches.get(scope)
+        if cache is None:
+            cache = _caches[scope] = SearchCache(max_entries, ttl)
+        return cache
+
+
+class LiveSearch:
+    """把输入框接成边输入边搜索
+
+    fetch(keyword, token) 在后台返回结果行列表；on_results(rows) 在主线程显示结果；
+    match(row, keyword) 给出时，可在缓存的超集结果上本地细化（keyword 已 casefold），
+    其判断必须与 fetch 的筛选条件一致。
+    """
+
+    def __init__(self, widget, entry, fetch, on_results, match=None, scope=None,
+                 delay=DEBOUNCE_MS, ttl=CACHE_TTL, busy=None, name="search", error_title="错误",
+                 on_error=None):
+        self.widget = widget
+        self.entry = entry
+        self.fetch = fetch
+        self.on_results = on_results
+        self.match = match
+        self.delay = delay
+        self.busy = busy
+        self.name = name
+        self.error_title = error_title
+        self.on_error = on_error
+        self.cache = get_cache(scope or f"{type(widget).__name__}.{name}", ttl=ttl)
+        self.stats = {"cache_hits": 0, "refinements": 0, "queries": 0}
+        self._after_id = None
+        self._last_keyword = None
+
+        entry.bind("<KeyRelease>", self._on_key, add="+")
+        # 回车是明确的搜索，总是重新查库；缓存只服务于边输入边细化
+        entry.bind("<Return>", lambda e: self.search_now(refresh=True), add="+")
+        entry.bind("<KP_Enter>", lambda e: self.search_now(refresh=True), add="+")
+
+    def _on_key(self, event):
+        if event.keysym in ("Return", "KP_Enter"):
+            return
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+        self._after_id = self.widget.after(self.delay, self._debounced)
+
+    def _debounced(self):
+        self._after_id = None
+        keyword = normalize(self.entry.get())
+        if keyword != self._last_keyword:  # 方向键等不改变内容的按键不触发搜索
+            self.search_now()
+
+    def search_now(self, refresh=False):
+        """立即搜索；refresh 为 True 时清空缓存并重新查库（搜索/刷新按钮、回车、写操作之后）"""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        raw = self.entry.get().strip()
+        keyword = normalize(raw)
+        self._last_keyword = keyword
+        if refresh:
+            self.cache.clear()
+
+        rows = self.cache.get(keyword)
+        if rows is not None:
+            self.stats["cache_hits"] += 1
+            cancel_background(self.widget, self.name)  # 丢弃尚未返回的旧请求
+            self.on_results(rows)
+            return
+
+        superset = self.cache.superset(keyword) if self.match is not None else None
+        if superset is not None:
+            self.stats["refinements"] += 1
+            rows = superset[1]
+            match = self.match
+
+            def work(token):
+                result = []
+                for i, row in enumerate(rows):
+                    if i % FILTER_CHECK_EVERY == 0:
+                        token.check()
+                    if match(row, keyword):
+                        result.append(row)
+                return result
+        else:
+            self.stats["queries"] += 1
+
+            def work(token):
+                return self.fetch(raw, token)
+
+        def done(result):
+            self.cache.put(keyword, result)
+            self.on_results(result)
+
+        run_in_background(self.widget, self.name, work, done, busy=self.busy,
+                          error_title=self.error_title, on_error=self.on_error)
+
+    def invalidate(self):
+        self.cache.clear()
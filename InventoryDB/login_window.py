@@ -1,15 +1,55 @@
 # login_window.py
+import importlib
+import os
+import threading
 import customtkinter as ctk
 from tkinter import messagebox
 from db_config import get_connection
-from inventory_io import InventoryIOWindow
-from material_manager import MaterialManager
-from inventory_query_window import InventoryQueryWindow
-from inventory_check import InventoryCheckWindow
-from inventory_alert import InventoryAlertWindow
-from monthly_report_window import MonthlyReportWindow
-from user_management import UserManagementWindow
-from inout_record_viewer import InOutRecordViewer
+
+# 功能窗口注册表：窗口模块（及其依赖的 tkcalendar、openpyxl 等）在第一次打开时才导入，登录框无需等待
+WINDOW_REGISTRY = {
+    "inventory_io": ("inventory_io", "InventoryIOWindow"),
+    "material_manager": ("material_manager", "MaterialManager"),
+    "inventory_query": ("inventory_query_window", "InventoryQueryWindow"),
+    "inventory_check": ("inventory_check", "InventoryCheckWindow"),
+    "inventory_alert": ("inventory_alert", "InventoryAlertWindow"),
+    "monthly_report": ("monthly_report_window", "MonthlyReportWindow"),
+    "user_management": ("user_management", "UserManagementWindow"),
+    "inout_records": ("inout_record_viewer", "InOutRecordViewer"),
+    "query_stats": ("query_stats_window", "QueryStatsWindow"),
+}
+
+# 登录后在后台预先导入，之后打开窗口、导出时不再等待导入；设 INVENTORY_PREWARM=0 关闭
+PREWARM = os.environ.get("INVENTORY_PREWARM", "1") != "0"
+PREWARM_MODULES = ("openpyxl",)
+
+
+def load_window_class(key):
+    module_name, class_name = WINDOW_REGISTRY[key]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def open_window(key, *args, **kwargs):
+    return load_window_class(key)(*args, **kwargs)
+
+
+def prewarm(keys):
+    """导入给定窗口及常用的重量级依赖，并加载物料目录缓存"""
+    for key in keys:
+        try:
+            load_window_class(key)
+        except Exception as e:
+            print("预加载窗口失败：", key, e)
+    for module_name in PREWARM_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+    try:
+        from material_cache import get_catalog
+        get_catalog().get()
+    except Exception as e:
+        print("预加载物料目录失败：", e)
 
 def check_credentials(username, password):
     conn = get_connection()
@@ -104,61 +144,78 @@ class LoginApp(ctk.CTk):
         main_frame.pack(fill="both", expand=True, padx=50, pady=10)
 
         # 创建功能按钮
-        self._create_function_buttons(main_frame, user_id, permission_level)
+        keys = self._create_function_buttons(main_frame, user_id, permission_level)
+        if PREWARM:
+            threading.Thread(target=prewarm, args=(keys,), name="prewarm", daemon=True).start()
 
         main_window.protocol("WM_DELETE_WINDOW", lambda: self.on_close(main_window))
 
     def _create_function_buttons(self, master, user_id, permission_level):
-        """创建功能按钮"""
+        """创建功能按钮，返回当前用户可见的窗口"""
         button_configs = [
             {
                 "text": "出入库管理",
                 "icon": "📦",
                 "color": "#4a90e2",
                 "required_level": 1,
-                "command": lambda: InventoryIOWindow(master, user_id=user_id)
+                "window": "inventory_io",
+                "command": lambda: open_window("inventory_io", master, user_id=user_id)
             },
             {
                 "text": "商品管理",
                 "icon": "🛒",
                 "color": "#50c878",
                 "required_level": 2,
-                "command": lambda: MaterialManager(master)
+                "window": "material_manager",
+                "command": lambda: open_window("material_manager", master)
             },
             {
                 "text": "库存查询",
                 "icon": "🔍",
                 "color": "#4a90e2",
                 "required_level": 0,
-                "command": lambda: InventoryQueryWindow(master)
+                "window": "inventory_query",
+                "command": lambda: open_window("inventory_query", master)
             },
             {
                 "text": "盘点记录管理",
                 "icon": "📋",
                 "color": "#ff6b6b",
                 "required_level": 1,
-                "command": lambda: InventoryCheckWindow(user_id=user_id, master=master)
+                "window": "inventory_check",
+                "command": lambda: open_window("inventory_check", user_id=user_id, master=master)
             },
             {
                 "text": "库存预警",
                 "icon": "⚠️",
                 "color": "#ff6b6b",
                 "required_level": 0,
-                "command": lambda: InventoryAlertWindow(master=master)
+                "window": "inventory_alert",
+                "command": lambda: open_window("inventory_alert", master=master)
             },
             {
                 "text": "用户管理",
                 "icon": "👤",
                 "color": "#50c878",
                 "required_level": 2,
-                "command": lambda: UserManagementWindow(master=master)
+                "window": "user_management",
+                "command": lambda: open_window("user_management", master=master)
             },
             {
                 "text": "出入库记录查询",
                 "icon": "📜",
                 "color": "#4a90e2",
                 "required_level": 0,
-                "command": lambda: InOutRecordViewer(master=master)
+                "window": "inout_records",
+                "command": lambda: open_window("inout_records", master=master)
+            },
+            {
+                "text": "查询诊断",
+                "icon": "⏱️",
+                "color": "#6c757d",
+                "required_level": 2,
+                "window": "query_stats",
+                "command": lambda: open_window("query_stats", master=master)
             }
         ]
 
@@ -170,8 +227,10 @@ class LoginApp(ctk.CTk):
         btn_pady = 15
 
         row, col = 0, 0
+        visible = []
         for config in button_configs:
             if permission_level >= config["required_level"]:
+                visible.append(config["window"])
                 btn_frame = ctk.CTkFrame(master, width=btn_width, height=btn_height)
                 btn_frame.grid(row=row, column=col, padx=btn_padx, pady=btn_pady)
                 
@@ -195,6 +254,8 @@ class LoginApp(ctk.CTk):
                     col = 0
                     row += 1
 
+        return visible
+
     @staticmethod
     def _adjust_brightness(hex_color, factor):
         """调整颜色亮度"""
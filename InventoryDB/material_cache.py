@@ -0,0 +1,217 @@
+# material_cache.py
+# 进程内共享的物料目录缓存：首次使用时全量加载，之后按 Material.modified_time 水位线增量刷新，
+# 通过行数比对发现删除。各窗口打开时直接读缓存，不再各自查询 Material。
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from db_config import db_connection
+
+MaterialInfo = namedtuple(
+    "MaterialInfo",
+    ("material_id", "material_name", "supplier", "unit", "min_quantity", "max_quantity", "note")
+)
+
+REFRESH_INTERVAL = 60                      # 缓存超过该秒数后下次访问时增量刷新
+WATERMARK_OVERLAP = timedelta(seconds=60)  # 水位线回退量，覆盖时钟精度与提交延迟
+
+_COLUMNS = "material_id, material_name, supplier, unit, min_quantity, max_quantity, note"
+
+
+class MaterialCatalog:
+    """物料目录缓存，线程安全，可在后台任务中刷新
+
+    监听器在刷新线程中以 listener(changed, deleted, full) 调用：
+    changed 为新增或修改的 MaterialInfo 列表，deleted 为删除的物料 ID 集合，
+    full 为 True 时表示全量重载，changed 即为全部物料。
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()          # 保护缓存数据，读取方只会短暂持有
+        self._refresh_lock = threading.Lock()   # 串行化刷新，查询数据库期间持有
+        self._version = 0                       # 每次 invalidate() 加一
+        self._by_id = {}
+        self._by_name = {}
+        self._sorted = None
+        self._watermark = None
+        self._loaded = False
+        self._incremental = True   # 数据库未执行迁移 3 时退化为全量加载
+        self._refreshed_at = 0.0
+        self._stale = True
+        self._listeners = []
+
+    # ---------- 读取（不访问数据库） ----------
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def is_fresh(self):
+        return (self._loaded and not self._stale
+                and time.monotonic() - self._refreshed_at < self.refresh_interval)
+
+    def all(self):
+        """按物料 ID 排序的全部物料"""
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self._by_id.values())
+            return self._sorted
+
+    def names(self):
+        return [m.material_name for m in self.all()]
+
+    def by_id(self, material_id):
+        return self._by_id.get(material_id)
+
+    def id_for_name(self, name):
+        return self._by_name.get(name)
+
+    def name_to_id(self):
+        return {m.material_name: m.material_id for m in self.all()}
+
+    # ---------- 刷新 ----------
+
+    def get(self):
+        """缓存新鲜时直接返回，否则先刷新；会访问数据库，应在后台任务中调用"""
+        if not self.is_fresh():
+            self.refresh()
+        return self.all()
+
+    def invalidate(self):
+        """标记缓存过期，下次访问时刷新（物料增删改后调用）"""
+        with self._lock:
+            self._version += 1
+            self._stale = True
+
+    def refresh(self, full=False):
+        # 查询数据库时不持有 _lock，界面线程读缓存不必等待查询；查询结果最后在 _lock 下一次换入。
+        # 刷新之间由 _refresh_lock 串行，水位线与 _incremental 只由持有它的线程读写。
+        with self._refresh_lock:
+            version = self._version
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                if full or not self._loaded or not self._incremental:
+                    self._load_all(cursor)
+                else:
+                    self._load_changes(cursor)
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+                # 刷新期间有 invalidate() 时保持过期：那次修改可能在本次查询之后才提交
+                if self._version == version:
+                    self._stale = False
+
+    def _load_all(self, cursor):
+        try:
+            cursor.execute(f"SELECT {_COLUMNS}, modified_time FROM Material")
+            rows = cursor.fetchall()
+            self._incremental = True
+        except Exception:
+            # 没有 modified_time 列（未迁移）时只能全量加载
+            cursor.execute(f"SELECT {_COLUMNS} FROM Material")
+            rows = cursor.fetchall()
+            self._incremental = False
+
+        by_id = {}
+        by_name = {}
+        watermark = None
+        for row in rows:
+            info = MaterialInfo(*row[:7])
+            by_id[info.material_id] = info
+            by_name[info.material_name] = info.material_id
+            if self._incremental and row[7] is not None and (watermark is None or row[7] > watermark):
+                watermark = row[7]
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = by_name
+            self._watermark = watermark
+            self._sorted = None
+            self._loaded = True
+        self._notify(list(by_id.values()), set(), True)
+
+    def _load_changes(self, cursor):
+        changed = []
+        watermark = self._watermark
+        if watermark is not None:
+            cursor.execute(
+                f"SELECT {_COLUMNS}, modified_time FROM Material WHERE modified_time >= ?",
+                (watermark - WATERMARK_OVERLAP,)
+            )
+            for row in cursor.fetchall():
+                info = MaterialInfo(*row[:7])
+                if row[7] is not None and row[7] > watermark:
+                    watermark = row[7]
+                if self._by_id.get(info.material_id) != info:
+                    changed.append(info)
+        else:
+            cursor.execute(f"SELECT {_COLUMNS}, modified_time FROM Material WHERE modified_time IS NOT NULL")
+            rows = cursor.fetchall()
+            changed = [MaterialInfo(*row[:7]) for row in rows]
+            watermark = max((row[7] for row in rows), default=None)
+
+        # 删除不会留下修改时间，行数对不上时取全部 ID 找出被删除的物料
+        known = set(self._by_id).union(info.material_id for info in changed)
+        cursor.execute("SELECT COUNT(*) FROM Material")
+        deleted = set()
+        if cursor.fetchone()[0] != len(known):
+            cursor.execute("SELECT material_id FROM Material")
+            present = {row[0] for row in cursor.fetchall()}
+            deleted = known - present
+            if len(present) != len(known) - len(deleted):
+                # 仍对不上（如触发器缺失），退回全量加载
+                self._load_all(cursor)
+                return
+
+        with self._lock:
+            for info in changed:
+                old = self._by_id.get(info.material_id)
+                if old is not None and self._by_name.get(old.material_name) == old.material_id:
+                    del self._by_name[old.material_name]
+                self._by_id[info.material_id] = info
+                self._by_name[info.material_name] = info.material_id
+            for material_id in deleted:
+                old = self._by_id.pop(material_id)
+                if self._by_name.get(old.material_name) == material_id:
+                    del self._by_name[old.material_name]
+            self._watermark = watermark
+            if changed or deleted:
+                self._sorted = None
+        if changed or deleted:
+            self._notify(changed, deleted, False)
+
+    # ---------- 变更通知 ----------
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, changed, deleted, full):
+        for listener in list(self._listeners):
+            try:
+                listener(changed, deleted, full)
+            except Exception as e:
+                print("物料目录监听器出错：", e)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """返回进程内共享的物料目录缓存"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = MaterialCatalog()
+    return _catalog
+
+
+def invalidate():
+    get_catalog().invalidate()
@@ -3,7 +3,13 @@
 import customtkinter as ctk
 import tkinter.messagebox as msg
 import tkinter.simpledialog as simpledialog
-from db_config import get_connection
+from db_config import db_connection
+from alert_engine import evaluate_alerts
+from task_runner import run_in_background, BusyBar
+from material_cache import get_catalog, invalidate as invalidate_catalog
+from material_search import search_materials
+from live_search import LiveSearch
+import ui_profiler
 
 class MaterialManager(ctk.CTkToplevel):
     def __init__(self, master=None):  # 添加 master 参数
@@ -13,7 +19,6 @@ class MaterialManager(ctk.CTkToplevel):
 
         self.search_entry = ctk.CTkEntry(self, placeholder_text="🔍 搜索功能")
         self.search_entry.pack(pady=10)
-        self.search_entry.bind("<Return>", lambda e: self.load_materials())
 
         self.table = ctk.CTkTextbox(self, width=750, height=300)
         self.table.pack(pady=10)
@@ -26,32 +31,49 @@ class MaterialManager(ctk.CTkToplevel):
         ctk.CTkButton(btn_frame, text="✏️ 编辑", command=self.edit_material).grid(row=0, column=1, padx=10)
         ctk.CTkButton(btn_frame, text="❌ 删除", command=self.delete_material).grid(row=0, column=2, padx=10)
         ctk.CTkButton(btn_frame, text="🔄 刷新", command=self.load_materials).grid(row=0, column=3, padx=10)
-
+        ctk.CTkButton(btn_frame, text="📈 补货建议", command=self.open_forecast).grid(row=0, column=4, padx=10)
+
+        self.busy = BusyBar(self)
+        self.busy.pack(fill="x", padx=20)
+
+        # 边输入边搜索，名称/供应商/备注命中的结果缓存后供更长的关键词本地细化
+        self.live_search = LiveSearch(
+            self, self.search_entry, self._fetch_materials, self._show_materials,
+            match=lambda m, kw: (kw in m.material_name.casefold() or kw in (m.supplier or "").casefold()
+                                 or kw in (m.note or "").casefold()),
+            busy=self.busy, error_title="数据库错误"
+        )
         self.load_materials()
 
     def load_materials(self):
-        keyword = self.search_entry.get()
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            if keyword:
-                query = "SELECT * FROM Material WHERE material_name LIKE ?"
-                cursor.execute(query, (f'%{keyword}%',))
-            else:
-                query = "SELECT * FROM Material"
-                cursor.execute(query)
-            results = cursor.fetchall()
-
+        """刷新：清空搜索缓存后按当前关键词重新读取"""
+        self.live_search.search_now(refresh=True)
+
+    def _fetch_materials(self, keyword, token):
+        # 从物料目录缓存读取（过期时增量刷新），关键词在名称、供应商、备注的内存索引中搜索
+        return search_materials(keyword) if keyword else get_catalog().get()
+
+    def _show_materials(self, results):
+        def work(token):
+            # 在后台拼好整段文本，主线程只做一次插入
+            with ui_profiler.phase(ui_profiler.TRANSFORM, rows=len(results)):
+                lines = [
+                    f"{'ID':<5} {'名称':<15} {'供应商':<15} {'单位':<5} {'最小':<5} {'最大':<5} {'备注':<20}\n",
+                    "-" * 80 + "\n",
+                ]
+                for row in results:
+                    lines.append(f"{row.material_id:<5} {row.material_name:<15} {row.supplier:<15} {row.unit:<5} {row.min_quantity:<5} {row.max_quantity:<5} {row.note or '-':<20}\n")
+                return "".join(lines)
+
+        def show(text):
             self.table.delete("0.0", "end")
-            self.table.insert("end", f"{'ID':<5} {'名称':<15} {'供应商':<15} {'单位':<5} {'最小':<5} {'最大':<5} {'备注':<20}\n")
-            self.table.insert("end", "-" * 80 + "\n")
-            for row in results:
-                self.table.insert("end", f"{row.material_id:<5} {row.material_name:<15} {row.supplier:<15} {row.unit:<5} {row.min_quantity:<5} {row.max_quantity:<5} {row.note or '-':<20}\n")
+            self.table.insert("end", text)
 
-        except Exception as e:
-            msg.showerror("数据库错误", str(e))
-        finally:
-            conn.close()
+        run_in_background(self, "render", work, show)
+
+    def open_forecast(self):
+        from forecast_window import ForecastWindow  # 只在打开补货建议时才加载
+        ForecastWindow(master=self, on_applied=self.load_materials)
 
     def add_material(self):
         name = simpledialog.askstring("新增", "商品名称：")
@@ -63,28 +85,31 @@ class MaterialManager(ctk.CTkToplevel):
         max_q = simpledialog.askinteger("新增", "最大库存：")
         note = simpledialog.askstring("新增", "备注（可选）：")
 
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            query = "INSERT INTO Material (material_name, supplier, unit, min_quantity, max_quantity, note) VALUES (?, ?, ?, ?, ?, ?)"
-            cursor.execute(query, (name, supplier, unit, min_q, max_q, note))
-            conn.commit()
+        def work(token):
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                query = "INSERT INTO Material (material_name, supplier, unit, min_quantity, max_quantity, note) VALUES (?, ?, ?, ?, ?, ?)"
+                cursor.execute(query, (name, supplier, unit, min_q, max_q, note))
+            invalidate_catalog()
+
+        def done(_):
             msg.showinfo("成功", "新增成功！")
             self.load_materials()
-        except Exception as e:
-            msg.showerror("错误", str(e))
-        finally:
-            conn.close()
+
+        run_in_background(self, "add", work, done)
 
     def edit_material(self):
         material_id = simpledialog.askinteger("编辑", "请输入要编辑的商品 ID：")
         if not material_id:
             return
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM Material WHERE material_id = ?", (material_id,))
-            result = cursor.fetchone()
+
+        def fetch(token):
+            # 编辑前总是增量刷新一次，保证拿到最新内容
+            catalog = get_catalog()
+            catalog.refresh()
+            return catalog.by_id(material_id)
+
+        def ask_and_save(result):
             if not result:
                 msg.showwarning("未找到", "该商品 ID 不存在")
                 return
@@ -96,28 +121,36 @@ class MaterialManager(ctk.CTkToplevel):
             max_q = simpledialog.askinteger("编辑", "最大库存：", initialvalue=result.max_quantity)
             note = simpledialog.askstring("编辑", "备注：", initialvalue=result.note)
 
-            query = "UPDATE Material SET material_name=?, supplier=?, unit=?, min_quantity=?, max_quantity=?, note=? WHERE material_id=?"
-            cursor.execute(query, (name, supplier, unit, min_q, max_q, note, material_id))
-            conn.commit()
-            msg.showinfo("成功", "修改成功")
-            self.load_materials()
-        except Exception as e:
-            msg.showerror("错误", str(e))
-        finally:
-            conn.close()
+            def work(token):
+                with db_connection() as conn:
+                    cursor = conn.cursor()
+                    query = "UPDATE Material SET material_name=?, supplier=?, unit=?, min_quantity=?, max_quantity=?, note=? WHERE material_id=?"
+                    cursor.execute(query, (name, supplier, unit, min_q, max_q, note, material_id))
+                    # 上下限变化后立即重算该物料的预警
+                    evaluate_alerts(cursor, [material_id])
+                invalidate_catalog()
+
+            def done(_):
+                msg.showinfo("成功", "修改成功")
+                self.load_materials()
+
+            run_in_background(self, "edit", work, done)
+
+        run_in_background(self, "edit", fetch, ask_and_save)
 
     def delete_material(self):
         material_id = simpledialog.askinteger("删除", "请输入要删除的商品 ID：")
         if not material_id:
             return
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM Material WHERE material_id = ?", (material_id,))
-            conn.commit()
+
+        def work(token):
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM Material WHERE material_id = ?", (material_id,))
+            invalidate_catalog()
+
+        def done(_):
             msg.showinfo("成功", "删除成功")
             self.load_materials()
-        except Exception as e:
-            msg.showerror("错误", str(e))
-        finally:
-            conn.close()
+
+        run_in_background(self, "delete", work, done)
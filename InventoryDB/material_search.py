@@ -0,0 +1,231 @@
+# material_search.py
+# 物料内存搜索索引：对名称、供应商、备注建立单字/双字 n-gram 倒排索引，
+# 查询时取倒排表最短的 n-gram 作为候选集，再逐个校验子串并排序，20 万 SKU 下为毫秒级。
+# 索引挂在物料目录缓存上随之增量更新；目录尚未加载（冷启动）时退回数据库 LIKE 查询。
+import heapq
+import threading
+from array import array
+
+from db_config import db_connection
+from material_cache import MaterialInfo, get_catalog
+
+FIELDS = ("name", "supplier", "note")
+MAX_GRAM = 2
+COMPACT_RATIO = 0.5   # 失效的倒排项超过该比例时重建索引
+
+
+def normalize(text):
+    return (text or "").casefold()
+
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _doc_grams(doc):
+    grams = set()
+    for text in doc:
+        for n in range(1, MAX_GRAM + 1):
+            grams |= _grams(text, n)
+    return grams
+
+
+def _rank(doc, info, query, fields):
+    """排序键：名称命中优先于供应商、备注；完全相同 > 前缀 > 包含；越靠前、名称越短越优先"""
+    for field_rank, field in enumerate(FIELDS):
+        if field not in fields:
+            continue
+        pos = doc[field_rank].find(query)
+        if pos >= 0:
+            kind = 0 if doc[field_rank] == query else (1 if pos == 0 else 2)
+            return (field_rank, kind, pos, len(doc[0]), info.material_id)
+    return None
+
+
+class MaterialSearchIndex:
+    """n-gram 倒排索引
+
+    倒排表为只追加的 array，物料修改或删除后旧的倒排项不立即清理，
+    查询时对候选逐个校验当前文本，失效项会被自然过滤；失效项过多时整体重建。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._docs = {}       # material_id -> (名称, 供应商, 备注) 的 casefold 文本
+        self._infos = {}
+        self._entries = 0
+        self._stale_entries = 0
+        self.ready = False
+
+    def build(self, materials):
+        with self._lock:
+            self._postings = {}
+            self._docs = {}
+            self._infos = {}
+            self._entries = 0
+            self._stale_entries = 0
+            for info in materials:
+                self._add(info)
+            self.ready = True
+
+    def update(self, changed, deleted=()):
+        with self._lock:
+            for material_id in deleted:
+                self._remove(material_id)
+            for info in changed:
+                self._remove(info.material_id)
+                self._add(info)
+            if self._entries and self._stale_entries / self._entries > COMPACT_RATIO:
+                self.build(list(self._infos.values()))
+
+    def _add(self, info):
+        doc = (normalize(info.material_name), normalize(info.supplier), normalize(info.note))
+        self._docs[info.material_id] = doc
+        self._infos[info.material_id] = info
+        grams = _doc_grams(doc)
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("l")
+            posting.append(info.material_id)
+        self._entries += len(grams)
+
+    def _remove(self, material_id):
+        doc = self._docs.pop(material_id, None)
+        if doc is not None:
+            del self._infos[material_id]
+            self._stale_entries += len(_doc_grams(doc))
+
+    def __len__(self):
+        return len(self._docs)
+
+    def search(self, keyword, limit=None, fields=FIELDS):
+        """子串/前缀搜索，返回按相关度排序的 MaterialInfo 列表"""
+        query = normalize(keyword).strip()
+        with self._lock:
+            if not query:
+                results = sorted(self._infos.values())
+                return results[:limit] if limit else results
+
+            # 取查询串中倒排表最短的两个 n-gram，求交集作为候选集
+            n = min(len(query), MAX_GRAM)
+            postings = []
+            for gram in _grams(query, n):
+                posting = self._postings.get(gram)
+                if posting is None:
+                    return []
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            if len(postings) > 1:
+                candidates.intersection_update(postings[1])
+
+            field_ranks = [i for i, field in enumerate(FIELDS) if field in fields]
+            docs, infos = self._docs, self._infos
+            ranked = []
+            for material_id in candidates:
+                doc = docs.get(material_id)
+                if doc is None:
+                    continue
+                # 与 _rank 相同的排序规则，内联以减少大结果集的函数调用开销
+                for field_rank in field_ranks:
+                    text = doc[field_rank]
+                    pos = text.find(query)
+                    if pos >= 0:
+                        info = infos[material_id]
+                        kind = 0 if text == query else (1 if pos == 0 else 2)
+                        ranked.append((field_rank, kind, pos, len(doc[0]), material_id, info))
+                        break
+
+        if limit:
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked.sort()
+        return [item[-1] for item in ranked]
+
+
+_index = None
+_index_lock = threading.Lock()
+_warming = False
+
+
+def _on_catalog_change(changed, deleted, full):
+    if full:
+        _index.build(changed)
+    else:
+        _index.update(changed, deleted)
+
+
+def get_index():
+    """返回挂在物料目录缓存上的共享索引（目录刷新时自动增量更新）"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = MaterialSearchIndex()
+                catalog = get_catalog()
+                catalog.add_listener(_on_catalog_change)
+                if catalog.loaded:
+                    _index.build(catalog.all())
+    return _index
+
+
+def _warm_in_background():
+    global _warming
+    with _index_lock:
+        if _warming:
+            return
+        _warming = True
+
+    def warm():
+        global _warming
+        try:
+            get_catalog().get()
+        except Exception as e:
+            print("物料目录预加载失败：", e)
+        finally:
+            _warming = False
+
+    threading.Thread(target=warm, name="catalog-warm", daemon=True).start()
+
+
+def search_sql(keyword, limit=None, fields=FIELDS):
+    """冷启动时的数据库查询，结果按与索引相同的规则排序"""
+    columns = {"name": "material_name", "supplier": "supplier", "note": "note"}
+    where = " OR ".join(f"{columns[f]} LIKE ?" for f in fields)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT material_id, material_name, supplier, unit, min_quantity, max_quantity, note "
+            f"FROM Material WHERE {where}",
+            [f"%{keyword}%"] * len(fields)
+        )
+        rows = [MaterialInfo(*row) for row in cursor.fetchall()]
+
+    query = normalize(keyword).strip()
+    ranked = []
+    for info in rows:
+        doc = (normalize(info.material_name), normalize(info.supplier), normalize(info.note))
+        key = _rank(doc, info, query, fields)
+        if key is not None:
+            ranked.append((key, info))
+    ranked.sort(key=lambda item: item[0])
+    if limit:
+        ranked = ranked[:limit]
+    return [info for _, info in ranked]
+
+
+def search_materials(keyword, limit=None, fields=FIELDS):
+    """搜索物料：目录已加载时走内存索引（过期则先增量刷新），否则查库并在后台预加载目录
+
+    会访问数据库，应在后台任务中调用。
+    """
+    index = get_index()
+    catalog = get_catalog()
+    if catalog.loaded and index.ready:
+        if not catalog.is_fresh():
+            catalog.refresh()
+        return index.search(keyword, limit, fields)
+    _warm_in_background()
+    return search_sql(keyword, limit, fields)
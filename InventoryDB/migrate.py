@@ -0,0 +1,301 @@
+# migrate.py
+# 版本化数据库迁移，在 create_database.sql 建好的基础表结构之上按版本号依次执行
+#   python migrate.py            执行所有未执行的迁移
+#   python migrate.py --status   查看迁移状态
+import argparse
+import sys
+
+import db_config
+
+
+class MigrationError(Exception):
+    """迁移前的数据检查未通过，需要先处理数据"""
+
+
+def _mssql_index(name, table, ddl):
+    return f"""
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{name}' AND object_id = OBJECT_ID('{table}'))
+            {ddl}
+    """
+
+
+# (版本号, 说明, {后端: [语句]})。已发布的迁移不要修改，只追加新版本。
+MIGRATIONS = [
+    (1, "月结结账表 ReportClose", {
+        "mssql": ["""
+            IF OBJECT_ID('ReportClose', 'U') IS NULL
+                CREATE TABLE ReportClose (
+                    month NVARCHAR(7) PRIMARY KEY,
+                    last_record_id INT NOT NULL,
+                    closed_time DATETIME DEFAULT GETDATE()
+                )
+        """],
+        "sqlite": ["""
+            CREATE TABLE IF NOT EXISTS ReportClose (
+                month NVARCHAR(7) PRIMARY KEY,
+                last_record_id INT NOT NULL,
+                closed_time DATETIME DEFAULT (datetime('now', 'localtime'))
+            )
+        """],
+    }),
+    # 索引按实际查询形态设计：
+    #   按物料查流水/期初、按时间范围查流水（月结、记录筛选、分页）、
+    #   未处理预警、按物料查盘点、按物料定位库存、按月份读月结报表
+    # SQLite 不支持 INCLUDE，改为把覆盖列追加到索引键末尾
+    (2, "性能索引", {
+        "mssql": [
+            _mssql_index("UX_Inventory_material", "Inventory",
+                         "CREATE UNIQUE INDEX UX_Inventory_material ON Inventory(material_id) "
+                         "INCLUDE (current_quantity, last_updated)"),
+            _mssql_index("IX_InOutRecord_material_time", "InOutRecord",
+                         "CREATE INDEX IX_InOutRecord_material_time ON InOutRecord(material_id, timestamp) "
+                         "INCLUDE (type, quantity)"),
+            _mssql_index("IX_InOutRecord_time", "InOutRecord",
+                         "CREATE INDEX IX_InOutRecord_time ON InOutRecord(timestamp) "
+                         "INCLUDE (material_id, user_id, type, quantity)"),
+            _mssql_index("IX_Alert_open", "Alert",
+                         "CREATE INDEX IX_Alert_open ON Alert(is_resolved, material_id) "
+                         "INCLUDE (alert_type, current_quantity)"),
+            _mssql_index("IX_InventoryCheck_material", "InventoryCheck",
+                         "CREATE INDEX IX_InventoryCheck_material ON InventoryCheck(material_id, check_time) "
+                         "INCLUDE (real_quantity, recorded_quantity)"),
+            _mssql_index("UX_Report_month_material", "Report",
+                         "CREATE UNIQUE INDEX UX_Report_month_material ON Report(month, material_id) "
+                         "INCLUDE (initial_quantity, in_quantity, out_quantity, final_quantity)"),
+        ],
+        "sqlite": [
+            "CREATE UNIQUE INDEX IF NOT EXISTS UX_Inventory_material ON Inventory(material_id)",
+            "CREATE INDEX IF NOT EXISTS IX_InOutRecord_material_time "
+            "ON InOutRecord(material_id, timestamp, type, quantity)",
+            "CREATE INDEX IF NOT EXISTS IX_InOutRecord_time "
+            "ON InOutRecord(timestamp, material_id, type, quantity)",
+            "CREATE INDEX IF NOT EXISTS IX_Alert_open ON Alert(is_resolved, material_id, alert_type)",
+            "CREATE INDEX IF NOT EXISTS IX_InventoryCheck_material "
+            "ON InventoryCheck(material_id, check_time)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS UX_Report_month_material ON Report(month, material_id)",
+        ],
+    }),
+    # 物料目录缓存的增量刷新水位线：新增/修改物料时由默认值和触发器维护 modified_time
+    (3, "物料修改时间 Material.modified_time", {
+        "mssql": [
+            """
+            IF COL_LENGTH('Material', 'modified_time') IS NULL
+                ALTER TABLE Material ADD modified_time DATETIME NOT NULL
+                    CONSTRAINT DF_Material_modified_time DEFAULT GETDATE()
+            """,
+            """
+            IF OBJECT_ID('TR_Material_modified_time', 'TR') IS NULL
+                EXEC('CREATE TRIGGER TR_Material_modified_time ON Material AFTER UPDATE AS
+                      BEGIN
+                          SET NOCOUNT ON;
+                          IF NOT UPDATE(modified_time)
+                              UPDATE M SET modified_time = GETDATE()
+                              FROM Material M JOIN inserted i ON i.material_id = M.material_id;
+                      END')
+            """,
+            _mssql_index("IX_Material_modified_time", "Material",
+                         "CREATE INDEX IX_Material_modified_time ON Material(modified_time)"),
+        ],
+        "sqlite": [
+            "ALTER TABLE Material ADD COLUMN modified_time DATETIME",
+            "UPDATE Material SET modified_time = datetime('now', 'localtime')",
+            """
+            CREATE TRIGGER IF NOT EXISTS TR_Material_inserted AFTER INSERT ON Material
+            BEGIN
+                UPDATE Material SET modified_time = datetime('now', 'localtime')
+                WHERE material_id = NEW.material_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS TR_Material_modified_time
+            AFTER UPDATE OF material_name, supplier, unit, max_quantity, min_quantity, note ON Material
+            BEGIN
+                UPDATE Material SET modified_time = datetime('now', 'localtime')
+                WHERE material_id = NEW.material_id;
+            END
+            """,
+            "CREATE INDEX IF NOT EXISTS IX_Material_modified_time ON Material(modified_time)",
+        ],
+    }),
+    # 批量盘点：开单时冻结账面数量，逐行录入实盘数，应用时一次性调整库存并写盘点记录
+    (4, "盘点单 StocktakeSession / StocktakeLine", {
+        "mssql": [
+            """
+            IF OBJECT_ID('StocktakeSession', 'U') IS NULL
+                CREATE TABLE StocktakeSession (
+                    session_id INT PRIMARY KEY IDENTITY(1,1),
+                    created_by INT NOT NULL,
+                    frozen_time DATETIME NOT NULL DEFAULT GETDATE(),
+                    status NVARCHAR(10) NOT NULL DEFAULT '进行中'
+                        CHECK (status IN ('进行中', '已应用', '已作废')),
+                    applied_by INT NULL,
+                    applied_time DATETIME NULL,
+                    note NVARCHAR(255),
+                    FOREIGN KEY (created_by) REFERENCES Users(user_id),
+                    FOREIGN KEY (applied_by) REFERENCES Users(user_id)
+                )
+            """,
+            """
+            IF OBJECT_ID('StocktakeLine', 'U') IS NULL
+                CREATE TABLE StocktakeLine (
+                    session_id INT NOT NULL,
+                    material_id INT NOT NULL,
+                    frozen_quantity INT NOT NULL,
+                    counted_quantity INT NULL,
+                    counted_by INT NULL,
+                    counted_time DATETIME NULL,
+                    PRIMARY KEY (session_id, material_id),
+                    FOREIGN KEY (session_id) REFERENCES StocktakeSession(session_id),
+                    FOREIGN KEY (material_id) REFERENCES Material(material_id),
+                    FOREIGN KEY (counted_by) REFERENCES Users(user_id)
+                )
+            """,
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS StocktakeSession (
+                session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_by INT NOT NULL,
+                frozen_time DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+                status NVARCHAR(10) NOT NULL DEFAULT '进行中'
+                    CHECK (status IN ('进行中', '已应用', '已作废')),
+                applied_by INT,
+                applied_time DATETIME,
+                note NVARCHAR(255),
+                FOREIGN KEY (created_by) REFERENCES Users(user_id),
+                FOREIGN KEY (applied_by) REFERENCES Users(user_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS StocktakeLine (
+                session_id INT NOT NULL,
+                material_id INT NOT NULL,
+                frozen_quantity INT NOT NULL,
+                counted_quantity INT,
+                counted_by INT,
+                counted_time DATETIME,
+                PRIMARY KEY (session_id, material_id),
+                FOREIGN KEY (session_id) REFERENCES StocktakeSession(session_id),
+                FOREIGN KEY (material_id) REFERENCES Material(material_id),
+                FOREIGN KEY (counted_by) REFERENCES Users(user_id)
+            )
+            """,
+        ],
+    }),
+    # 盘点时的流水水位线（当时已提交的最大 record_id），对账按它划分盘点前后的流水，
+    # 不再依赖与流水时间精度相同的盘点时间；旧记录为 NULL，仍按时间划分
+    (5, "盘点流水水位线 last_record_id", {
+        "mssql": [
+            """
+            IF COL_LENGTH('StocktakeSession', 'last_record_id') IS NULL
+                ALTER TABLE StocktakeSession ADD last_record_id INT NULL
+            """,
+            """
+            IF COL_LENGTH('InventoryCheck', 'last_record_id') IS NULL
+                ALTER TABLE InventoryCheck ADD last_record_id INT NULL
+            """,
+        ],
+        "sqlite": [
+            "ALTER TABLE StocktakeSession ADD COLUMN last_record_id INT",
+            "ALTER TABLE InventoryCheck ADD COLUMN last_record_id INT",
+        ],
+    }),
+]
+
+
+def _check_inventory_duplicates(cursor):
+    # 唯一索引 UX_Inventory_material 要求每种物料只有一行库存，已有重复行时直接建索引只会得到约束错误
+    cursor.execute("SELECT material_id, COUNT(*) FROM Inventory GROUP BY material_id HAVING COUNT(*) > 1")
+    duplicates = sorted(tuple(row) for row in cursor.fetchall())
+    if duplicates:
+        detail = "、".join(f"物料 {mid}（{count} 行）" for mid, count in duplicates[:10])
+        raise MigrationError(
+            f"Inventory 中有 {len(duplicates)} 个物料存在多行库存，无法创建唯一索引：{detail}。"
+            f"请按出入库流水核对后每种物料只保留一行，再重新执行迁移"
+        )
+
+
+# 执行某版本的语句之前要通过的数据检查
+PRECHECKS = {
+    2: _check_inventory_duplicates,
+}
+
+
+_VERSION_TABLE = {
+    "mssql": """
+        IF OBJECT_ID('SchemaVersion', 'U') IS NULL
+            CREATE TABLE SchemaVersion (
+                version INT PRIMARY KEY,
+                description NVARCHAR(200) NOT NULL,
+                applied_time DATETIME DEFAULT GETDATE()
+            )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS SchemaVersion (
+            version INTEGER PRIMARY KEY,
+            description NVARCHAR(200) NOT NULL,
+            applied_time DATETIME DEFAULT (datetime('now', 'localtime'))
+        )
+    """,
+}
+
+
+def applied_versions(conn, backend):
+    cursor = conn.cursor()
+    cursor.execute(_VERSION_TABLE[backend])
+    conn.commit()
+    cursor.execute("SELECT version FROM SchemaVersion")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migrations(conn, backend=None, target=None, verbose=False):
+    """在给定连接上执行未执行的迁移，每个版本一个事务，返回本次执行的版本号"""
+    backend = backend or db_config.DB_BACKEND
+    done = applied_versions(conn, backend)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        cursor = conn.cursor()
+        try:
+            if version in PRECHECKS:
+                PRECHECKS[version](cursor)
+            for sql in statements[backend]:
+                cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO SchemaVersion (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"已执行迁移 {version}：{description}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库版本迁移")
+    parser.add_argument("--status", action="store_true", help="只显示迁移状态")
+    parser.add_argument("--target", type=int, help="只迁移到指定版本")
+    args = parser.parse_args()
+
+    with db_config.db_connection() as conn:
+        if args.status:
+            done = applied_versions(conn, db_config.DB_BACKEND)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>4}  {'已执行' if version in done else '未执行'}  {description}")
+            return
+        try:
+            applied = apply_migrations(conn, target=args.target, verbose=True)
+        except MigrationError as e:
+            print(f"迁移中止：{e}")
+            sys.exit(1)
+        if not applied:
+            print("数据库已是最新版本")
+
+
+if __name__ == "__main__":
+    main()
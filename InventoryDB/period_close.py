@@ -0,0 +1,207 @@
+# period_close.py
+# 月结：把每月每个物料的期初/入库/出库/期末固化到 Report 表。
+# 某月的期初直接取上月 Report 的期末，只需汇总当月记录，报表耗时不随历史增长。
+# ReportClose 记录结账时已看到的最大 record_id，之后补录到已结账月份的记录会触发该月及之后月份重新结账。
+# 结账、重结在事务内持有月结排他锁，并发的报表请求依次执行，不会同时改写同一月份。
+import sqlite3
+from datetime import datetime
+
+import db_config
+from db_config import db_connection
+
+
+def month_range(month):
+    """'2025-05' -> (2025-05-01 00:00, 2025-06-01 00:00)，左闭右开"""
+    start = datetime.strptime(month, "%Y-%m")
+    return start, _add_months(start, 1)
+
+
+def _add_months(dt, months):
+    index = dt.year * 12 + dt.month - 1 + months
+    return dt.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def shift_month(month, months):
+    """按月偏移月份字符串，如 shift_month('2025-01', -1) == '2024-12'"""
+    return _add_months(datetime.strptime(month, "%Y-%m"), months).strftime("%Y-%m")
+
+
+_MONTH_DELTA_SQL = """
+    SELECT material_id,
+           SUM(CASE WHEN type = '入库' THEN quantity ELSE 0 END) AS in_quantity,
+           SUM(CASE WHEN type = '出库' THEN quantity ELSE 0 END) AS out_quantity
+    FROM InOutRecord
+    WHERE timestamp >= ? AND timestamp < ?
+    GROUP BY material_id
+"""
+
+# 有上月结账数据时的期初来源
+_PREVIOUS_CLOSE_SQL = """
+    SELECT material_id, final_quantity AS opening
+    FROM Report
+    WHERE month = ?
+"""
+
+# 没有任何更早的结账时，一次性汇总该月之前的全部历史作为期初
+_HISTORY_OPENING_SQL = """
+    SELECT material_id,
+           SUM(CASE WHEN type = '入库' THEN quantity ELSE -quantity END) AS opening
+    FROM InOutRecord
+    WHERE timestamp < ?
+    GROUP BY material_id
+"""
+
+
+def _is_sqlite(cursor):
+    # datagen 等脚本直接传入 sqlite3 游标，不一定与 db_config 的后端设置一致
+    return db_config.DB_BACKEND == "sqlite" or isinstance(cursor, sqlite3.Cursor)
+
+
+def _lock_periods(cursor):
+    """在调用方事务中取得月结排他锁，事务结束时释放（可重复获取）"""
+    if _is_sqlite(cursor):
+        # 写语句即取得整个库的写锁；须是事务中的第一条语句，WAL 下读过旧快照后无法再升级为写锁
+        cursor.execute("UPDATE ReportClose SET last_record_id = last_record_id WHERE 1 = 0")
+        return
+    cursor.execute("""
+        SET NOCOUNT ON;
+        DECLARE @result INT;
+        EXEC @result = sp_getapplock @Resource = 'InventoryDB.period_close', @LockMode = 'Exclusive',
+                                     @LockOwner = 'Transaction', @LockTimeout = 30000;
+        SELECT @result;
+    """)
+    if cursor.fetchone()[0] < 0:
+        raise RuntimeError("等待其他月结操作超时，请稍后重试")
+
+
+def _watermark(cursor):
+    """当前已提交的最大 record_id
+
+    SQL Server 的自增值在插入时分配、提交可能更晚，直接取 MAX 会把迟到提交的较小 ID 留在水位线之下。
+    TABLOCK 共享表锁要等正在写入 InOutRecord 的事务全部结束（READCOMMITTEDLOCK 使 RCSI 下也加锁读），
+    语句结束即释放；此后新插入的记录 ID 都大于读到的值。SQLite 同一时刻只有一个写事务，不存在该问题。
+    """
+    if _is_sqlite(cursor):
+        cursor.execute("SELECT MAX(record_id) FROM InOutRecord")
+    else:
+        cursor.execute("SELECT MAX(record_id) FROM InOutRecord WITH (TABLOCK, READCOMMITTEDLOCK)")
+    return cursor.fetchone()[0] or 0
+
+
+def _closed_months(cursor):
+    cursor.execute("SELECT month FROM ReportClose ORDER BY month")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def close_month(cursor, month, watermark=None):
+    """在调用方事务中（重新）结账某月，上月已结账时基于上月期末，否则基于全部历史"""
+    start, end = month_range(month)
+    previous = shift_month(month, -1)
+
+    _lock_periods(cursor)
+    if watermark is None:
+        watermark = _watermark(cursor)
+
+    cursor.execute("SELECT COUNT(*) FROM ReportClose WHERE month = ?", (previous,))
+    if cursor.fetchone()[0]:
+        opening_sql, opening_params = _PREVIOUS_CLOSE_SQL, [previous]
+    else:
+        opening_sql, opening_params = _HISTORY_OPENING_SQL, [start]
+
+    cursor.execute("DELETE FROM Report WHERE month = ?", (month,))
+    cursor.execute(f"""
+        INSERT INTO Report (month, material_id, initial_quantity, in_quantity, out_quantity, final_quantity)
+        SELECT ?, M.material_id,
+               COALESCE(P.opening, 0),
+               COALESCE(D.in_quantity, 0),
+               COALESCE(D.out_quantity, 0),
+               COALESCE(P.opening, 0) + COALESCE(D.in_quantity, 0) - COALESCE(D.out_quantity, 0)
+        FROM Material M
+        LEFT JOIN ({opening_sql}) P ON P.material_id = M.material_id
+        LEFT JOIN ({_MONTH_DELTA_SQL}) D ON D.material_id = M.material_id
+    """, [month] + opening_params + [start, end])
+
+    cursor.execute("DELETE FROM ReportClose WHERE month = ?", (month,))
+    cursor.execute(
+        "INSERT INTO ReportClose (month, last_record_id) VALUES (?, ?)",
+        (month, watermark)
+    )
+
+
+def reclose_stale_months(cursor):
+    """检测补录到已结账月份的记录，从最早受影响的月份起依次重新结账，返回重结的月份"""
+    _lock_periods(cursor)
+    closed = _closed_months(cursor)
+    if not closed:
+        return []
+
+    high = _watermark(cursor)
+    cursor.execute("SELECT MIN(last_record_id) FROM ReportClose")
+    low = cursor.fetchone()[0] or 0
+    if high <= low:
+        return []
+
+    # 只看上次结账之后新增的记录，落在已结账月份（含）之前的即为补录
+    _, closed_end = month_range(closed[-1])
+    cursor.execute("""
+        SELECT MIN(timestamp)
+        FROM InOutRecord
+        WHERE record_id > ? AND record_id <= ? AND timestamp < ?
+    """, (low, high, closed_end))
+    earliest = cursor.fetchone()[0]
+
+    stale = []
+    if earliest is not None:
+        if not isinstance(earliest, datetime):
+            earliest = datetime.fromisoformat(str(earliest))
+        first_stale = earliest.strftime("%Y-%m")
+        stale = [month for month in closed if month >= first_stale]
+        for month in stale:
+            close_month(cursor, month, high)
+
+    # 其余已结账月份不受影响，推进其水位线
+    cursor.execute("UPDATE ReportClose SET last_record_id = ? WHERE last_record_id < ?", (high, high))
+    return stale
+
+
+def ensure_closed(cursor, month):
+    """保证某月已结账且数据最新：先处理补录，再从最近的已结账月份向后补结到该月"""
+    _lock_periods(cursor)
+    reclose_stale_months(cursor)
+    closed = set(_closed_months(cursor))
+    if month in closed:
+        return
+
+    earlier = [m for m in closed if m < month]
+    current = shift_month(max(earlier), 1) if earlier else month
+    while current <= month:
+        close_month(cursor, current)
+        current = shift_month(current, 1)
+
+
+def get_monthly_report(month):
+    """返回某月报表 [(物料名称, 期初, 入库, 出库, 期末)]，必要时自动结账"""
+    try:
+        return _read_monthly_report(month)
+    except Exception as e:
+        # ReportClose 主键冲突说明另一个（未加锁的）进程刚结账了同一月份，整个事务已回滚，按已结账重新读取
+        if type(e).__name__ != "IntegrityError":  # sqlite3 / pyodbc 的约束错误
+            raise
+        return _read_monthly_report(month)
+
+
+def _read_monthly_report(month):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        ensure_closed(cursor, month)
+        cursor.execute("""
+            SELECT M.material_name,
+                   COALESCE(R.initial_quantity, 0) AS start_quantity,
+                   COALESCE(R.in_quantity, 0) AS in_quantity,
+                   COALESCE(R.out_quantity, 0) AS out_quantity,
+                   COALESCE(R.final_quantity, 0) AS end_quantity
+            FROM Material M
+            LEFT JOIN Report R ON R.material_id = M.material_id AND R.month = ?
+            ORDER BY M.material_id
+        """, (month,))
+        return cursor.fetchall()
@@ -0,0 +1,300 @@
+# query_stats.py
+# SQL 语句级统计：启用后连接池返回的游标被包装，记录每条语句的执行耗时、取数耗时、行数和调用位置，
+# 按语句（空白折叠、IN 列表合并后的文本）汇总，保留最近若干次耗时做滚动直方图与分位数；
+# 单次耗时超过阈值的语句写入慢查询日志（不记录参数，避免泄露密码等敏感数据）。
+#   INVENTORY_QUERY_STATS=1                启动时启用（也可在“查询诊断”窗口中随时开关）
+#   INVENTORY_SLOW_QUERY_MS=200            慢查询阈值（毫秒）
+#   INVENTORY_SLOW_QUERY_LOG=slow_queries.log
+# 未启用时连接池直接返回原始游标，唯一的开销是 cursor() 中的一次判断。
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import db_pool
+
+ENABLED_AT_START = os.environ.get("INVENTORY_QUERY_STATS", "0") not in ("", "0")
+SLOW_QUERY_MS = float(os.environ.get("INVENTORY_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.environ.get("INVENTORY_SLOW_QUERY_LOG", "slow_queries.log")
+
+WINDOW = 512          # 每条语句保留最近多少次耗时
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+MAX_SQL_CACHE = 4096
+
+# 调用位置取第一个不属于这些文件的栈帧
+_INFRASTRUCTURE = {"query_stats.py", "db_pool.py", "db_config.py", "contextlib.py"}
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_normalized = {}
+
+
+def normalize_sql(sql):
+    """折叠空白并把 IN (?, ?, ...) 合并为 IN (?...)，使分批的同一语句汇总到一起"""
+    key = _normalized.get(sql)
+    if key is None:
+        key = _IN_LIST.sub("(?...)", _WHITESPACE.sub(" ", sql).strip())
+        if len(_normalized) >= MAX_SQL_CACHE:
+            _normalized.clear()
+        _normalized[sql] = key
+    return key
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _INFRASTRUCTURE:
+            return f"{filename}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class StatementStats:
+    """一条语句的累计统计与最近 WINDOW 次耗时"""
+
+    __slots__ = ("sql", "calls", "errors", "total_ms", "exec_ms", "fetch_ms", "max_ms", "rows",
+                 "recent", "sites", "last_time")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.exec_ms = 0.0
+        self.fetch_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.recent = deque(maxlen=WINDOW)
+        self.sites = {}
+        self.last_time = None
+
+    def percentile(self, p):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def histogram(self):
+        """最近 WINDOW 次耗时的分桶计数 [(上界毫秒, 次数)]，最后一个桶上界为 None"""
+        counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for value in self.recent:
+            for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return list(zip(HISTOGRAM_BOUNDS_MS + (None,), counts))
+
+    def to_dict(self):
+        return {
+            "sql": self.sql,
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "exec_ms": round(self.exec_ms, 3),
+            "fetch_ms": round(self.fetch_ms, 3),
+            "p50_ms": round(self.percentile(0.5), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "sites": sorted(self.sites.items(), key=lambda item: item[1], reverse=True),
+            "histogram": self.histogram(),
+            "last_time": self.last_time,
+        }
+
+
+class QueryStats:
+    """线程安全的语句统计与慢查询日志"""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, log_path=SLOW_QUERY_LOG):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._statements = {}
+        self.started = time.time()
+
+    def record(self, sql, exec_ms, fetch_ms, rows, site, error=False):
+        key = normalize_sql(sql)
+        total = exec_ms + fetch_ms
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats(key)
+            stats.calls += 1
+            stats.errors += error
+            stats.total_ms += total
+            stats.exec_ms += exec_ms
+            stats.fetch_ms += fetch_ms
+            stats.rows += rows
+            stats.recent.append(total)
+            stats.sites[site] = stats.sites.get(site, 0) + 1
+            stats.last_time = now
+            if total > stats.max_ms:
+                stats.max_ms = total
+        if self.slow_ms is not None and total >= self.slow_ms:
+            self._log_slow(key, exec_ms, fetch_ms, rows, site, error)
+
+    def _log_slow(self, sql, exec_ms, fetch_ms, rows, site, error):
+        if not self.log_path:
+            return
+        line = "\t".join((
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            f"{exec_ms + fetch_ms:.1f}ms",
+            f"exec={exec_ms:.1f}",
+            f"fetch={fetch_ms:.1f}",
+            f"rows={rows}",
+            "ERROR" if error else "OK",
+            site,
+            sql,
+        ))
+        try:
+            with self._log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print("写慢查询日志失败：", e)
+
+    def top(self, n=50, key="total_ms"):
+        """按 key 排序的前 n 条语句统计（字典列表）"""
+        with self._lock:
+            stats = [s.to_dict() for s in self._statements.values()]
+        stats.sort(key=lambda s: s[key], reverse=True)
+        return stats[:n] if n else stats
+
+    def summary(self):
+        with self._lock:
+            calls = sum(s.calls for s in self._statements.values())
+            total_ms = sum(s.total_ms for s in self._statements.values())
+            return {
+                "statements": len(self._statements),
+                "calls": calls,
+                "total_ms": round(total_ms, 3),
+                "since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self.started = time.time()
+
+
+class InstrumentedCursor(db_pool.CursorWrapper):
+    """包装 DB-API 游标：execute 计时，之后的 fetch* 计入同一次执行，取完或再次执行时汇总"""
+
+    def __init__(self, cursor, recorder):
+        super().__init__(cursor)
+        object.__setattr__(self, "_recorder", recorder)
+        object.__setattr__(self, "_pending", None)   # [sql, 执行耗时, 取数耗时, 行数, 调用位置]
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        object.__setattr__(self, "_pending", None)
+        sql, exec_ms, fetch_ms, rows, site = pending
+        if rows == 0:
+            # 没有取数的写语句记受影响行数
+            affected = getattr(self._cursor, "rowcount", -1)
+            rows = affected if affected and affected > 0 else 0
+        self._recorder.record(sql, exec_ms, fetch_ms, rows, site)
+
+    def _run(self, method, sql, args):
+        self._finish()
+        site = _call_site()
+        start = time.perf_counter()
+        try:
+            method(sql, *args)
+        except Exception:
+            self._recorder.record(sql, (time.perf_counter() - start) * 1000, 0.0, 0, site, error=True)
+            raise
+        object.__setattr__(self, "_pending", [sql, (time.perf_counter() - start) * 1000, 0.0, 0, site])
+        return self
+
+    def execute(self, sql, *params):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._run(self._cursor.executemany, sql, (seq_of_params,))
+
+    def _fetched(self, start, count, done):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += (time.perf_counter() - start) * 1000
+            pending[3] += count
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        self._fetched(start, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+_recorder = QueryStats()
+
+
+def get_stats():
+    return _recorder
+
+
+def _wrap(cursor):
+    return InstrumentedCursor(cursor, _recorder)
+
+
+def is_enabled():
+    return db_pool.has_cursor_hook(_wrap)
+
+
+def enable(slow_ms=None, log_path=None):
+    """开始统计（对之后创建的游标生效）"""
+    if slow_ms is not None:
+        _recorder.slow_ms = slow_ms
+    if log_path is not None:
+        _recorder.log_path = log_path
+    db_pool.add_cursor_hook(_wrap)
+
+
+def disable():
+    db_pool.remove_cursor_hook(_wrap)
+
+
+def top_statements(n=50, key="total_ms"):
+    return _recorder.top(n, key)
+
+
+def reset():
+    _recorder.reset()
+
+
+if ENABLED_AT_START:
+    enable()
@@ -0,0 +1,156 @@
+# query_stats_window.py
+# 查询诊断：按总耗时列出语句统计，选中一行查看完整 SQL、耗时分布和调用位置
+
+import json
+import customtkinter as ctk
+from tkinter import filedialog, messagebox
+
+import query_stats
+from virtual_table import VirtualTable
+
+REFRESH_MS = 2000
+TOP_N = 200
+
+
+class QueryStatsWindow(ctk.CTkToplevel):
+    SORT_KEYS = {"总耗时": "total_ms", "平均耗时": "avg_ms", "P95": "p95_ms", "调用次数": "calls", "行数": "rows"}
+
+    def __init__(self, master=None):
+        super().__init__(master)
+        self.title("查询诊断")
+        self.geometry("1100x650")
+        self.statements = []
+        self._after_id = None
+
+        # 顶部：状态与操作
+        top_frame = ctk.CTkFrame(self)
+        top_frame.pack(fill="x", padx=10, pady=10)
+
+        self.status_label = ctk.CTkLabel(top_frame, text="")
+        self.status_label.pack(side="left", padx=10)
+
+        self.sort_option = ctk.CTkOptionMenu(top_frame, values=list(self.SORT_KEYS),
+                                             command=lambda _: self.refresh())
+        self.sort_option.set("总耗时")
+        self.sort_option.pack(side="right", padx=5)
+        ctk.CTkLabel(top_frame, text="排序：").pack(side="right")
+
+        btn_frame = ctk.CTkFrame(self)
+        btn_frame.pack(fill="x", padx=10)
+        self.toggle_button = ctk.CTkButton(btn_frame, text="", command=self.toggle)
+        self.toggle_button.pack(side="left", padx=5, pady=5)
+        ctk.CTkButton(btn_frame, text="🔄 刷新", command=self.refresh).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="🧹 清空统计", command=self.reset).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="💾 导出 JSON", command=self.export_json).pack(side="left", padx=5)
+
+        ctk.CTkLabel(btn_frame, text="慢查询阈值(ms)：").pack(side="left", padx=(20, 0))
+        self.slow_entry = ctk.CTkEntry(btn_frame, width=80)
+        self.slow_entry.insert(0, f"{query_stats.get_stats().slow_ms:g}")
+        self.slow_entry.pack(side="left", padx=5)
+        self.slow_entry.bind("<Return>", lambda e: self.apply_threshold())
+
+        # 语句列表
+        self.table = VirtualTable(
+            self,
+            columns=("语句", "次数", "总耗时ms", "平均ms", "P95ms", "最大ms", "取数ms", "行数", "主要调用位置"),
+            column_settings={
+                "语句": {"width": 380},
+                "次数": {"width": 60, "anchor": "e"},
+                "总耗时ms": {"width": 80, "anchor": "e"},
+                "平均ms": {"width": 70, "anchor": "e"},
+                "P95ms": {"width": 70, "anchor": "e"},
+                "最大ms": {"width": 70, "anchor": "e"},
+                "取数ms": {"width": 70, "anchor": "e"},
+                "行数": {"width": 70, "anchor": "e"},
+                "主要调用位置": {"width": 220},
+            },
+        )
+        self.table.pack(fill="both", expand=True, padx=10, pady=5)
+        self.table.tree.bind("<<TreeviewSelect>>", self.show_detail, add="+")
+
+        # 选中语句的详情
+        self.detail = ctk.CTkTextbox(self, height=160, wrap="word")
+        self.detail.pack(fill="x", padx=10, pady=(0, 10))
+
+        self.refresh()
+        self.bind("<Destroy>", self._on_destroy, add="+")
+
+    def _update_status(self):
+        enabled = query_stats.is_enabled()
+        summary = query_stats.get_stats().summary()
+        state = "已启用" if enabled else "未启用"
+        self.status_label.configure(
+            text=f"统计{state}　自 {summary['since']} 起共 {summary['calls']} 次执行、"
+                 f"{summary['statements']} 条语句、总耗时 {summary['total_ms']:.0f} ms"
+        )
+        self.toggle_button.configure(text="⏸ 停用统计" if enabled else "▶ 启用统计")
+
+    def refresh(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        # 统计在内存中，直接在主线程读取即可
+        key = self.SORT_KEYS[self.sort_option.get()]
+        self.statements = query_stats.top_statements(TOP_N, key)
+        self.table.set_rows([
+            (s["sql"][:200], s["calls"], f"{s['total_ms']:.1f}", f"{s['avg_ms']:.2f}", f"{s['p95_ms']:.2f}",
+             f"{s['max_ms']:.1f}", f"{s['fetch_ms']:.1f}", s["rows"], s["sites"][0][0] if s["sites"] else "")
+            for s in self.statements
+        ])
+        self._update_status()
+        self._after_id = self.after(REFRESH_MS, self.refresh)
+
+    def show_detail(self, event=None):
+        index = self.table.selected_index()
+        if index is None or index >= len(self.statements):
+            return
+        s = self.statements[index]
+        # 自动刷新会重排列表，暂停刷新以便查看
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+            self._after_id = None
+
+        lines = [s["sql"], ""]
+        lines.append(f"执行 {s['calls']} 次，出错 {s['errors']} 次，执行 {s['exec_ms']:.1f} ms，"
+                     f"取数 {s['fetch_ms']:.1f} ms，P50 {s['p50_ms']:.2f} ms，最近一次 {s['last_time']}")
+        lines.append("最近耗时分布：" + "  ".join(
+            f"{'>' + str(query_stats.HISTOGRAM_BOUNDS_MS[-1]) if bound is None else '≤' + str(bound)}ms:{count}"
+            for bound, count in s["histogram"] if count
+        ))
+        lines.append("调用位置：" + "；".join(f"{site} ×{count}" for site, count in s["sites"][:10]))
+        self.detail.delete("1.0", "end")
+        self.detail.insert("1.0", "\n".join(lines))
+
+    def toggle(self):
+        if query_stats.is_enabled():
+            query_stats.disable()
+        else:
+            query_stats.enable()
+        self.refresh()
+
+    def reset(self):
+        query_stats.reset()
+        self.detail.delete("1.0", "end")
+        self.refresh()
+
+    def apply_threshold(self):
+        try:
+            query_stats.get_stats().slow_ms = float(self.slow_entry.get())
+        except ValueError:
+            messagebox.showwarning("提示", "请输入有效的毫秒数", parent=self)
+            return
+        messagebox.showinfo("已设置", f"慢查询阈值：{self.slow_entry.get()} ms", parent=self)
+
+    def export_json(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON 文件", "*.json")],
+                                                 title="导出查询统计", parent=self)
+        if not file_path:
+            return
+        data = {"summary": query_stats.get_stats().summary(), "statements": query_stats.top_statements(0)}
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        messagebox.showinfo("成功", f"查询统计已导出到：\n{file_path}", parent=self)
+
+    def _on_destroy(self, event):
+        if event.widget is self and self._after_id is not None:
+            self.after_cancel(self._after_id)
+            self._after_id = None
@@ -0,0 +1,266 @@
+# reconcile.py
+# 库存对账：按流水重算每种物料的应有库存，与 Inventory.current_quantity 比较，报告差异并可选修复。
+# 应有库存 = 最近一次盘点的实盘数量 + 盘点之后的入库 − 出库；从未盘点的物料为全部流水的净额。
+# 盘点之后的流水按盘点记录的流水水位线（盘点时已提交的最大 record_id）划分；
+# 迁移 5 之前的盘点记录没有水位线，仍按时间划分，与盘点时间相同（同一秒）的流水视为盘点前已发生。
+# 按物料ID区间分片，每片一条集合查询（走 InOutRecord(material_id, timestamp, ...) 覆盖索引）；
+# 流水较多时分片交给多个进程并行。
+#   python reconcile.py                         只报告差异
+#   python reconcile.py --output diff.csv       差异写入 CSV（以 .json 结尾时写完整 JSON 报告）
+#   python reconcile.py --repair                在一个事务中把差异物料的库存改为应有值，并重新检查预警
+# 修复不写盘点记录，以免覆盖盘点基准、掩盖流水问题；修复明细可用 --output 留档。
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import db_config
+from db_config import db_connection, locked
+from alert_engine import evaluate_alerts
+from utils import chunked, placeholders
+
+CHUNK_MATERIALS = 2000          # 每个分片的物料ID跨度
+PARALLEL_THRESHOLD = 1_000_000  # 流水超过该行数时使用多进程
+MAX_WORKERS = 8
+
+# 最近一次盘点取 (material_id, check_time) 索引上的 MAX，同一时间多次盘点时取 check_id 最大的一条；
+# 水位线之后的流水都在盘点时间之后写入，timestamp >= check_time 只用来走索引范围查找
+_EXPECTED_SQL = """
+    SELECT M.material_id, M.material_name, I.current_quantity, C.real_quantity, C.check_time,
+           COALESCE(C.real_quantity, 0)
+             + COALESCE(SUM(CASE WHEN R.type = '入库' THEN R.quantity ELSE -R.quantity END), 0) AS expected,
+           COUNT(R.material_id) AS movements
+    FROM Material M
+    LEFT JOIN Inventory I ON I.material_id = M.material_id
+    LEFT JOIN InventoryCheck C ON C.check_id = (
+        SELECT MAX(c1.check_id) FROM InventoryCheck c1
+        WHERE c1.material_id = M.material_id
+          AND c1.check_time = (SELECT MAX(c2.check_time) FROM InventoryCheck c2
+                               WHERE c2.material_id = M.material_id)
+    )
+    LEFT JOIN InOutRecord R ON R.material_id = M.material_id
+         AND R.timestamp >= COALESCE(C.check_time, '1900-01-01')
+         AND (R.record_id > C.last_record_id
+              OR (C.last_record_id IS NULL AND R.timestamp > COALESCE(C.check_time, '1900-01-01')))
+    WHERE {material_filter}
+    GROUP BY M.material_id, M.material_name, I.current_quantity, C.real_quantity, C.check_time
+"""
+
+
+def _range_query():
+    return _EXPECTED_SQL.format(material_filter="M.material_id >= ? AND M.material_id < ?")
+
+
+def _ids_query(n):
+    return _EXPECTED_SQL.format(material_filter=f"M.material_id IN ({placeholders(n)})")
+
+
+def _discrepancy(row):
+    """查询结果行 -> 差异字典；库存与应有值一致时返回 None"""
+    material_id, name, current, check_quantity, check_time, expected, movements = row
+    # 新建物料不建库存行，没有库存行且应有值为 0 的物料视为一致
+    if current == expected or (current is None and expected == 0):
+        return None
+    return {
+        "material_id": material_id,
+        "material_name": name,
+        "current_quantity": current,   # None 表示 Inventory 中缺少该物料
+        "expected_quantity": expected,
+        "difference": None if current is None else current - expected,
+        "last_check_time": check_time,
+        "last_check_quantity": check_quantity,
+        "movements_since_check": movements,
+    }
+
+
+def reconcile_range(lo, hi):
+    """对物料ID在 [lo, hi) 的物料对账，返回 (差异列表, 物料数, 参与计算的流水数)"""
+    discrepancies = []
+    materials = movements = 0
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_range_query(), (lo, hi))
+        for row in cursor.fetchall():
+            materials += 1
+            movements += row[6]
+            item = _discrepancy(row)
+            if item is not None:
+                discrepancies.append(item)
+    return discrepancies, materials, movements
+
+
+def _material_ranges(cursor, chunk_size):
+    cursor.execute("SELECT MIN(material_id), MAX(material_id) FROM Material")
+    low, high = cursor.fetchone()
+    if low is None:
+        return []
+    return [(lo, min(lo + chunk_size, high + 1)) for lo in range(low, high + 1, chunk_size)]
+
+
+def _init_worker(backend, sqlite_path):
+    # 子进程用 spawn 启动，不继承父进程的连接（fork 后关闭继承的 ODBC 连接会断开父进程的会话），
+    # 按父进程的配置各自建立连接池
+    db_config.configure(backend=backend, sqlite_path=sqlite_path, pool_size=1)
+
+
+def reconcile(workers=None, chunk_size=CHUNK_MATERIALS, progress=None):
+    """全量对账，返回报告字典
+
+    workers 为 None 时按流水量自动选择：少于 PARALLEL_THRESHOLD 行在本进程内逐片计算，
+    否则使用 min(CPU 数, MAX_WORKERS) 个进程。progress(已完成分片, 总分片) 可选。
+    """
+    start = time.perf_counter()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        ranges = _material_ranges(cursor, chunk_size)
+        cursor.execute("SELECT MAX(record_id) FROM InOutRecord")   # 行数估计，比 COUNT(*) 快
+        estimated = cursor.fetchone()[0] or 0
+    if workers is None:
+        workers = 1 if estimated < PARALLEL_THRESHOLD else min(os.cpu_count() or 1, MAX_WORKERS)
+    workers = max(1, min(workers, len(ranges) or 1))
+
+    discrepancies = []
+    materials = movements = 0
+
+    def collect(result, done):
+        nonlocal materials, movements
+        discrepancies.extend(result[0])
+        materials += result[1]
+        movements += result[2]
+        if progress:
+            progress(done, len(ranges))
+
+    if workers == 1:
+        for done, (lo, hi) in enumerate(ranges, 1):
+            collect(reconcile_range(lo, hi), done)
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(db_config.DB_BACKEND, db_config.SQLITE_PATH)) as executor:
+            futures = [executor.submit(reconcile_range, lo, hi) for lo, hi in ranges]
+            for done, future in enumerate(as_completed(futures), 1):
+                collect(future.result(), done)
+
+    discrepancies.sort(key=lambda d: (-abs(d["difference"] or d["expected_quantity"]), d["material_id"]))
+    return {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "materials": materials,
+        "movements": movements,
+        "discrepancy_count": len(discrepancies),
+        "net_difference": sum(d["difference"] or 0 for d in discrepancies),
+        "workers": workers,
+        "chunks": len(ranges),
+        "seconds": round(time.perf_counter() - start, 3),
+        "discrepancies": discrepancies,
+    }
+
+
+def repair(material_ids):
+    """在一个事务中把给定物料的库存改为按流水重算的应有值，并对改动的物料重新检查预警
+
+    应有值在事务内重新计算；更新或补建库存行时以刚读到的库存为条件，期间被其他出入库改动的物料跳过。
+    返回 {"repaired", "inserted", "skipped", "alerts", "changes"}。
+    """
+    result = {"repaired": 0, "inserted": 0, "skipped": 0, "alerts": None, "changes": []}
+    ids = sorted(set(material_ids))
+    if not ids:
+        return result
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        changed = []
+        for chunk in chunked(ids):
+            cursor.execute(_ids_query(len(chunk)), chunk)
+            for row in cursor.fetchall():
+                item = _discrepancy(row)
+                if item is None:
+                    continue
+                material_id, current, expected = item["material_id"], item["current_quantity"], \
+                    item["expected_quantity"]
+                if current is None:
+                    # 与首次入库相同的条件插入：读取之后并发入库已建了库存行时不插入，
+                    # 该行的数量已不是刚才读到的值，与下面有条件的 UPDATE 一样跳过
+                    cursor.execute(f"""
+                        INSERT INTO Inventory (material_id, current_quantity, last_updated)
+                        SELECT ?, ?, GETDATE()
+                        WHERE NOT EXISTS (SELECT 1 FROM {locked("Inventory")} WHERE material_id = ?)
+                    """, (material_id, expected, material_id))
+                    if cursor.rowcount == 0:
+                        result["skipped"] += 1
+                        continue
+                    result["inserted"] += 1
+                else:
+                    cursor.execute(
+                        "UPDATE Inventory SET current_quantity = ?, last_updated = GETDATE() "
+                        "WHERE material_id = ? AND current_quantity = ?",
+                        (expected, material_id, current)
+                    )
+                    if cursor.rowcount == 0:
+                        result["skipped"] += 1
+                        continue
+                    result["repaired"] += 1
+                changed.append(material_id)
+                result["changes"].append({"material_id": material_id, "before": current, "after": expected})
+        # 同一事务内做预警状态迁移，退出 with 时一并提交
+        result["alerts"] = evaluate_alerts(cursor, changed)
+    return result
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+CSV_FIELDS = ("material_id", "material_name", "current_quantity", "expected_quantity", "difference",
+              "last_check_time", "last_check_quantity", "movements_since_check")
+
+
+def write_report(report, path):
+    """以 .json 结尾时写完整报告，否则把差异明细写成 CSV（utf-8-sig，Excel 可直接打开）"""
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=_json_default)
+        return
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for item in report["discrepancies"]:
+            writer.writerow([_json_default(v) if isinstance(v, datetime) else v
+                             for v in (item[field] for field in CSV_FIELDS)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按流水重算库存并对账")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="并行进程数，默认按流水量自动选择")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_MATERIALS,
+                        help="每个分片的物料ID跨度")
+    parser.add_argument("--output", help="差异报告路径（.csv 或 .json）")
+    parser.add_argument("--repair", action="store_true",
+                        help="把有差异的物料库存修复为应有值")
+    parser.add_argument("--limit", type=int, default=20, help="在终端列出的差异条数")
+    args = parser.parse_args()
+
+    report = reconcile(workers=args.workers, chunk_size=args.chunk_size)
+    if args.repair and report["discrepancies"]:
+        report["repair"] = repair([d["material_id"] for d in report["discrepancies"]])
+    if args.output:
+        write_report(report, args.output)
+
+    summary = {k: v for k, v in report.items() if k != "discrepancies"}
+    if "repair" in summary:
+        summary["repair"] = {k: v for k, v in report["repair"].items() if k != "changes"}
+    print(json.dumps(summary, ensure_ascii=False, default=_json_default), flush=True)
+    for item in report["discrepancies"][:args.limit]:
+        current = "缺少库存行" if item["current_quantity"] is None else item["current_quantity"]
+        print(f"  物料 {item['material_id']:>8} {item['material_name']}：库存 {current}，"
+              f"应有 {item['expected_quantity']}，差 {item['difference']}")
+
+
+if __name__ == "__main__":
+    main()
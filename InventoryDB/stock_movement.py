@@ -0,0 +1,275 @@
+# stock_movement.py
+import threading
+import time
+
+from db_config import db_connection, locked
+from alert_engine import evaluate_alerts
+from utils import chunked, placeholders
+
+IN_TYPE = "入库"
+OUT_TYPE = "出库"
+MOVEMENT_TYPES = (IN_TYPE, OUT_TYPE)
+
+
+class MovementError(Exception):
+    """出入库参数无效或无法执行"""
+
+
+class InsufficientStockError(MovementError):
+    """出库数量超过当前库存"""
+
+
+class BatchValidationError(MovementError):
+    """批量出入库中有行校验失败，整批未写入
+
+    errors 为 [(行号, 错误信息)]，行号从 0 开始，对应传入的 lines 顺序。
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        detail = "；".join(f"第{index + 1}行：{message}" for index, message in errors[:10])
+        if len(errors) > 10:
+            detail += f"；……共 {len(errors)} 行错误"
+        super().__init__(detail)
+
+
+class MovementStats:
+    """线程安全的出入库吞吐统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.movements = 0
+            self.failed = 0
+            self.busy_seconds = 0.0
+            self.started = time.monotonic()
+
+    def record(self, count, seconds):
+        with self._lock:
+            self.movements += count
+            self.busy_seconds += seconds
+
+    def record_failure(self, seconds):
+        with self._lock:
+            self.failed += 1
+            self.busy_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "movements": self.movements,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 6),
+                "elapsed_seconds": round(elapsed, 6),
+                # 事务内实际耗时计算的吞吐量，以及按墙钟时间计算的吞吐量
+                "movements_per_sec": self.movements / self.busy_seconds if self.busy_seconds else 0.0,
+                "wall_movements_per_sec": self.movements / elapsed if elapsed else 0.0,
+            }
+
+
+_stats = MovementStats()
+
+
+def movement_stats():
+    """返回出入库吞吐统计（movements_per_sec 等）"""
+    return _stats.snapshot()
+
+
+def reset_movement_stats():
+    _stats.reset()
+
+
+def validate_movement(material_id, io_type, quantity):
+    """校验单条出入库参数，返回规范化后的数量"""
+    if material_id is None:
+        raise MovementError("请选择物料")
+    if io_type not in MOVEMENT_TYPES:
+        raise MovementError(f"未知的操作类型：{io_type}")
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        raise MovementError("请输入有效的数量")
+    if quantity <= 0:
+        raise MovementError("数量必须大于0")
+    return quantity
+
+
+def apply_movement(cursor, material_id, user_id, io_type, quantity, note=None):
+    """在调用方事务中执行一次出入库，返回变动后的库存数量
+
+    库存变动是一条带条件的 UPDATE（出库时要求库存足够），
+    不再先读后写，多人同时操作不会丢失更新。
+    """
+    quantity = validate_movement(material_id, io_type, quantity)
+    if user_id is None:
+        raise MovementError("未检测到用户登录信息")
+
+    if io_type == IN_TYPE:
+        increase = """
+            UPDATE Inventory
+            SET current_quantity = current_quantity + ?, last_updated = GETDATE()
+            WHERE material_id = ?
+        """
+        cursor.execute(increase, (quantity, material_id))
+        if cursor.rowcount == 0:
+            # 库存记录不存在则初始化；两个事务同时入库同一新物料时，后到的一方在锁上等待，
+            # 随后因记录已存在而不插入，改为累加
+            cursor.execute(f"""
+                INSERT INTO Inventory (material_id, current_quantity)
+                SELECT ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM {locked("Inventory")} WHERE material_id = ?)
+            """, (material_id, quantity, material_id))
+            if cursor.rowcount == 0:
+                cursor.execute(increase, (quantity, material_id))
+    else:
+        cursor.execute("""
+            UPDATE Inventory
+            SET current_quantity = current_quantity - ?, last_updated = GETDATE()
+            WHERE material_id = ? AND current_quantity >= ?
+        """, (quantity, material_id, quantity))
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT current_quantity FROM Inventory WHERE material_id = ?", (material_id,))
+            row = cursor.fetchone()
+            if not row:
+                raise InsufficientStockError("该物料尚无库存，无法出库")
+            raise InsufficientStockError(f"库存不足，无法出库（当前库存 {row[0]}）")
+
+    cursor.execute(
+        "INSERT INTO InOutRecord (material_id, user_id, type, quantity, note) VALUES (?, ?, ?, ?, ?)",
+        (material_id, user_id, io_type, quantity, note)
+    )
+
+    evaluate_alerts(cursor, [material_id])
+
+    cursor.execute("SELECT current_quantity FROM Inventory WHERE material_id = ?", (material_id,))
+    return cursor.fetchone()[0]
+
+
+def post_movement(material_id, user_id, io_type, quantity, note=None):
+    """在独立事务中执行一次出入库并计入吞吐统计，返回变动后的库存数量"""
+    start = time.perf_counter()
+    try:
+        with db_connection() as conn:
+            new_quantity = apply_movement(conn.cursor(), material_id, user_id, io_type, quantity, note)
+    except Exception:
+        _stats.record_failure(time.perf_counter() - start)
+        raise
+    _stats.record(1, time.perf_counter() - start)
+    return new_quantity
+
+
+def _existing_ids(cursor, table, material_ids):
+    found = set()
+    for chunk in chunked(material_ids):
+        cursor.execute(
+            f"SELECT material_id FROM {table} WHERE material_id IN ({placeholders(len(chunk))})",
+            chunk
+        )
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+
+def apply_movements(cursor, user_id, lines):
+    """在调用方事务中批量执行出入库，全部成功或抛出 BatchValidationError
+
+    lines 为 [(material_id, io_type, quantity, note)]。同一物料的多行先按净变动量合并，
+    Inventory 只做一遍按物料的 UPDATE；InOutRecord 用数组绑定一次写入；
+    所有涉及的物料一起做一次集合式预警检查。出库是否足够按整批的净变动量判断。
+    返回 {material_id: 变动后的库存数量}。
+    """
+    if user_id is None:
+        raise MovementError("未检测到用户登录信息")
+
+    errors = []
+    records = []
+    deltas = {}
+    line_materials = []
+    for index, line in enumerate(lines):
+        try:
+            material_id, io_type, quantity, note = line
+            quantity = validate_movement(material_id, io_type, quantity)
+        except MovementError as e:
+            errors.append((index, str(e)))
+            line_materials.append(None)
+            continue
+        except (TypeError, ValueError):
+            errors.append((index, "格式应为 (物料ID, 操作类型, 数量, 备注)"))
+            line_materials.append(None)
+            continue
+        line_materials.append(material_id)
+        records.append((material_id, user_id, io_type, quantity, note))
+        deltas[material_id] = deltas.get(material_id, 0) + (quantity if io_type == IN_TYPE else -quantity)
+
+    known = _existing_ids(cursor, "Material", deltas)
+    for index, material_id in enumerate(line_materials):
+        if material_id is not None and material_id not in known:
+            errors.append((index, f"物料 {material_id} 不存在"))
+    if errors:
+        raise BatchValidationError(sorted(errors))
+    if not records:
+        return {}
+
+    # 没有库存记录的物料先补一条 0 库存记录，之后统一按增量更新
+    stocked = _existing_ids(cursor, "Inventory", deltas)
+    missing = [mid for mid in deltas if mid not in stocked]
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    if missing:
+        cursor.executemany(f"""
+            INSERT INTO Inventory (material_id, current_quantity)
+            SELECT ?, 0
+            WHERE NOT EXISTS (SELECT 1 FROM {locked("Inventory")} WHERE material_id = ?)
+        """, [(mid, mid) for mid in missing])
+
+    # 整批净变动都为 0 时（如同一物料先入后出）没有要更新的行；pyodbc 的 executemany 不接受空参数列表
+    changes = [(delta, mid) for mid, delta in deltas.items() if delta]
+    if changes:
+        cursor.executemany("""
+            UPDATE Inventory
+            SET current_quantity = current_quantity + ?, last_updated = GETDATE()
+            WHERE material_id = ?
+        """, changes)
+
+    # 更新后的行在事务提交前一直被锁定，此时检查是否出现负库存即可保证无竞争
+    quantities = {}
+    for chunk in chunked(deltas):
+        cursor.execute(
+            f"SELECT material_id, current_quantity FROM Inventory WHERE material_id IN ({placeholders(len(chunk))})",
+            chunk
+        )
+        quantities.update((row[0], row[1]) for row in cursor.fetchall())
+    short = {mid for mid, qty in quantities.items() if qty < 0}
+    if short:
+        errors = [
+            (index, f"库存不足，无法出库（物料 {mid} 缺少 {-quantities[mid]}）")
+            for index, mid in enumerate(line_materials)
+            if mid in short and lines[index][1] == OUT_TYPE
+        ]
+        raise BatchValidationError(errors)
+
+    cursor.executemany(
+        "INSERT INTO InOutRecord (material_id, user_id, type, quantity, note) VALUES (?, ?, ?, ?, ?)",
+        records
+    )
+
+    evaluate_alerts(cursor, deltas)
+
+    return quantities
+
+
+def post_movements(user_id, lines):
+    """在一个独立事务中批量执行出入库并计入吞吐统计"""
+    lines = list(lines)
+    start = time.perf_counter()
+    try:
+        with db_connection() as conn:
+            quantities = apply_movements(conn.cursor(), user_id, lines)
+    except Exception:
+        _stats.record_failure(time.perf_counter() - start)
+        raise
+    _stats.record(len(lines), time.perf_counter() - start)
+    return quantities
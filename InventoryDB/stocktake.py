@@ -0,0 +1,305 @@
+# stocktake.py
+# 批量盘点单：开单时在一条 INSERT ... SELECT 中冻结全部（或指定）物料的账面数量，
+# 之后分批录入实盘数（表格、CSV 导入或扫码），应用时在一个事务中：
+#   库存按 当前库存 + (实盘 − 冻结) 调整，盘点期间发生的出入库不会被覆盖；
+#   每个已录入的物料写一条 InventoryCheck（盘点时间取冻结时间，账面数量取冻结数量，流水水位线取冻结时的水位线），
+#   与流水对账口径一致；
+#   所有调整过的物料一起做一次预警检查。
+import csv
+
+from db_config import db_connection, last_insert_id, limit_query, locked, table_locked
+from alert_engine import evaluate_alerts
+from utils import chunked, placeholders
+
+OPEN = "进行中"
+APPLIED = "已应用"
+VOID = "已作废"
+
+
+class StocktakeError(Exception):
+    """盘点单不存在、已结束，或录入/应用的数据无效"""
+
+
+def start_session(user_id, material_ids=None, note=None):
+    """开一张盘点单并冻结账面数量，返回 (session_id, 冻结时间, 行数)
+
+    material_ids 为 None 时盘点全部物料（没有库存记录的物料按 0 冻结）。
+    """
+    if user_id is None:
+        raise StocktakeError("未检测到用户登录信息")
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO StocktakeSession (created_by, note) VALUES (?, ?)", (user_id, note))
+        session_id = last_insert_id(cursor)
+        # 库存表锁到提交：冻结前的出入库都已提交，之后的要等冻结完成，
+        # 冻结数量恰好包含 record_id 不超过水位线的流水
+        freeze = f"""
+            INSERT INTO StocktakeLine (session_id, material_id, frozen_quantity)
+            SELECT ?, M.material_id, COALESCE(I.current_quantity, 0)
+            FROM Material M
+            LEFT JOIN {table_locked("Inventory I")} ON I.material_id = M.material_id
+        """
+        if material_ids is None:
+            cursor.execute(freeze, (session_id,))
+        else:
+            for chunk in chunked(sorted(set(material_ids))):
+                cursor.execute(f"{freeze} WHERE M.material_id IN ({placeholders(len(chunk))})",
+                               [session_id] + chunk)
+        cursor.execute("SELECT COUNT(*) FROM StocktakeLine WHERE session_id = ?", (session_id,))
+        lines = cursor.fetchone()[0]
+        if not lines:
+            raise StocktakeError("没有可盘点的物料")
+        cursor.execute("SELECT MAX(record_id) FROM InOutRecord")
+        cursor.execute("UPDATE StocktakeSession SET last_record_id = ? WHERE session_id = ?",
+                       (cursor.fetchone()[0] or 0, session_id))
+        cursor.execute("SELECT frozen_time FROM StocktakeSession WHERE session_id = ?", (session_id,))
+        frozen_time = cursor.fetchone()[0]
+    return session_id, frozen_time, lines
+
+
+def list_sessions(status=None, limit=50):
+    """最近的盘点单 [(session_id, 冻结时间, 状态, 创建人, 行数, 已录入行数, 备注)]"""
+    query = """
+        SELECT S.session_id, S.frozen_time, S.status, U.username,
+               COUNT(L.material_id), COUNT(L.counted_quantity), S.note
+        FROM StocktakeSession S
+        JOIN Users U ON U.user_id = S.created_by
+        LEFT JOIN StocktakeLine L ON L.session_id = S.session_id
+    """
+    params = ()
+    if status is not None:
+        query += " WHERE S.status = ?"
+        params = (status,)
+    query += """
+        GROUP BY S.session_id, S.frozen_time, S.status, U.username, S.note
+        ORDER BY S.session_id DESC
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(limit_query(query, limit), params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def _open_session(cursor, session_id):
+    """确认盘点单进行中，返回 (冻结时间, 流水水位线)"""
+    cursor.execute("SELECT status, frozen_time, last_record_id FROM StocktakeSession WHERE session_id = ?",
+                   (session_id,))
+    row = cursor.fetchone()
+    if not row:
+        raise StocktakeError(f"盘点单 {session_id} 不存在")
+    if row[0] != OPEN:
+        raise StocktakeError(f"盘点单 {session_id} {row[0]}，不能再修改")
+    return row[1], row[2]
+
+
+def load_lines(session_id):
+    """盘点单明细与差异预览
+
+    返回 [(物料ID, 物料名称, 冻结数量, 实盘数量, 差异, 当前库存, 应用后库存)]，按物料ID排序；
+    未录入的行实盘数量、差异为 None，应用后库存等于当前库存。
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT L.material_id, M.material_name, L.frozen_quantity, L.counted_quantity,
+                   COALESCE(I.current_quantity, 0)
+            FROM StocktakeLine L
+            JOIN Material M ON M.material_id = L.material_id
+            LEFT JOIN Inventory I ON I.material_id = L.material_id
+            WHERE L.session_id = ?
+            ORDER BY L.material_id
+        """, (session_id,))
+        rows = cursor.fetchall()
+
+    lines = []
+    for material_id, name, frozen, counted, current in rows:
+        variance = None if counted is None else counted - frozen
+        lines.append((material_id, name, frozen, counted, variance, current, current + (variance or 0)))
+    return lines
+
+
+def parse_counts(rows, resolve, skip_header=False):
+    """把导入或扫码的行解析为 {material_id: 数量}，同一物料的多行累加（如分库位清点）
+
+    每行为 [物料, 数量] 或只有 [物料]（扫码枪每扫一次计 1）；物料可以是物料ID或名称，
+    名称由 resolve(name) 转为ID，无法识别时返回 None。skip_header 为 True 时首行无法解析视为表头跳过。
+    返回 (counts, errors)，errors 为 [(行号, 错误信息)]，行号从 1 开始。
+    """
+    counts = {}
+    errors = []
+    for number, row in enumerate(rows, 1):
+        cells = [str(cell).strip() for cell in row if str(cell).strip()]
+        if not cells:
+            continue
+        code = cells[0]
+        material_id = int(code) if code.isdigit() else resolve(code)
+        try:
+            quantity = int(float(cells[1])) if len(cells) > 1 else 1
+        except ValueError:
+            quantity = None
+        if material_id is None or quantity is None:
+            if number == 1 and skip_header:
+                continue
+            errors.append((number, f"无法识别：{', '.join(cells)}"))
+            continue
+        if quantity < 0:
+            errors.append((number, f"数量不能为负：{quantity}"))
+            continue
+        counts[material_id] = counts.get(material_id, 0) + quantity
+    return counts, errors
+
+
+def read_counts_csv(path, resolve):
+    """读取 CSV 实盘文件（UTF-8 或 Excel 另存的 GBK），返回 parse_counts 的结果"""
+    for encoding in ("utf-8-sig", "gbk"):
+        try:
+            with open(path, encoding=encoding, newline="") as f:
+                text = f.read()
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise StocktakeError("无法识别文件编码，请另存为 UTF-8 CSV")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",\t;")
+    except csv.Error:
+        dialect = csv.excel
+    return parse_counts(csv.reader(text.splitlines(), dialect), resolve, skip_header=True)
+
+
+def record_counts(session_id, counts, user_id, accumulate=False):
+    """把实盘数写入盘点单，返回 {"updated": 行数, "rejected": [不在盘点单中的物料ID]}
+
+    accumulate 为 True 时在已录入的数量上累加（扫码），否则覆盖（表格录入、导入）。
+    """
+    if user_id is None:
+        raise StocktakeError("未检测到用户登录信息")
+    for material_id, quantity in counts.items():
+        if not isinstance(quantity, int) or quantity < 0:
+            raise StocktakeError(f"物料 {material_id} 的实盘数量无效：{quantity}")
+    if not counts:
+        return {"updated": 0, "rejected": []}
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        _open_session(cursor, session_id)
+
+        present = set()
+        for chunk in chunked(counts):
+            cursor.execute(
+                f"SELECT material_id FROM StocktakeLine "
+                f"WHERE session_id = ? AND material_id IN ({placeholders(len(chunk))})",
+                [session_id] + chunk
+            )
+            present.update(row[0] for row in cursor.fetchall())
+
+        if accumulate:
+            sql = """
+                UPDATE StocktakeLine
+                SET counted_quantity = COALESCE(counted_quantity, 0) + ?, counted_by = ?, counted_time = GETDATE()
+                WHERE session_id = ? AND material_id = ?
+            """
+        else:
+            sql = """
+                UPDATE StocktakeLine
+                SET counted_quantity = ?, counted_by = ?, counted_time = GETDATE()
+                WHERE session_id = ? AND material_id = ?
+            """
+        params = [(counts[mid], user_id, session_id, mid) for mid in sorted(present)]
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+        if params:
+            cursor.executemany(sql, params)
+    return {"updated": len(present), "rejected": sorted(mid for mid in counts if mid not in present)}
+
+
+def apply_session(session_id, user_id):
+    """在一个事务中应用盘点单：调整库存、写盘点记录、检查预警，返回汇总
+
+    只应用已录入实盘数的行；调整后出现负库存（盘点期间出库超过实盘数）时整单回滚并抛出 StocktakeError。
+    """
+    if user_id is None:
+        raise StocktakeError("未检测到用户登录信息")
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        frozen_time, watermark = _open_session(cursor, session_id)
+        # 先改状态占住盘点单，并发的录入或重复应用会因状态不再是“进行中”而失败
+        cursor.execute(
+            "UPDATE StocktakeSession SET status = ?, applied_by = ?, applied_time = GETDATE() "
+            "WHERE session_id = ? AND status = ?",
+            (APPLIED, user_id, session_id, OPEN)
+        )
+        if cursor.rowcount == 0:
+            raise StocktakeError(f"盘点单 {session_id} 已被其他用户处理")
+
+        cursor.execute("""
+            SELECT L.material_id, L.frozen_quantity, L.counted_quantity, I.material_id
+            FROM StocktakeLine L
+            LEFT JOIN Inventory I ON I.material_id = L.material_id
+            WHERE L.session_id = ? AND L.counted_quantity IS NOT NULL
+        """, (session_id,))
+        counted = cursor.fetchall()
+        cursor.execute("SELECT COUNT(*) FROM StocktakeLine WHERE session_id = ?", (session_id,))
+        total = cursor.fetchone()[0]
+
+        deltas = {mid: real - frozen for mid, frozen, real, _ in counted if real != frozen}
+        missing = [mid for mid, _, _, stocked in counted if stocked is None]
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+        if missing:
+            # 与首次入库相同的条件插入，读取后并发入库已建好的库存行不再重复插入
+            cursor.executemany(f"""
+                INSERT INTO Inventory (material_id, current_quantity)
+                SELECT ?, 0
+                WHERE NOT EXISTS (SELECT 1 FROM {locked("Inventory")} WHERE material_id = ?)
+            """, [(mid, mid) for mid in missing])
+        if deltas:
+            cursor.executemany("""
+                UPDATE Inventory
+                SET current_quantity = current_quantity + ?, last_updated = GETDATE()
+                WHERE material_id = ?
+            """, [(delta, mid) for mid, delta in deltas.items()])
+
+            # 与批量出入库相同：更新后的行在提交前一直被锁定，此时检查负库存即可
+            short = []
+            for chunk in chunked(deltas):
+                cursor.execute(
+                    f"SELECT material_id, current_quantity FROM Inventory "
+                    f"WHERE material_id IN ({placeholders(len(chunk))}) AND current_quantity < 0",
+                    chunk
+                )
+                short.extend(cursor.fetchall())
+            if short:
+                detail = "、".join(f"物料 {mid}（{qty}）" for mid, qty in sorted(short)[:10])
+                raise StocktakeError(f"应用后 {len(short)} 个物料库存为负，请核对实盘数：{detail}")
+
+        if counted:
+            cursor.executemany(
+                "INSERT INTO InventoryCheck (material_id, real_quantity, recorded_quantity, adjusted_by_user, "
+                "check_time, last_record_id) VALUES (?, ?, ?, ?, ?, ?)",
+                [(mid, real, frozen, user_id, frozen_time, watermark) for mid, frozen, real, _ in counted]
+            )
+
+        alerts = evaluate_alerts(cursor, deltas)
+
+    return {
+        "session_id": session_id,
+        "lines": total,
+        "counted": len(counted),
+        "uncounted": total - len(counted),
+        "adjusted": len(deltas),
+        "net_variance": sum(deltas.values()),
+        "alerts": alerts,
+    }
+
+
+def void_session(session_id, user_id):
+    """作废进行中的盘点单，不改动库存"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        _open_session(cursor, session_id)
+        cursor.execute(
+            "UPDATE StocktakeSession SET status = ?, applied_by = ?, applied_time = GETDATE() "
+            "WHERE session_id = ? AND status = ?",
+            (VOID, user_id, session_id, OPEN)
+        )
@@ -0,0 +1,384 @@
+# stocktake_window.py
+# 批量盘点：开盘点单冻结账面数量，扫码 / 双击表格 / 导入 CSV 录入实盘数，预览差异后一次性应用
+
+import customtkinter as ctk
+from tkinter import messagebox, filedialog
+
+import stocktake
+from stocktake import StocktakeError
+from material_cache import get_catalog
+from task_runner import run_in_background, BusyBar
+from virtual_table import VirtualTable
+
+AUTO_SAVE_PENDING = 50   # 待保存的录入达到该数量时自动保存
+
+
+class StocktakeWindow(ctk.CTkToplevel):
+    def __init__(self, user_id, master=None, on_applied=None):
+        super().__init__(master)
+        self.title("批量盘点")
+        self.geometry("1100x720")
+        self.user_id = user_id
+        self.on_applied = on_applied
+        self.catalog = get_catalog()
+
+        self.sessions = {}        # 下拉框文字 -> session_id
+        self.session_id = None
+        self.lines = []           # 盘点单明细，每行为 list，录入时原地改写
+        self.positions = {}       # material_id -> 在 self.lines 中的下标
+        self.pending_set = {}     # 双击录入的实盘数（覆盖）
+        self.pending_add = {}     # 扫码录入的数量（累加）
+        self._saving = False
+        self._after_save = []     # 保存完成后要执行的操作
+
+        # 盘点单选择与操作
+        top_frame = ctk.CTkFrame(self, corner_radius=8)
+        top_frame.pack(fill="x", padx=15, pady=(15, 5))
+
+        ctk.CTkLabel(top_frame, text="盘点单：").pack(side="left", padx=(10, 0))
+        self.session_menu = ctk.CTkOptionMenu(top_frame, values=["（无进行中的盘点单）"], width=360,
+                                              command=self.on_session_selected)
+        self.session_menu.pack(side="left", padx=5, pady=8)
+        ctk.CTkButton(top_frame, text="🆕 新建盘点单", width=120, command=self.new_session).pack(side="left", padx=5)
+        ctk.CTkButton(top_frame, text="🔄 刷新", width=80,
+                      command=lambda: self.save_pending(then=self.load_lines)).pack(side="left", padx=5)
+        ctk.CTkButton(top_frame, text="🗑 作废", width=80, fg_color="#6c757d",
+                      command=self.void_session).pack(side="right", padx=5)
+        ctk.CTkButton(top_frame, text="✅ 应用调整", width=120, fg_color="#28a745",
+                      command=self.apply_session).pack(side="right", padx=5)
+
+        # 录入：扫码枪输入后自动回车
+        entry_frame = ctk.CTkFrame(self, corner_radius=8)
+        entry_frame.pack(fill="x", padx=15, pady=5)
+
+        self.scan_entry = ctk.CTkEntry(entry_frame, width=360, height=35,
+                                       placeholder_text="扫码或输入 物料ID/名称[*数量]，回车录入")
+        self.scan_entry.pack(side="left", padx=10, pady=8)
+        self.scan_entry.bind("<Return>", self.on_scan)
+        ctk.CTkButton(entry_frame, text="💾 保存录入", width=100, command=self.save_pending).pack(side="left", padx=5)
+        ctk.CTkButton(entry_frame, text="📥 导入CSV", width=100, command=self.import_csv).pack(side="left", padx=5)
+        self.accumulate_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(entry_frame, text="导入时累加", variable=self.accumulate_var).pack(side="left", padx=5)
+        self.variance_only = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(entry_frame, text="只看差异", variable=self.variance_only,
+                        command=self.show_lines).pack(side="right", padx=10)
+
+        self.busy = BusyBar(self)
+        self.busy.pack(fill="x", padx=15)
+
+        # 明细与差异预览，双击一行录入实盘数
+        self.table = VirtualTable(
+            self,
+            columns=("物料ID", "物料名称", "冻结数量", "实盘数量", "差异", "当前库存", "应用后库存"),
+            column_settings={
+                "物料ID": {"width": 80, "anchor": "e"},
+                "物料名称": {"width": 320, "anchor": "w"},
+                "冻结数量": {"width": 100, "anchor": "e"},
+                "实盘数量": {"width": 100, "anchor": "e"},
+                "差异": {"width": 90, "anchor": "e"},
+                "当前库存": {"width": 100, "anchor": "e"},
+                "应用后库存": {"width": 110, "anchor": "e"},
+            },
+        )
+        self.table.pack(fill="both", expand=True, padx=15, pady=5)
+        self.table.tree.bind("<Double-1>", self.edit_selected)
+
+        self.summary_label = ctk.CTkLabel(self, text="", anchor="w")
+        self.summary_label.pack(fill="x", padx=20, pady=(0, 10))
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 名称解析用物料目录缓存，过期时在后台刷新
+        if not self.catalog.is_fresh():
+            run_in_background(self, "catalog", lambda token: self.catalog.get(), on_error=lambda e: None)
+        self.load_sessions()
+
+    # ---------- 盘点单 ----------
+
+    def load_sessions(self, select=None):
+        def show(sessions):
+            self.sessions = {}
+            for session_id, frozen_time, status, username, lines, counted, note in sessions:
+                label = f"#{session_id}  {frozen_time:%Y-%m-%d %H:%M}  {username}（{counted}/{lines}）"
+                self.sessions[f"{label}  {note}" if note else label] = session_id
+            if not self.sessions:
+                self.session_menu.configure(values=["（无进行中的盘点单）"])
+                self.session_menu.set("（无进行中的盘点单）")
+                self._set_lines(None, [])
+                return
+            labels = list(self.sessions)
+            self.session_menu.configure(values=labels)
+            chosen = next((label for label, sid in self.sessions.items() if sid == select), labels[0])
+            self.session_menu.set(chosen)
+            self.on_session_selected(chosen)
+
+        run_in_background(self, "sessions", lambda token: stocktake.list_sessions(stocktake.OPEN), show,
+                          busy=self.busy, error_title="加载盘点单失败")
+
+    def on_session_selected(self, label):
+        session_id = self.sessions.get(label)
+        if session_id is None:
+            return
+        if session_id != self.session_id:
+            # 切换前保存当前盘点单的录入
+            self.save_pending(then=lambda: self.load_lines(session_id))
+
+    def load_lines(self, session_id=None):
+        session_id = session_id or self.session_id
+        if session_id is None:
+            return
+        run_in_background(self, "lines", lambda token: stocktake.load_lines(session_id),
+                          lambda lines: self._set_lines(session_id, lines),
+                          busy=self.busy, error_title="加载盘点明细失败")
+
+    def _set_lines(self, session_id, lines):
+        self.session_id = session_id
+        self.lines = [list(line) for line in lines]
+        self.positions = {line[0]: index for index, line in enumerate(self.lines)}
+        self.show_lines()
+
+    def show_lines(self):
+        if self.variance_only.get():
+            self.table.set_rows([line for line in self.lines if line[4]])
+        elif self.table.rows is self.lines:
+            self.table.refresh()
+        else:
+            self.table.set_rows(self.lines)
+        self._update_summary()
+
+    def _update_summary(self, message=""):
+        counted = [line for line in self.lines if line[3] is not None]
+        variances = [line[4] for line in counted if line[4]]
+        pending = len(self.pending_set) + len(self.pending_add)
+        text = (f"已录入 {len(counted)}/{len(self.lines)} 项，差异 {len(variances)} 项，"
+                f"盘盈 {sum(v for v in variances if v > 0)}，盘亏 {-sum(v for v in variances if v < 0)}")
+        if pending:
+            text += f"，待保存 {pending} 项"
+        if message:
+            text += f"　　{message}"
+        self.summary_label.configure(text=text)
+
+    def new_session(self):
+        dialog = ctk.CTkInputDialog(text="将冻结全部物料的当前账面数量。\n盘点单备注（可留空）：", title="新建盘点单")
+        note = dialog.get_input()
+        if note is None:
+            return
+
+        def created(result):
+            session_id, frozen_time, lines = result
+            messagebox.showinfo("已开单", f"盘点单 #{session_id} 已冻结 {lines} 个物料的账面数量\n冻结时间：{frozen_time}",
+                                parent=self)
+            self.load_sessions(select=session_id)
+
+        self.save_pending(then=lambda: run_in_background(
+            self, "start", lambda token: stocktake.start_session(self.user_id, note=note.strip() or None),
+            created, busy=self.busy, on_error=self._show_error
+        ))
+
+    def void_session(self):
+        if self.session_id is None:
+            return
+        if not messagebox.askyesno("确认作废", f"作废盘点单 #{self.session_id}？已录入的实盘数将不再使用。", parent=self):
+            return
+        session_id = self.session_id
+        self.pending_set.clear()
+        self.pending_add.clear()
+        run_in_background(self, "void", lambda token: stocktake.void_session(session_id, self.user_id),
+                          lambda _: self.load_sessions(), busy=self.busy, on_error=self._show_error)
+
+    def apply_session(self):
+        if self.session_id is None:
+            return
+        self.save_pending(then=self._confirm_apply)
+
+    def _confirm_apply(self):
+        counted = [line for line in self.lines if line[3] is not None]
+        if not counted:
+            messagebox.showwarning("提示", "尚未录入任何实盘数量", parent=self)
+            return
+        variances = [line[4] for line in counted if line[4]]
+        negative = sum(1 for line in counted if line[6] < 0)
+        message = (f"应用盘点单 #{self.session_id}：\n已录入 {len(counted)}/{len(self.lines)} 项，"
+                   f"其中 {len(variances)} 项有差异，净差异 {sum(variances)}。\n"
+                   f"未录入的 {len(self.lines) - len(counted)} 项不调整。")
+        if negative:
+            message += f"\n\n注意：{negative} 项应用后库存为负，应用将失败，请先核对。"
+        if not messagebox.askyesno("确认应用", message, parent=self):
+            return
+
+        session_id = self.session_id
+
+        def applied(result):
+            messagebox.showinfo(
+                "盘点完成",
+                f"已调整 {result['adjusted']} 个物料库存，写入 {result['counted']} 条盘点记录，"
+                f"净差异 {result['net_variance']}。\n新增预警：过低 {result['alerts']['newly_low']}，"
+                f"过高 {result['alerts']['newly_high']}",
+                parent=self
+            )
+            self.load_sessions()
+            if self.on_applied:
+                self.on_applied()
+
+        run_in_background(self, "apply", lambda token: stocktake.apply_session(session_id, self.user_id),
+                          applied, busy=self.busy, on_error=self._show_error)
+
+    # ---------- 录入 ----------
+
+    def _apply_local(self, material_id, quantity, accumulate):
+        """把一条录入写到内存中的明细和待保存队列，物料不在盘点单中时返回 False"""
+        index = self.positions.get(material_id)
+        if index is None:
+            return False
+        line = self.lines[index]
+        line[3] = (line[3] or 0) + quantity if accumulate else quantity
+        line[4] = line[3] - line[2]
+        line[6] = line[5] + line[4]
+        if accumulate:
+            self.pending_add[material_id] = self.pending_add.get(material_id, 0) + quantity
+        else:
+            self.pending_set[material_id] = quantity
+            self.pending_add.pop(material_id, None)
+        return True
+
+    def on_scan(self, event=None):
+        text = self.scan_entry.get().strip()
+        self.scan_entry.delete(0, "end")
+        if not text or self.session_id is None:
+            return
+        code, sep, quantity = text.rpartition("*")
+        counts, errors = stocktake.parse_counts([[code, quantity] if sep else [text]], self.catalog.id_for_name)
+        if errors:
+            self.bell()
+            self._update_summary(errors[0][1])
+            return
+        for material_id, quantity in counts.items():
+            if not self._apply_local(material_id, quantity, accumulate=True):
+                self.bell()
+                self._update_summary(f"物料 {material_id} 不在本盘点单中")
+                return
+            line = self.lines[self.positions[material_id]]
+            self.show_lines()
+            self._update_summary(f"{line[1]} +{quantity} → {line[3]}")
+        if len(self.pending_set) + len(self.pending_add) >= AUTO_SAVE_PENDING:
+            self.save_pending()
+
+    def edit_selected(self, event=None):
+        row = self.table.selected_row()
+        if row is None:
+            return
+        dialog = ctk.CTkInputDialog(text=f"{row[1]}\n冻结数量 {row[2]}，输入实盘数量：", title="录入实盘数")
+        value = dialog.get_input()
+        if value is None or not value.strip():
+            return
+        try:
+            quantity = int(value)
+            if quantity < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showwarning("输入错误", "请输入非负整数", parent=self)
+            return
+        self._apply_local(row[0], quantity, accumulate=False)
+        self.show_lines()
+        if len(self.pending_set) + len(self.pending_add) >= AUTO_SAVE_PENDING:
+            self.save_pending()
+
+    def save_pending(self, then=None):
+        """在后台保存待保存的录入，全部保存后依次调用排队的 then()；保存失败时录入留在队列中"""
+        if then is not None:
+            self._after_save.append(then)
+        if self._saving:
+            return
+        if not (self.pending_set or self.pending_add):
+            callbacks, self._after_save = self._after_save, []
+            for callback in callbacks:
+                callback()
+            return
+        session_id = self.session_id
+        sets, adds = self.pending_set, self.pending_add
+        self.pending_set, self.pending_add = {}, {}
+        self._saving = True
+        self._update_summary(f"正在保存 {len(sets) + len(adds)} 项…")
+
+        def work(token):
+            # 先覆盖再累加；覆盖是幂等的，失败后整体重试不会重复计数
+            rejected = stocktake.record_counts(session_id, sets, self.user_id)["rejected"]
+            rejected += stocktake.record_counts(session_id, adds, self.user_id, accumulate=True)["rejected"]
+            return rejected
+
+        def saved(rejected):
+            self._saving = False
+            self._update_summary(f"已保存 {len(sets) + len(adds)} 项" +
+                                 (f"，{len(rejected)} 项不在盘点单中" if rejected else ""))
+            # 保存期间新增的录入接着保存，之后再执行排队的操作
+            if self._after_save or len(self.pending_set) + len(self.pending_add) >= AUTO_SAVE_PENDING:
+                self.save_pending()
+
+        def failed(e):
+            self._saving = False
+            self._after_save = []
+            # 放回队列；期间又被覆盖录入的物料以新值为准
+            for material_id, quantity in sets.items():
+                self.pending_set.setdefault(material_id, quantity)
+            for material_id, quantity in adds.items():
+                if material_id not in self.pending_set or material_id in sets:
+                    self.pending_add[material_id] = self.pending_add.get(material_id, 0) + quantity
+            self._update_summary()
+            self._show_error(e)
+
+        # 不用 BusyBar：保存不可取消，否则取消后 saved/failed 都不会被调用，_saving 一直为 True、
+        # 已取出的录入丢失，排队的刷新、应用、关闭窗口也再不会执行
+        run_in_background(self, "save", work, saved, on_error=failed)
+
+    def import_csv(self):
+        if self.session_id is None:
+            messagebox.showwarning("提示", "请先新建或选择盘点单", parent=self)
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("CSV 文件", "*.csv"), ("文本文件", "*.txt")],
+                                               title="导入实盘数量", parent=self)
+        if not file_path:
+            return
+        session_id = self.session_id
+        accumulate = self.accumulate_var.get()
+
+        def work(token):
+            self.catalog.get()
+            counts, errors = stocktake.read_counts_csv(file_path, self.catalog.id_for_name)
+            result = stocktake.record_counts(session_id, counts, self.user_id, accumulate=accumulate)
+            return result, errors
+
+        def imported(outcome):
+            result, errors = outcome
+            problems = [f"第{number}行：{message}" for number, message in errors]
+            problems += [f"物料 {material_id} 不在本盘点单中" for material_id in result["rejected"]]
+            text = f"已导入 {result['updated']} 个物料的实盘数量"
+            if problems:
+                text += f"，{len(problems)} 处问题：\n" + "\n".join(problems[:15])
+                if len(problems) > 15:
+                    text += "\n……"
+            messagebox.showinfo("导入完成", text, parent=self)
+            self.load_lines(session_id)
+
+        self.save_pending(then=lambda: run_in_background(self, "import", work, imported, busy=self.busy,
+                                                         on_error=self._show_error))
+
+    # ---------- 其他 ----------
+
+    def _show_error(self, e):
+        if isinstance(e, StocktakeError):
+            messagebox.showwarning("盘点", str(e), parent=self)
+        else:
+            messagebox.showerror("错误", f"操作失败：{e}", parent=self)
+
+    def on_close(self):
+        pending = len(self.pending_set) + len(self.pending_add)
+        if pending:
+            answer = messagebox.askyesnocancel("未保存的录入", f"有 {pending} 项录入尚未保存，是否保存后关闭？",
+                                               parent=self)
+            if answer is None:
+                return
+            if not answer:
+                self.destroy()
+                return
+        # 等正在进行的保存完成后再关闭
+        self.save_pending(then=self.destroy)
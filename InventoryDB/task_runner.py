@@ -0,0 +1,288 @@
+# task_runner.py
+# 后台任务层：数据库与导出工作在线程池中执行，结果经 after() 轮询回到 Tk 主线程，界面不再卡死
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+import customtkinter as ctk
+
+import ui_profiler
+
+MAX_WORKERS = 4
+POLL_INTERVAL_MS = 30
+
+
+class TaskCancelled(Exception):
+    """任务已被取消或被更新的同类请求取代"""
+
+
+class CancelToken:
+    """传给后台任务的取消令牌，可绑定正在执行的游标以便真正中断 SQL"""
+
+    def __init__(self, task):
+        self._task = task
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._conn = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def bind_cursor(self, cursor, conn=None):
+        """登记当前执行语句的游标/连接，取消时对其发出中断"""
+        with self._lock:
+            self._cursor, self._conn = cursor, conn
+        if self.cancelled:
+            self._interrupt()
+
+    def check(self):
+        """在循环中调用，已取消时抛出 TaskCancelled"""
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def report(self, value=None, text=None):
+        """汇报进度（value 为 0~1，None 表示不确定），在主线程中更新进度条"""
+        self._task._runner._post(self._task, "progress", (value, text))
+
+    def cancel(self):
+        self._event.set()
+        self._interrupt()
+
+    def _interrupt(self):
+        with self._lock:
+            cursor, conn = self._cursor, self._conn
+        try:
+            if cursor is not None and hasattr(cursor, "cancel"):
+                cursor.cancel()  # pyodbc：SQLCancel 中断正在执行的语句
+            elif conn is not None and hasattr(conn, "interrupt"):
+                conn.interrupt()  # sqlite3
+        except Exception as e:
+            print("取消语句失败：", e)
+
+
+class Task:
+    def __init__(self, runner, widget, key, on_success, on_error, on_progress):
+        self._runner = runner
+        self.widget = widget
+        self.key = key
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.token = CancelToken(self)
+        self.done = False
+        self.action = None   # 界面剖析中的操作，未启用剖析时为 None
+
+    def cancel(self):
+        self.token.cancel()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+
+class TaskRunner:
+    """进程内共享的后台线程池
+
+    同一 key 的新任务会取消并取代旧任务，旧任务的结果即使晚到也会被丢弃。
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        self._results = queue.Queue()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._polling_root = None
+
+    def submit(self, widget, key, fn, on_success=None, on_error=None, on_progress=None):
+        """在后台执行 fn(token)，完成后在主线程调用 on_success(result) 或 on_error(exc)"""
+        task = Task(self, widget, key, on_success, on_error, on_progress)
+        task.action = ui_profiler.begin_action(
+            f"{type(widget).__name__}.{key[-1] if isinstance(key, tuple) else key}"
+        )
+        with self._lock:
+            previous = self._latest.get(key)
+            self._latest[key] = task
+        if previous is not None and not previous.done:
+            previous.cancel()
+
+        self._ensure_polling(widget)
+        self._executor.submit(self._run, task, fn)
+        return task
+
+    def cancel(self, key):
+        """取消某 key 上尚未完成的任务，其结果将被丢弃"""
+        with self._lock:
+            task = self._latest.get(key)
+        if task is not None and not task.done:
+            task.cancel()
+
+    def _run(self, task, fn):
+        try:
+            with ui_profiler.in_action(task.action, ui_profiler.WORK):
+                result = fn(task.token)
+        except Exception as e:
+            if task.cancelled:
+                e = TaskCancelled()
+            self._post(task, "error", e)
+        else:
+            self._post(task, "success", result)
+
+    def _post(self, task, kind, payload):
+        self._results.put((task, kind, payload))
+
+    def _ensure_polling(self, widget):
+        root = widget.nametowidget(".")
+        if self._polling_root is not root:
+            self._polling_root = root
+            root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        try:
+            while True:
+                task, kind, payload = self._results.get_nowait()
+                self._dispatch(task, kind, payload)
+        except queue.Empty:
+            pass
+        root = self._polling_root
+        try:
+            root.after(POLL_INTERVAL_MS, self._poll)
+        except Exception:
+            self._polling_root = None  # 主窗口已销毁
+
+    def _dispatch(self, task, kind, payload):
+        if kind == "progress":
+            if not task.done and not task.cancelled and task.on_progress and self._alive(task):
+                task.on_progress(*payload)
+            return
+
+        task.done = True
+        with self._lock:
+            is_latest = self._latest.get(task.key) is task
+            if is_latest:
+                del self._latest[task.key]
+        if not self._alive(task):
+            ui_profiler.end_action(task.action, "closed")
+            return
+        # 被取消或已被更新请求取代的结果直接丢弃
+        if task.cancelled or not is_latest:
+            payload = TaskCancelled()
+            kind = "error"
+        try:
+            if kind == "success":
+                if task.on_success:
+                    with ui_profiler.in_action(task.action, ui_profiler.RENDER):
+                        task.on_success(payload)
+            elif task.on_error:
+                task.on_error(payload)
+        except Exception as e:
+            print("后台任务回调出错：", e)
+        status = "ok" if kind == "success" else ("cancelled" if isinstance(payload, TaskCancelled) else "error")
+        ui_profiler.end_action(task.action, status)
+
+    @staticmethod
+    def _alive(task):
+        try:
+            return bool(task.widget.winfo_exists())
+        except Exception:
+            return False
+
+
+_runner = None
+
+
+def get_runner():
+    global _runner
+    if _runner is None:
+        _runner = TaskRunner()
+    return _runner
+
+
+def run_in_background(widget, name, fn, on_success=None, busy=None, error_title="错误", on_error=None):
+    """窗口调用后台任务的统一入口
+
+    name 在同一窗口内区分任务种类，新请求会取代同名的旧请求；
+    busy 为 BusyBar 时显示进度和取消按钮；出错时默认弹出 error_title 对话框，取消不提示。
+    """
+    def handle_error(e):
+        if busy is not None:
+            busy.finish(task)
+        if isinstance(e, TaskCancelled):
+            return
+        if on_error is not None:
+            on_error(e)
+        else:
+            messagebox.showerror(error_title, str(e))
+
+    def handle_success(result):
+        if busy is not None:
+            busy.finish(task)
+        if on_success is not None:
+            on_success(result)
+
+    on_progress = busy.update_progress if busy is not None else None
+    task = get_runner().submit(widget, (str(widget), name), fn, handle_success, handle_error, on_progress)
+    if busy is not None:
+        busy.start(task)
+    return task
+
+
+def cancel_background(widget, name):
+    """取消窗口内某个同名后台任务，如筛选条件变化后丢弃旧的统计"""
+    get_runner().cancel((str(widget), name))
+
+
+class BusyBar(ctk.CTkFrame):
+    """进度条 + 取消按钮，空闲时自动隐藏"""
+
+    def __init__(self, master, **kwargs):
+        kwargs.setdefault("fg_color", "transparent")
+        super().__init__(master, **kwargs)
+        self._pack_info = None
+        self._task = None
+
+        self.label = ctk.CTkLabel(self, text="")
+        self.label.pack(side="left", padx=5)
+        self.progress = ctk.CTkProgressBar(self, width=200)
+        self.progress.pack(side="left", padx=5, fill="x", expand=True)
+        self.cancel_button = ctk.CTkButton(self, text="取消", width=60, fg_color="#666666", command=self.cancel)
+        self.cancel_button.pack(side="left", padx=5)
+
+    def pack(self, **kwargs):
+        """记录布局参数，空闲时隐藏，开始任务时再按原参数显示"""
+        self._pack_info = kwargs
+
+    def start(self, task, text="正在处理..."):
+        self._task = task
+        self.label.configure(text=text)
+        self.progress.configure(mode="indeterminate")
+        self.progress.start()
+        if self._pack_info is not None and not self.winfo_ismapped():
+            super().pack(**self._pack_info)
+
+    def update_progress(self, value=None, text=None):
+        if value is None:
+            if self.progress.cget("mode") != "indeterminate":
+                self.progress.configure(mode="indeterminate")
+                self.progress.start()
+        else:
+            if self.progress.cget("mode") != "determinate":
+                self.progress.stop()
+                self.progress.configure(mode="determinate")
+            self.progress.set(value)
+        if text:
+            self.label.configure(text=text)
+
+    def finish(self, task):
+        if task is not self._task:
+            return
+        self._task = None
+        self.progress.stop()
+        self.pack_forget()
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self.finish(self._task)
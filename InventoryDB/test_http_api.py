@@ -0,0 +1,113 @@
+# test_http_api.py
+# 接口回归测试：合并提交与逐条提交的出入库结果必须一致；预警查询默认只返回未处理的预警
+#   python -m unittest test_http_api
+import asyncio
+import os
+import tempfile
+import unittest
+
+import db_config
+from db_config import db_connection
+from http_api import ApiServer
+from stock_movement import IN_TYPE, OUT_TYPE, InsufficientStockError, post_movement
+
+
+class _DatabaseTest(unittest.TestCase):
+    """每个测试使用临时 SQLite 库，预置一个用户和两个物料"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_config.configure(backend="sqlite", sqlite_path=os.path.join(self.tmp.name, "test.db"))
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO Users (username, password, role, permission_level) VALUES ('api', 'x', '管理员', 1)")
+            self.user_id = db_config.last_insert_id(cursor)
+            self.material_ids = []
+            for name in ("轴承", "螺栓"):
+                cursor.execute("INSERT INTO Material (material_name, supplier, unit, max_quantity, min_quantity) "
+                               "VALUES (?, '测试', '个', 1000, 0)", (name,))
+                self.material_ids.append(db_config.last_insert_id(cursor))
+
+    def tearDown(self):
+        db_config.configure(sqlite_path=":memory:")
+        self.tmp.cleanup()
+
+
+class MovementBatchingTest(_DatabaseTest):
+    def _set_stock(self, quantity):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM InOutRecord")
+            cursor.execute("DELETE FROM Inventory")
+            cursor.executemany("INSERT INTO Inventory (material_id, current_quantity) VALUES (?, ?)",
+                               [(mid, quantity) for mid in self.material_ids])
+
+    def _unbatched(self, lines):
+        results = []
+        for material_id, io_type, quantity in lines:
+            try:
+                results.append(post_movement(material_id, self.user_id, io_type, quantity))
+            except InsufficientStockError:
+                results.append("insufficient")
+        return results
+
+    def _batched(self, lines):
+        async def run():
+            server = ApiServer(token=None, batch_window_ms=50)
+            try:
+                futures = [server.batcher.submit(self.user_id, (mid, io_type, quantity, None))
+                           for mid, io_type, quantity in lines]
+                outcomes = await asyncio.gather(*futures, return_exceptions=True)
+                return outcomes, server.batcher.stats
+            finally:
+                server.close()
+
+        outcomes, stats = asyncio.run(run())
+        self.assertEqual(stats["requests"], len(lines))
+        return ["insufficient" if isinstance(o, InsufficientStockError) else o for o in outcomes]
+
+    def assertSameAsUnbatched(self, stock, lines):
+        self._set_stock(stock)
+        expected = self._unbatched(lines)
+        self._set_stock(stock)
+        self.assertEqual(self._batched(lines), expected)
+
+    def test_same_material_gets_own_quantity(self):
+        mid = self.material_ids[0]
+        self.assertSameAsUnbatched(170, [(mid, IN_TYPE, 5), (mid, OUT_TYPE, 5), (mid, IN_TYPE, 5), (mid, OUT_TYPE, 5)])
+
+    def test_out_is_checked_before_later_in(self):
+        mid = self.material_ids[0]
+        self.assertSameAsUnbatched(0, [(mid, OUT_TYPE, 5), (mid, IN_TYPE, 5)])
+
+    def test_mixed_materials(self):
+        a, b = self.material_ids
+        self.assertSameAsUnbatched(3, [(a, IN_TYPE, 2), (b, OUT_TYPE, 3), (a, OUT_TYPE, 5), (b, IN_TYPE, 1),
+                                       (a, OUT_TYPE, 1)])
+
+
+class AlertQueryTest(_DatabaseTest):
+    def _resolved_flags(self, target):
+        async def run():
+            server = ApiServer(token=None)
+            try:
+                return await server.dispatch("GET", target, {}, b"")
+            finally:
+                server.close()
+
+        return sorted(item["is_resolved"] for item in asyncio.run(run())["items"])
+
+    def test_default_excludes_resolved(self):
+        with db_connection() as conn:
+            conn.cursor().executemany(
+                "INSERT INTO Alert (material_id, alert_type, current_quantity, is_resolved) VALUES (?, '库存过低', 0, ?)",
+                [(self.material_ids[0], 0), (self.material_ids[1], 1)]
+            )
+        self.assertEqual(self._resolved_flags("/alerts"), [0])
+        self.assertEqual(self._resolved_flags("/alerts?resolved=0"), [0])
+        self.assertEqual(self._resolved_flags("/alerts?resolved=1"), [1])
+        self.assertEqual(self._resolved_flags("/alerts?resolved=all"), [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,299 @@
+# ui_profiler.py
+# 界面操作耗时剖析：每个后台任务算一次用户操作，拆成 query（执行语句）/ fetch（取数）/
+# transform（整理数据）/ render（主线程更新界面）各阶段计时，可导出为 Chrome trace 或 speedscope 文件。
+#   INVENTORY_PROFILE=1                           启用；退出时写出文件并打印各操作的阶段汇总
+#   INVENTORY_PROFILE_OUTPUT=ui_profile.json      以 .speedscope.json 结尾时写 speedscope 格式，
+#                                                 否则写 Chrome trace（chrome://tracing 或 ui.perfetto.dev 打开）
+# 未启用时 phase() 等返回共享的空上下文，开销只有一次函数调用。
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import db_pool
+
+ENABLED = os.environ.get("INVENTORY_PROFILE", "0") not in ("", "0")
+OUTPUT = os.environ.get("INVENTORY_PROFILE_OUTPUT", "ui_profile.json")
+MAX_EVENTS = 500_000
+
+QUERY, FETCH, TRANSFORM, RENDER = "query", "fetch", "transform", "render"
+WORK = "work"   # 后台任务函数整体，包含 query / fetch / transform
+PHASES = (QUERY, FETCH, TRANSFORM, RENDER)
+
+_NULL = nullcontext()
+_events = deque(maxlen=MAX_EVENTS)    # (名称, 类别, 开始ns, 结束ns, 线程, 操作, 参数)
+_actions = deque(maxlen=MAX_EVENTS)   # (操作ID, 标签, 开始ns, 结束ns, 状态)
+_thread_names = {}
+_local = threading.local()
+_ids = itertools.count(1)
+_origin = time.perf_counter_ns()
+
+
+def _record(name, cat, start, end, args):
+    thread = threading.current_thread()
+    _thread_names[thread.ident] = thread.name
+    _events.append((name, cat, start, end, thread.ident, getattr(_local, "action", None), args))
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.cat, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+def phase(kind, name=None, **args):
+    """计时一个阶段：with ui_profiler.phase(ui_profiler.TRANSFORM): ..."""
+    if not ENABLED:
+        return _NULL
+    return _Span(name or kind, kind, args)
+
+
+def span(name, cat="app", **args):
+    """计时任意一段代码，不计入阶段汇总（如控件内部的步骤）"""
+    if not ENABLED:
+        return _NULL
+    return _Span(name, cat, args)
+
+
+# ---------- 用户操作（由 task_runner 在提交、执行、回调时调用） ----------
+
+def begin_action(label):
+    if not ENABLED:
+        return None
+    return (next(_ids), label, time.perf_counter_ns())
+
+
+def end_action(action, status="ok"):
+    if action is not None:
+        _actions.append((action[0], action[1], action[2], time.perf_counter_ns(), status))
+
+
+class _InAction:
+    """在当前线程标记所属操作，并把整段计为 work 或 render"""
+
+    __slots__ = ("action", "kind", "previous", "span")
+
+    def __init__(self, action, kind):
+        self.action = action
+        self.kind = kind
+
+    def __enter__(self):
+        self.previous = getattr(_local, "action", None)
+        _local.action = self.action
+        self.span = _Span(f"{self.action[1]} {self.kind}", self.kind, {})
+        self.span.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.span.__exit__(*exc)
+        _local.action = self.previous
+        return False
+
+
+def in_action(action, kind):
+    if action is None:
+        return _NULL
+    return _InAction(action, kind)
+
+
+# ---------- 数据库游标 ----------
+
+class ProfiledCursor(db_pool.CursorWrapper):
+    """execute 计为 query 阶段，fetch* 计为 fetch 阶段"""
+
+    def execute(self, sql, *params):
+        with _Span(QUERY, QUERY, {"sql": " ".join(sql.split())[:300]}):
+            self._cursor.execute(sql, *params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        with _Span(QUERY, QUERY, {"sql": " ".join(sql.split())[:300], "many": True}):
+            self._cursor.executemany(sql, seq_of_params)
+        return self
+
+    def fetchone(self):
+        with _Span(FETCH, FETCH, {}):
+            return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        with _Span(FETCH, FETCH, {}) as s:
+            rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+            s.args["rows"] = len(rows)
+        return rows
+
+    def fetchall(self):
+        with _Span(FETCH, FETCH, {}) as s:
+            rows = self._cursor.fetchall()
+            s.args["rows"] = len(rows)
+        return rows
+
+
+# ---------- 导出 ----------
+
+def _us(ns):
+    return round((ns - _origin) / 1000, 3)
+
+
+def chrome_trace():
+    """Chrome trace 事件格式：阶段为完整事件（X），用户操作为异步事件（b/e）"""
+    pid = os.getpid()
+    main_tid = threading.main_thread().ident
+    trace = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "InventoryDB"}}]
+    for tid, name in list(_thread_names.items()):
+        trace.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+    for name, cat, start, end, tid, action, args in list(_events):
+        event = {"name": name, "cat": cat, "ph": "X", "ts": _us(start),
+                 "dur": round((end - start) / 1000, 3), "pid": pid, "tid": tid}
+        if action is not None:
+            args = dict(args, action=f"{action[1]}#{action[0]}")
+        if args:
+            event["args"] = args
+        trace.append(event)
+    for action_id, label, start, end, status in list(_actions):
+        trace.append({"name": label, "cat": "action", "ph": "b", "id": action_id,
+                      "ts": _us(start), "pid": pid, "tid": main_tid})
+        trace.append({"name": label, "cat": "action", "ph": "e", "id": action_id,
+                      "ts": _us(end), "pid": pid, "tid": main_tid, "args": {"status": status}})
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+
+def speedscope():
+    """speedscope 文件格式：每个线程一个 evented 剖面，阶段按嵌套关系打开/关闭"""
+    frames, frame_index = [], {}
+    by_thread = {}
+    for name, cat, start, end, tid, action, args in list(_events):
+        by_thread.setdefault(tid, []).append((start, end, name))
+
+    profiles = []
+    for tid, spans in by_thread.items():
+        spans.sort(key=lambda s: (s[0], -s[1]))
+        events, stack = [], []
+        for start, end, name in spans:
+            while stack and stack[-1][0] <= start:
+                closed_end, closed_frame = stack.pop()
+                events.append({"type": "C", "frame": closed_frame, "at": _us(closed_end)})
+            index = frame_index.get(name)
+            if index is None:
+                index = frame_index[name] = len(frames)
+                frames.append({"name": name})
+            # 计时精度误差导致子阶段略晚于父阶段结束时，截断到父阶段
+            if stack and end > stack[-1][0]:
+                end = stack[-1][0]
+            events.append({"type": "O", "frame": index, "at": _us(start)})
+            stack.append((end, index))
+        while stack:
+            closed_end, closed_frame = stack.pop()
+            events.append({"type": "C", "frame": closed_frame, "at": _us(closed_end)})
+        profiles.append({
+            "type": "evented",
+            "name": _thread_names.get(tid, str(tid)),
+            "unit": "microseconds",
+            "startValue": events[0]["at"],
+            "endValue": events[-1]["at"],
+            "events": events,
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+        "name": "InventoryDB UI profile",
+        "exporter": "ui_profiler",
+    }
+
+
+def summary():
+    """按操作标签汇总平均耗时（毫秒）
+
+    wait 为提交到后台开始执行的排队时间，other 为 work 中未归入 query/fetch/transform 的部分。
+    """
+    per_action = {}
+    for name, cat, start, end, tid, action, args in list(_events):
+        if action is not None and cat in PHASES + (WORK,):
+            phases = per_action.setdefault(action[0], {})
+            phases[cat] = phases.get(cat, 0) + end - start
+            if cat == WORK:
+                phases["work_start"] = min(phases.get("work_start", start), start)
+
+    result = {}
+    for action_id, label, start, end, status in list(_actions):
+        phases = per_action.get(action_id, {})
+        entry = result.setdefault(label, {"count": 0, "total": 0.0, "wait": 0.0, QUERY: 0.0, FETCH: 0.0,
+                                          TRANSFORM: 0.0, "other": 0.0, RENDER: 0.0})
+        entry["count"] += 1
+        entry["total"] += (end - start) / 1e6
+        entry["wait"] += (phases.get("work_start", start) - start) / 1e6
+        for kind in (QUERY, FETCH, TRANSFORM, RENDER):
+            entry[kind] += phases.get(kind, 0) / 1e6
+        entry["other"] += (phases.get(WORK, 0) - phases.get(QUERY, 0) - phases.get(FETCH, 0)
+                           - phases.get(TRANSFORM, 0)) / 1e6
+    for entry in result.values():
+        count = entry["count"]
+        for key in entry:
+            if key != "count":
+                entry[key] = round(entry[key] / count, 3)
+    return result
+
+
+def dump(path=None):
+    """写出剖析结果，文件名以 .speedscope.json 结尾时为 speedscope 格式，返回路径"""
+    path = path or OUTPUT
+    data = speedscope() if path.endswith(".speedscope.json") else chrome_trace()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    return path
+
+
+def print_summary():
+    rows = sorted(summary().items(), key=lambda item: item[1]["total"] * item[1]["count"], reverse=True)
+    print(f"{'操作':<36}{'次数':>6}{'总计':>10}{'排队':>9}{'query':>9}{'fetch':>9}"
+          f"{'transform':>11}{'other':>9}{'render':>9}  (平均毫秒)")
+    for label, e in rows:
+        print(f"{label:<36}{e['count']:>6}{e['total']:>10.1f}{e['wait']:>9.1f}{e[QUERY]:>9.1f}{e[FETCH]:>9.1f}"
+              f"{e[TRANSFORM]:>11.1f}{e['other']:>9.1f}{e[RENDER]:>9.1f}")
+
+
+def reset():
+    _events.clear()
+    _actions.clear()
+
+
+def _dump_at_exit():
+    if not _events:
+        return
+    try:
+        print("界面剖析已写入：", dump())
+        print_summary()
+    except Exception as e:
+        print("写出界面剖析失败：", e)
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+    db_pool.add_cursor_hook(ProfiledCursor)
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    db_pool.remove_cursor_hook(ProfiledCursor)
+
+
+if ENABLED:
+    enable()
+    atexit.register(_dump_at_exit)
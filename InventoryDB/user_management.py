@@ -3,8 +3,10 @@
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import pyodbc
-from db_config import get_connection
+from db_config import db_connection
+from virtual_table import VirtualTable
+from task_runner import run_in_background
+from live_search import LiveSearch
 
 class UserManagementWindow(ctk.CTkToplevel):
     def __init__(self, master=None):  # 添加 master 参数
@@ -35,56 +37,63 @@ class UserManagementWindow(ctk.CTkToplevel):
         tree_frame = ctk.CTkFrame(self)
         tree_frame.pack(pady=10, fill="both", expand=True)
 
-        self.tree = ttk.Treeview(tree_frame, columns=("ID", "用户名", "角色", "权限等级"), show="headings")
-        self.tree.heading("ID", text="ID")
-        self.tree.heading("用户名", text="用户名")
-        self.tree.heading("角色", text="角色")
-        self.tree.heading("权限等级", text="权限等级")
-
-        self.tree.column("ID", width=50)
-        self.tree.column("用户名", width=150)
-        self.tree.column("角色", width=100)
-        self.tree.column("权限等级", width=100)
-
+        self.tree = VirtualTable(
+            tree_frame,
+            columns=("ID", "用户名", "角色", "权限等级"),
+            column_settings={
+                "ID": {"width": 50},
+                "用户名": {"width": 150},
+                "角色": {"width": 100},
+                "权限等级": {"width": 100},
+            }
+        )
         self.tree.pack(fill="both", expand=True)
 
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscroll=scrollbar.set)
-        scrollbar.pack(side="right", fill="y")
+        # 边输入边按用户名搜索
+        self.live_search = LiveSearch(
+            self, self.search_entry, self._fetch_users, self._show_users,
+            match=lambda row, kw: kw in row[1].casefold()
+        )
 
     def load_users(self):
-        try:
-            conn = get_connection()
+        self.search_entry.delete(0, "end")
+        self.live_search.search_now(refresh=True)
+
+    def _fetch_users(self, keyword, token):
+        with db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT user_id, username, role, permission_level FROM Users")
-            self.user_data = cursor.fetchall()
-            self.refresh_table()
-        except Exception as e:
-            messagebox.showerror("错误", str(e))
-        finally:
-            conn.close()
+            token.bind_cursor(cursor, conn)
+            if keyword:
+                cursor.execute("SELECT user_id, username, role, permission_level FROM Users WHERE username LIKE ?", ('%' + keyword + '%',))
+            else:
+                cursor.execute("SELECT user_id, username, role, permission_level FROM Users")
+            return cursor.fetchall()
+
+    def _show_users(self, rows):
+        self.user_data = rows
+        self.refresh_table()
+
+    def _write(self, query, params, success_text):
+        """后台执行一条写操作，成功后提示并刷新列表"""
+        def work(token):
+            with db_connection() as conn:
+                conn.cursor().execute(query, params)
+
+        def done(_):
+            messagebox.showinfo("成功", success_text)
+            self.live_search.search_now(refresh=True)
+
+        run_in_background(self, "write", work, done)
 
     def refresh_table(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        for row in self.user_data:
-            self.tree.insert("", "end", values=(row[0], row[1], row[2], row[3]))
+        self.tree.set_rows([(row[0], row[1], row[2], row[3]) for row in self.user_data])
 
     def search_user(self):
         keyword = self.search_entry.get().strip()
         if not keyword:
             messagebox.showinfo("提示", "请输入用户名关键词")
             return
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id, username, role, permission_level FROM Users WHERE username LIKE ?", ('%' + keyword + '%',))
-            self.user_data = cursor.fetchall()
-            self.refresh_table()
-        except Exception as e:
-            messagebox.showerror("错误", str(e))
-        finally:
-            conn.close()
+        self.live_search.search_now(refresh=True)
 
     def add_user(self):
         username = simpledialog.askstring("用户名", "请输入用户名：", parent=self)
@@ -101,25 +110,17 @@ class UserManagementWindow(ctk.CTkToplevel):
         except:
             messagebox.showwarning("输入错误", "权限等级必须是整数")
             return
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO Users (username, password, role, permission_level) VALUES (?, ?, ?, ?)", (username, password, role, permission))
-            conn.commit()
-            messagebox.showinfo("成功", "添加用户成功")
-            self.load_users()
-        except Exception as e:
-            messagebox.showerror("错误", str(e))
-        finally:
-            conn.close()
+        self._write(
+            "INSERT INTO Users (username, password, role, permission_level) VALUES (?, ?, ?, ?)",
+            (username, password, role, permission), "添加用户成功"
+        )
 
     def edit_user(self):
-        selected = self.tree.selection()
-        if not selected:
+        selected = self.tree.selected_row()
+        if selected is None:
             messagebox.showwarning("提示", "请先选择一个用户")
             return
-        item = self.tree.item(selected[0])
-        user_id, old_username, old_role, old_perm = item["values"]
+        user_id, old_username, old_role, old_perm = selected
 
         new_password = simpledialog.askstring("修改密码", f"输入新密码（留空不修改）：", parent=self, show="*")
         new_role = simpledialog.askstring("修改角色", f"当前：{old_role}，修改为：", parent=self)
@@ -133,37 +134,18 @@ class UserManagementWindow(ctk.CTkToplevel):
             messagebox.showwarning("错误", "权限等级无效")
             return
 
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            if new_password:
-                cursor.execute("UPDATE Users SET password=?, role=?, permission_level=? WHERE user_id=?", (new_password, new_role, new_perm, user_id))
-            else:
-                cursor.execute("UPDATE Users SET role=?, permission_level=? WHERE user_id=?", (new_role, new_perm, user_id))
-            conn.commit()
-            messagebox.showinfo("成功", "修改成功")
-            self.load_users()
-        except Exception as e:
-            messagebox.showerror("错误", str(e))
-        finally:
-            conn.close()
+        if new_password:
+            self._write("UPDATE Users SET password=?, role=?, permission_level=? WHERE user_id=?",
+                        (new_password, new_role, new_perm, user_id), "修改成功")
+        else:
+            self._write("UPDATE Users SET role=?, permission_level=? WHERE user_id=?",
+                        (new_role, new_perm, user_id), "修改成功")
 
     def delete_user(self):
-        selected = self.tree.selection()
-        if not selected:
+        selected = self.tree.selected_row()
+        if selected is None:
             messagebox.showwarning("提示", "请先选择一个用户")
             return
-        item = self.tree.item(selected[0])
-        user_id = item["values"][0]
+        user_id = selected[0]
         if messagebox.askyesno("确认", "确定要删除该用户？"):
-            try:
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM Users WHERE user_id=?", (user_id,))
-                conn.commit()
-                messagebox.showinfo("成功", "删除成功")
-                self.load_users()
-            except Exception as e:
-                messagebox.showerror("错误", str(e))
-            finally:
-                conn.close()
+            self._write("DELETE FROM Users WHERE user_id=?", (user_id,), "删除成功")
@@ -0,0 +1,360 @@
+# variance_analytics.py
+# 盘点差异分析：按列批量读出 InventoryCheck，用 NumPy / pandas 向量化计算
+#   物料、供应商的损耗率（盘亏数量 / 账面数量）与差异率，差异分布，反复盘亏的物料，各盘点人的准确率。
+# 差异 = 实盘数量 − 账面数量（recorded_quantity），负数为盘亏。
+#   python variance_analytics.py --start 2024-01-01 --output variance.xlsx
+# numpy / pandas 只在分析时才导入，不影响主程序启动。
+import argparse
+import json
+import time
+from datetime import datetime
+
+from db_config import db_connection
+
+FETCH_SIZE = 50000
+MIN_REPEATS = 3            # 盘亏次数达到该值的物料列为重复差异
+UNKNOWN_SUPPLIER = "（未填写）"
+
+# 相对差异（%）分布的分桶边界，0 单独成桶
+DISTRIBUTION_EDGES = (-50, -20, -10, -5, -2, 0, 2, 5, 10, 20, 50)
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# 结果表的中文列名（报表窗口与导出共用）
+COLUMN_LABELS = {
+    "material_id": "物料ID",
+    "material_name": "物料名称",
+    "supplier": "供应商",
+    "user_id": "用户ID",
+    "username": "盘点人",
+    "materials": "物料数",
+    "checks": "盘点次数",
+    "variance_checks": "有差异次数",
+    "discrepancy_rate": "差异率",
+    "accuracy": "准确率",
+    "net_variance": "净差异",
+    "shrink_units": "盘亏数量",
+    "gain_units": "盘盈数量",
+    "recorded_units": "账面数量合计",
+    "shrinkage_rate": "损耗率",
+    "mean_abs_variance": "平均绝对差异",
+    "max_abs_variance": "最大绝对差异",
+    "mean_abs_rel_variance": "平均相对差异",
+    "bias": "平均差异",
+    "shrink_checks": "盘亏次数",
+    "shrink_frequency": "盘亏频率",
+    "longest_streak": "最长连续盘亏",
+    "last_check": "最近盘点",
+    "last_shrink": "最近盘亏",
+    "bucket": "相对差异",
+    "share": "占比",
+}
+
+# 按比例显示为百分数的列
+RATE_COLUMNS = ("discrepancy_rate", "accuracy", "shrinkage_rate", "mean_abs_rel_variance",
+                "shrink_frequency", "share")
+
+
+class AnalyticsError(Exception):
+    """缺少依赖或没有可分析的数据"""
+
+
+def _libs():
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError:
+        raise AnalyticsError("差异分析需要 numpy 和 pandas：pip install numpy pandas")
+    return np, pd
+
+
+# ---------- 读取 ----------
+
+def load_checks(start=None, end=None, token=None):
+    """按列读出 [start, end) 内的盘点记录，返回 (checks, materials, users) 三个 DataFrame"""
+    np, pd = _libs()
+    query = """
+        SELECT material_id, adjusted_by_user, real_quantity, recorded_quantity, check_time
+        FROM InventoryCheck
+    """
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("check_time >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("check_time < ?")
+        params.append(end)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    columns = ([], [], [], [], [])
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if token is not None:
+            token.bind_cursor(cursor, conn)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            # 每批转置后追加到各列，不为每行建对象
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+            if token is not None:
+                token.check()
+                token.report(None, f"已读取 {len(columns[0])} 条盘点记录")
+
+        cursor.execute("SELECT material_id, material_name, supplier FROM Material")
+        materials = pd.DataFrame.from_records([tuple(r) for r in cursor.fetchall()],
+                                              columns=["material_id", "material_name", "supplier"])
+        cursor.execute("SELECT user_id, username FROM Users")
+        users = pd.DataFrame.from_records([tuple(r) for r in cursor.fetchall()], columns=["user_id", "username"])
+
+    checks = pd.DataFrame({
+        "material_id": np.asarray(columns[0], dtype=np.int64),
+        "user_id": np.asarray(columns[1], dtype=np.int64),
+        "real": np.asarray(columns[2], dtype=np.int64),
+        "recorded": np.asarray(columns[3], dtype=np.int64),
+        "check_time": pd.to_datetime(pd.Series(columns[4], dtype=object)),
+    })
+    materials["supplier"] = materials["supplier"].fillna(UNKNOWN_SUPPLIER).replace("", UNKNOWN_SUPPLIER)
+    return checks, materials, users
+
+
+# ---------- 计算 ----------
+
+def _prepare(checks):
+    """补充差异、盘亏、盘盈、相对差异等逐行派生列（向量化）"""
+    np, _ = _libs()
+    real = checks["real"].to_numpy()
+    recorded = checks["recorded"].to_numpy()
+    variance = real - recorded
+    checks["variance"] = variance
+    checks["abs_variance"] = np.abs(variance)
+    checks["shrink"] = np.maximum(-variance, 0)
+    checks["gain"] = np.maximum(variance, 0)
+    checks["miss"] = variance != 0
+    # 账面为 0 时相对差异记为 ±inf（有差异）或 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        checks["rel_variance"] = np.where(recorded > 0, variance / np.maximum(recorded, 1),
+                                          np.sign(variance) * np.inf)
+    return checks
+
+
+def _aggregate(checks, key):
+    np, _ = _libs()
+    grouped = checks.groupby(key, sort=False).agg(
+        checks=("variance", "size"),
+        variance_checks=("miss", "sum"),
+        net_variance=("variance", "sum"),
+        shrink_units=("shrink", "sum"),
+        gain_units=("gain", "sum"),
+        recorded_units=("recorded", "sum"),
+        mean_abs_variance=("abs_variance", "mean"),
+        max_abs_variance=("abs_variance", "max"),
+        last_check=("check_time", "max"),
+    )
+    grouped["discrepancy_rate"] = grouped["variance_checks"] / grouped["checks"]
+    recorded = grouped["recorded_units"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        grouped["shrinkage_rate"] = np.where(recorded > 0, grouped["shrink_units"] / recorded, np.nan)
+    return grouped.reset_index()
+
+
+def material_variance(checks, materials):
+    """按物料汇总，按盘亏数量降序"""
+    result = _aggregate(checks, "material_id").merge(materials, on="material_id", how="left")
+    return result.sort_values(["shrink_units", "net_variance"], ascending=[False, True], ignore_index=True)
+
+
+def supplier_variance(checks, materials):
+    """按供应商汇总（按物料的当前供应商归属），按损耗率降序"""
+    with_supplier = checks.merge(materials[["material_id", "supplier"]], on="material_id", how="left")
+    with_supplier["supplier"] = with_supplier["supplier"].fillna(UNKNOWN_SUPPLIER)
+    result = _aggregate(with_supplier, "supplier")
+    result["materials"] = result["supplier"].map(with_supplier.groupby("supplier")["material_id"].nunique())
+    return result.sort_values(["shrinkage_rate", "shrink_units"], ascending=False, ignore_index=True)
+
+
+def variance_distribution(checks):
+    """相对差异分布：各分桶的盘点次数、占比与净差异"""
+    np, pd = _libs()
+    edges = np.asarray(DISTRIBUTION_EDGES, dtype=float)
+    labels = [f"≤{edges[0]:g}%"]
+    labels += [f"{lo:g}%~{hi:g}%" for lo, hi in zip(edges[:-1], edges[1:])]
+    labels += [f">{edges[-1]:g}%"]
+    zero_label = "0"
+
+    percent = checks["rel_variance"].to_numpy() * 100
+    # right=True：桶为 (lo, hi]；0 单独计数，不落入 (-2%, 0%] 桶
+    index = np.digitize(percent, edges, right=True)
+    bucket = np.asarray(labels, dtype=object)[index]
+    bucket[checks["variance"].to_numpy() == 0] = zero_label
+
+    order = labels[:len(edges) // 2 + 1] + [zero_label] + labels[len(edges) // 2 + 1:]
+    frame = pd.DataFrame({"bucket": bucket, "variance": checks["variance"].to_numpy()})
+    result = frame.groupby("bucket").agg(checks=("variance", "size"), net_variance=("variance", "sum"))
+    result = result.reindex(order, fill_value=0).reset_index()
+    total = max(int(result["checks"].sum()), 1)
+    result["share"] = result["checks"] / total
+    return result
+
+
+def repeat_offenders(checks, materials, min_repeats=MIN_REPEATS):
+    """反复盘亏的物料：盘亏次数、最长连续盘亏次数、盘亏数量，按盘亏数量降序"""
+    np, pd = _libs()
+    ordered = checks.sort_values(["material_id", "check_time"], kind="mergesort")
+    material_ids = ordered["material_id"].to_numpy()
+    negative = ordered["variance"].to_numpy() < 0
+    if not len(ordered):
+        return pd.DataFrame(columns=["material_id", "material_name", "supplier", "shrink_checks", "checks",
+                                     "shrink_frequency", "longest_streak", "shrink_units", "last_shrink"])
+
+    # 同一物料内连续盘亏为一段：物料或盘亏状态变化处开始新段，每行取所在段的长度
+    boundary = np.empty(len(ordered), dtype=bool)
+    boundary[0] = True
+    boundary[1:] = (negative[1:] != negative[:-1]) | (material_ids[1:] != material_ids[:-1])
+    run_id = np.cumsum(boundary)
+    run_length = np.bincount(run_id)[run_id]
+
+    shrink_rows = pd.DataFrame({
+        "material_id": material_ids[negative],
+        "run_length": run_length[negative],
+        "shrink": ordered["shrink"].to_numpy()[negative],
+        "check_time": ordered["check_time"].to_numpy()[negative],
+    })
+    result = shrink_rows.groupby("material_id").agg(
+        shrink_checks=("shrink", "size"),
+        longest_streak=("run_length", "max"),
+        shrink_units=("shrink", "sum"),
+        last_shrink=("check_time", "max"),
+    )
+    result = result[result["shrink_checks"] >= min_repeats]
+    result["checks"] = ordered.groupby("material_id").size().reindex(result.index)
+    result["shrink_frequency"] = result["shrink_checks"] / result["checks"]
+    result = result.reset_index().merge(materials, on="material_id", how="left")
+    return result.sort_values(["shrink_units", "longest_streak"], ascending=False, ignore_index=True)
+
+
+def counter_accuracy(checks, users):
+    """按盘点人（adjusted_by_user）统计准确率、平均绝对差异与偏差，按准确率升序"""
+    np, _ = _libs()
+    result = _aggregate(checks, "user_id")
+    result["accuracy"] = 1 - result["discrepancy_rate"]
+    finite = checks[np.isfinite(checks["rel_variance"].to_numpy())]
+    result["mean_abs_rel_variance"] = result["user_id"].map(
+        finite["rel_variance"].abs().groupby(finite["user_id"]).mean())
+    result["bias"] = result["net_variance"] / result["checks"]
+    result["materials"] = result["user_id"].map(checks.groupby("user_id")["material_id"].nunique())
+    result = result.merge(users, on="user_id", how="left")
+    return result.sort_values(["accuracy", "checks"], ascending=[True, False], ignore_index=True)
+
+
+def analyze(start=None, end=None, min_repeats=MIN_REPEATS, token=None):
+    """读取并分析 [start, end) 内的盘点记录
+
+    返回 {"summary": 汇总字典, "materials", "suppliers", "distribution", "offenders", "counters": DataFrame}。
+    """
+    np, _ = _libs()
+    load_start = time.perf_counter()
+    checks, materials, users = load_checks(start, end, token)
+    if checks.empty:
+        raise AnalyticsError("所选时间范围内没有盘点记录")
+    analyze_start = time.perf_counter()
+    if token is not None:
+        token.report(None, f"正在分析 {len(checks)} 条盘点记录...")
+
+    checks = _prepare(checks)
+    result = {
+        "materials": material_variance(checks, materials),
+        "suppliers": supplier_variance(checks, materials),
+        "distribution": variance_distribution(checks),
+        "offenders": repeat_offenders(checks, materials, min_repeats),
+        "counters": counter_accuracy(checks, users),
+    }
+
+    variance = checks["variance"].to_numpy()
+    recorded_units = int(checks["recorded"].sum())
+    shrink_units = int(checks["shrink"].sum())
+    result["summary"] = {
+        "start": checks["check_time"].min().to_pydatetime(),
+        "end": checks["check_time"].max().to_pydatetime(),
+        "checks": len(checks),
+        "materials": int(checks["material_id"].nunique()),
+        "counters": int(checks["user_id"].nunique()),
+        "variance_checks": int(checks["miss"].sum()),
+        "accuracy": float(1 - checks["miss"].mean()),
+        "net_variance": int(variance.sum()),
+        "shrink_units": shrink_units,
+        "gain_units": int(checks["gain"].sum()),
+        "shrinkage_rate": shrink_units / recorded_units if recorded_units else None,
+        "quantiles": {f"p{round(q * 100)}": float(v) for q, v in zip(QUANTILES, np.quantile(variance, QUANTILES))},
+        "repeat_offenders": len(result["offenders"]),
+        "load_seconds": round(analyze_start - load_start, 3),
+        "analyze_seconds": round(time.perf_counter() - analyze_start, 3),
+    }
+    return result
+
+
+# ---------- 导出 ----------
+
+SHEETS = (
+    ("materials", "物料差异", ("material_id", "material_name", "supplier", "checks", "variance_checks",
+                               "discrepancy_rate", "net_variance", "shrink_units", "gain_units",
+                               "recorded_units", "shrinkage_rate", "mean_abs_variance", "max_abs_variance",
+                               "last_check")),
+    ("suppliers", "供应商损耗", ("supplier", "materials", "checks", "variance_checks", "discrepancy_rate",
+                                 "net_variance", "shrink_units", "gain_units", "recorded_units", "shrinkage_rate")),
+    ("distribution", "差异分布", ("bucket", "checks", "share", "net_variance")),
+    ("offenders", "重复盘亏", ("material_id", "material_name", "supplier", "shrink_checks", "checks",
+                               "shrink_frequency", "longest_streak", "shrink_units", "last_shrink")),
+    ("counters", "盘点人准确率", ("user_id", "username", "checks", "materials", "accuracy",
+                                  "mean_abs_variance", "mean_abs_rel_variance", "bias", "net_variance",
+                                  "shrink_units")),
+)
+
+SUMMARY_LABELS = {
+    "start": "最早盘点", "end": "最近盘点", "checks": "盘点次数", "materials": "物料数", "counters": "盘点人数",
+    "variance_checks": "有差异次数", "accuracy": "准确率", "net_variance": "净差异", "shrink_units": "盘亏数量",
+    "gain_units": "盘盈数量", "shrinkage_rate": "损耗率", "repeat_offenders": "重复盘亏物料数",
+}
+
+
+def export_excel(result, path):
+    """每张结果表一个工作表，另加汇总表"""
+    _, pd = _libs()
+    summary = result["summary"]
+    rows = [(label, summary[key]) for key, label in SUMMARY_LABELS.items()]
+    rows += [(f"差异分位数 {name}", value) for name, value in summary["quantiles"].items()]
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame(rows, columns=["指标", "值"]).to_excel(writer, sheet_name="汇总", index=False)
+        for key, sheet, columns in SHEETS:
+            frame = result[key].reindex(columns=list(columns))
+            frame.rename(columns=COLUMN_LABELS).to_excel(writer, sheet_name=sheet, index=False)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="盘点差异与损耗分析")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="起始日期（含），如 2024-01-01")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="结束日期（不含）")
+    parser.add_argument("--min-repeats", type=int, default=MIN_REPEATS, help="列为重复盘亏的最少盘亏次数")
+    parser.add_argument("--output", help="导出 Excel 报表路径")
+    parser.add_argument("--limit", type=int, default=10, help="在终端列出的重复盘亏物料数")
+    args = parser.parse_args()
+
+    result = analyze(args.start, args.end, args.min_repeats)
+    if args.output:
+        export_excel(result, args.output)
+    print(json.dumps(result["summary"], ensure_ascii=False, default=_json_default), flush=True)
+    for row in result["offenders"].head(args.limit).itertuples(index=False):
+        print(f"  物料 {row.material_id:>8} {row.material_name}：盘亏 {row.shrink_checks} 次"
+              f"（最长连续 {row.longest_streak} 次），共 {row.shrink_units}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# variance_report_window.py
+# 盘点差异分析报表：物料 / 供应商损耗率、差异分布、重复盘亏物料、盘点人准确率，可导出多工作表 Excel
+
+import math
+from datetime import datetime, timedelta
+
+import customtkinter as ctk
+from tkinter import messagebox, filedialog
+
+import variance_analytics
+from variance_analytics import COLUMN_LABELS, RATE_COLUMNS, SHEETS
+from task_runner import run_in_background, BusyBar
+from virtual_table import VirtualTable
+
+PERIODS = {
+    "近 90 天": 90,
+    "近 1 年": 365,
+    "近 3 年": 365 * 3,
+    "全部": None,
+}
+
+TEXT_COLUMNS = ("material_name", "supplier", "username", "bucket")
+
+
+def _format(column, value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "—"
+    if column in RATE_COLUMNS:
+        return f"{value:.1%}"
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return value
+
+
+class VarianceReportWindow(ctk.CTkToplevel):
+    def __init__(self, master=None):
+        super().__init__(master)
+        self.title("📈 盘点差异分析")
+        self.geometry("1200x720")
+        self.result = None
+
+        # 条件
+        top_frame = ctk.CTkFrame(self, corner_radius=8)
+        top_frame.pack(fill="x", padx=15, pady=(15, 5))
+
+        ctk.CTkLabel(top_frame, text="时间范围：").pack(side="left", padx=(10, 0))
+        self.period_var = ctk.StringVar(value="近 1 年")
+        ctk.CTkOptionMenu(top_frame, values=list(PERIODS), variable=self.period_var,
+                          width=120).pack(side="left", padx=5, pady=8)
+        ctk.CTkLabel(top_frame, text="重复盘亏次数 ≥").pack(side="left", padx=(10, 0))
+        self.repeats_entry = ctk.CTkEntry(top_frame, width=60)
+        self.repeats_entry.insert(0, str(variance_analytics.MIN_REPEATS))
+        self.repeats_entry.pack(side="left", padx=5)
+        ctk.CTkButton(top_frame, text="📊 分析", width=100, command=self.run_analysis).pack(side="left", padx=10)
+        ctk.CTkButton(top_frame, text="📁 导出为 Excel", width=120,
+                      command=self.export_to_excel).pack(side="right", padx=10)
+
+        self.busy = BusyBar(self)
+        self.busy.pack(fill="x", padx=15)
+
+        self.summary_label = ctk.CTkLabel(self, text="选择时间范围后点击“分析”", anchor="w", justify="left")
+        self.summary_label.pack(fill="x", padx=20, pady=5)
+
+        # 每张结果表一页
+        self.tabs = ctk.CTkTabview(self)
+        self.tabs.pack(fill="both", expand=True, padx=15, pady=(0, 15))
+        self.tables = {}
+        for key, title, columns in SHEETS:
+            tab = self.tabs.add(title)
+            labels = [COLUMN_LABELS[c] for c in columns]
+            settings = {COLUMN_LABELS[c]: {"width": 240 if c == "material_name" else 110,
+                                           "anchor": "w" if c in TEXT_COLUMNS else "e"}
+                        for c in columns}
+            table = VirtualTable(tab, columns=labels, column_settings=settings)
+            table.pack(fill="both", expand=True)
+            self.tables[key] = (table, columns)
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.run_analysis()
+
+    def run_analysis(self):
+        try:
+            min_repeats = int(self.repeats_entry.get())
+            if min_repeats < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showwarning("提示", "重复盘亏次数必须为正整数", parent=self)
+            return
+        days = PERIODS[self.period_var.get()]
+        start = None if days is None else datetime.now() - timedelta(days=days)
+        specs = {key: columns for key, (_, columns) in self.tables.items()}
+
+        def work(token):
+            result = variance_analytics.analyze(start=start, min_repeats=min_repeats, token=token)
+            token.check()
+            # 在后台把 DataFrame 转成显示用的行，界面线程只负责填表
+            rows = {}
+            for key, columns in specs.items():
+                frame = result[key].reindex(columns=list(columns))
+                rows[key] = [[_format(c, v) for c, v in zip(columns, record)]
+                             for record in frame.itertuples(index=False, name=None)]
+            return result, rows
+
+        def show(outcome):
+            result, rows = outcome
+            self.result = result
+            for key, (table, _) in self.tables.items():
+                table.set_rows(rows[key])
+            self.show_summary(result["summary"])
+
+        def failed(error):
+            if isinstance(error, variance_analytics.AnalyticsError):
+                for table, _ in self.tables.values():
+                    table.clear()
+                self.result = None
+                self.summary_label.configure(text=str(error))
+            else:
+                messagebox.showerror("分析失败", str(error), parent=self)
+
+        run_in_background(self, "analyze", work, show, busy=self.busy, on_error=failed)
+
+    def show_summary(self, summary):
+        rate = summary["shrinkage_rate"]
+        self.summary_label.configure(text=(
+            f"{summary['start']:%Y-%m-%d} 至 {summary['end']:%Y-%m-%d}："
+            f"盘点 {summary['checks']} 次，物料 {summary['materials']} 个，盘点人 {summary['counters']} 位；"
+            f"准确率 {summary['accuracy']:.1%}，净差异 {summary['net_variance']}，"
+            f"盘亏 {summary['shrink_units']} / 盘盈 {summary['gain_units']}，"
+            f"损耗率 {'—' if rate is None else f'{rate:.2%}'}，重复盘亏物料 {summary['repeat_offenders']} 个"
+            f"（读取 {summary['load_seconds']}s，计算 {summary['analyze_seconds']}s）"
+        ))
+
+    def export_to_excel(self):
+        if self.result is None:
+            messagebox.showwarning("提示", "请先完成分析", parent=self)
+            return
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".xlsx",
+                                            filetypes=[("Excel 文件", "*.xlsx")])
+        if not path:
+            return
+        result = self.result
+        run_in_background(
+            self, "export", lambda token: variance_analytics.export_excel(result, path),
+            busy=self.busy, error_title="导出失败",
+            on_success=lambda _: messagebox.showinfo("导出成功", f"已保存到：{path}", parent=self)
+        )
+
+    def on_close(self):
+        self.busy.cancel()
+        self.destroy()
@@ -0,0 +1,193 @@
+# virtual_table.py
+import customtkinter as ctk
+from tkinter import ttk
+
+import ui_profiler
+
+
+class VirtualTable(ctk.CTkFrame):
+    """虚拟化表格：全部数据保存在后台列表中，Treeview 只保留可见的几十行并在滚动时原地改写
+
+    无论数据有多少行，Tk 中的条目数量都只和窗口高度有关，百万行数据也能流畅滚动。
+    """
+
+    def __init__(self, master, columns, column_settings=None, on_scroll_end=None,
+                 selectmode="browse", **kwargs):
+        kwargs.setdefault("fg_color", "transparent")
+        super().__init__(master, **kwargs)
+        self.columns = tuple(columns)
+        self.on_scroll_end = on_scroll_end
+
+        self._rows = []
+        self._offset = 0          # 第一行可见数据在 _rows 中的下标
+        self._slots = 1           # 可见行数
+        self._iids = []           # 当前挂在 Treeview 上的条目
+        self._selected = None     # 选中行在 _rows 中的下标
+        self._syncing_selection = False
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show="headings", selectmode=selectmode)
+        column_settings = column_settings or {}
+        for col in self.columns:
+            self.tree.heading(col, text=col)
+            if col in column_settings:
+                self.tree.column(col, **column_settings[col])
+
+        self.vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.hsb = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=self.hsb.set)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vsb.grid(row=0, column=1, sticky="ns")
+        self.hsb.grid(row=1, column=0, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._scroll_by(-self._slots))
+        self.tree.bind("<Next>", lambda e: self._scroll_by(self._slots))
+
+    # ---------- 数据 ----------
+
+    @property
+    def rows(self):
+        return self._rows
+
+    def set_rows(self, rows):
+        """替换全部数据并回到顶部；传入 list 时直接作为后台存储，不做复制"""
+        self._rows = rows if isinstance(rows, list) else list(rows)
+        self._offset = 0
+        self._selected = None
+        self._render()
+
+    def append_rows(self, rows):
+        """在末尾追加数据，保持当前滚动位置"""
+        self._rows.extend(rows)
+        self._render()
+
+    def clear(self):
+        self.set_rows([])
+
+    def refresh(self):
+        """后台列表被原地修改（如改写某几行）后重绘可见行，保持滚动位置和选中行"""
+        if self._selected is not None and self._selected >= len(self._rows):
+            self._selected = None
+        self._render()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def selected_index(self):
+        """选中行在全部数据中的下标，没有选中返回 None"""
+        return self._selected
+
+    def selected_row(self):
+        return None if self._selected is None else self._rows[self._selected]
+
+    # ---------- 渲染 ----------
+
+    def _max_offset(self):
+        return max(0, len(self._rows) - self._slots)
+
+    def _render(self):
+        with ui_profiler.span("VirtualTable._render", "widget", rows=len(self._rows)):
+            self._render_slots()
+
+    def _render_slots(self):
+        self._offset = min(max(0, self._offset), self._max_offset())
+        count = min(self._slots, len(self._rows) - self._offset)
+
+        # 只增删到需要的条目数量，其余条目原地改写
+        while len(self._iids) < count:
+            self._iids.append(self.tree.insert("", "end"))
+        if len(self._iids) > count:
+            self.tree.delete(*self._iids[count:])
+            del self._iids[count:]
+
+        rows = self._rows
+        offset = self._offset
+        for slot, iid in enumerate(self._iids):
+            self.tree.item(iid, values=rows[offset + slot])
+
+        self._sync_selection()
+        self._update_scrollbar()
+
+    def _sync_selection(self):
+        self._syncing_selection = True
+        try:
+            slot = None if self._selected is None else self._selected - self._offset
+            if slot is not None and 0 <= slot < len(self._iids):
+                self.tree.selection_set(self._iids[slot])
+                self.tree.focus(self._iids[slot])
+            elif self.tree.selection():
+                self.tree.selection_remove(*self.tree.selection())
+        finally:
+            self._syncing_selection = False
+
+    def _update_scrollbar(self):
+        total = len(self._rows)
+        if total <= self._slots:
+            self.vsb.set(0.0, 1.0)
+        else:
+            self.vsb.set(self._offset / total, (self._offset + self._slots) / total)
+
+    # ---------- 事件 ----------
+
+    def _on_resize(self, event):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        slots = max(1, (event.height - rowheight - 4) // rowheight)
+        if slots != self._slots:
+            self._slots = slots
+            self._render()
+
+    def _on_select(self, event):
+        if self._syncing_selection:
+            return
+        # 选中行滚出可见区域时 Treeview 上没有选中项，但仍保留原选中下标
+        selection = self.tree.selection()
+        if selection and selection[0] in self._iids:
+            self._selected = self._offset + self._iids.index(selection[0])
+
+    def _scroll_to(self, offset):
+        offset = min(max(0, int(offset)), self._max_offset())
+        if offset != self._offset:
+            self._offset = offset
+            self._render()
+        if self.on_scroll_end and self._rows and self._offset >= self._max_offset():
+            self.on_scroll_end()
+        return "break"
+
+    def _scroll_by(self, delta):
+        return self._scroll_to(self._offset + delta)
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(value) * len(self._rows))
+        elif action == "scroll":
+            step = self._slots if unit == "pages" else 1
+            self._scroll_by(int(value) * step)
+
+    def _on_mousewheel(self, event):
+        # Windows 下 delta 为 120 的倍数，macOS 下为较小的整数
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_by(-3 * delta)
+
+    def _move_selection(self, step):
+        if not self._rows:
+            return "break"
+        index = 0 if self._selected is None else min(max(0, self._selected + step), len(self._rows) - 1)
+        self._selected = index
+        if index < self._offset:
+            self._offset = index
+        elif index >= self._offset + self._slots:
+            self._offset = index - self._slots + 1
+        self._render()
+        self.tree.event_generate("<<TreeviewSelect>>")
+        if self.on_scroll_end and self._offset >= self._max_offset():
+            self.on_scroll_end()
+        return "break"
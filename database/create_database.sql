@@ -17,7 +17,8 @@ CREATE TABLE Material (
     supplier NVARCHAR(100),
     unit NVARCHAR(20),
     max_quantity INT NOT NULL,
-    min_quantity INT NOT NULL
+    min_quantity INT NOT NULL,
+    note NVARCHAR(255)
 );
 
 -- 库存表
@@ -77,3 +78,10 @@ CREATE TABLE Report (
     generated_time DATETIME DEFAULT GETDATE(),
     FOREIGN KEY (material_id) REFERENCES Material(material_id)
 );
+
+-- 月结结账记录（每月一行，last_record_id 为结账时已汇总到的最大出入库记录 ID）
+CREATE TABLE ReportClose (
+    month NVARCHAR(7) PRIMARY KEY,
+    last_record_id INT NOT NULL,
+    closed_time DATETIME DEFAULT GETDATE()
+);
@@ -0,0 +1,87 @@
+-- SQLite 版本的建表脚本，仅用于本地运行与性能测试
+-- 与 create_database.sql 保持相同的表结构
+
+-- 用户表
+CREATE TABLE IF NOT EXISTS Users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username NVARCHAR(50) NOT NULL UNIQUE,
+    password NVARCHAR(100) NOT NULL,
+    role NVARCHAR(20) NOT NULL,
+    permission_level INT NOT NULL
+);
+
+-- 物料表
+CREATE TABLE IF NOT EXISTS Material (
+    material_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    material_name NVARCHAR(100) NOT NULL,
+    supplier NVARCHAR(100),
+    unit NVARCHAR(20),
+    max_quantity INT NOT NULL,
+    min_quantity INT NOT NULL,
+    note NVARCHAR(255)
+);
+
+-- 库存表
+CREATE TABLE IF NOT EXISTS Inventory (
+    inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    material_id INT NOT NULL,
+    current_quantity INT NOT NULL,
+    last_updated DATETIME DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (material_id) REFERENCES Material(material_id)
+);
+
+-- 出入库记录表
+CREATE TABLE IF NOT EXISTS InOutRecord (
+    record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    material_id INT NOT NULL,
+    user_id INT NOT NULL,
+    type NVARCHAR(10) CHECK (type IN ('入库', '出库')),
+    quantity INT NOT NULL,
+    timestamp DATETIME DEFAULT (datetime('now', 'localtime')),
+    note NVARCHAR(255),
+    FOREIGN KEY (material_id) REFERENCES Material(material_id),
+    FOREIGN KEY (user_id) REFERENCES Users(user_id)
+);
+
+-- 盘点记录表
+CREATE TABLE IF NOT EXISTS InventoryCheck (
+    check_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    material_id INT NOT NULL,
+    real_quantity INT NOT NULL,
+    recorded_quantity INT NOT NULL,
+    adjusted_by_user INT NOT NULL,
+    check_time DATETIME DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (material_id) REFERENCES Material(material_id),
+    FOREIGN KEY (adjusted_by_user) REFERENCES Users(user_id)
+);
+
+-- 库存预警表
+CREATE TABLE IF NOT EXISTS Alert (
+    alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    material_id INT NOT NULL,
+    alert_type NVARCHAR(20) CHECK (alert_type IN ('库存过低', '库存过高')),
+    current_quantity INT NOT NULL,
+    generated_time DATETIME DEFAULT (datetime('now', 'localtime')),
+    is_resolved BIT DEFAULT 0,
+    FOREIGN KEY (material_id) REFERENCES Material(material_id)
+);
+
+-- 月结报表表
+CREATE TABLE IF NOT EXISTS Report (
+    report_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    month NVARCHAR(7), -- 如 '2025-05'
+    material_id INT NOT NULL,
+    initial_quantity INT NOT NULL,
+    in_quantity INT NOT NULL,
+    out_quantity INT NOT NULL,
+    final_quantity INT NOT NULL,
+    generated_time DATETIME DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (material_id) REFERENCES Material(material_id)
+);
+
+-- 月结结账记录（每月一行，last_record_id 为结账时已汇总到的最大出入库记录 ID）
+CREATE TABLE IF NOT EXISTS ReportClose (
+    month NVARCHAR(7) PRIMARY KEY,
+    last_record_id INT NOT NULL,
+    closed_time DATETIME DEFAULT (datetime('now', 'localtime'))
+);